@@ -0,0 +1,154 @@
+from typing import Any, Dict, List, Tuple, Type, TypeVar
+from uuid import UUID
+
+from fastapi import (
+    APIRouter,
+    Depends,
+)
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.postgresql import get_postgresql
+from src.schemas.bulk import (
+    BulkCreate,
+    BulkItemResult,
+    BulkResult,
+    OrderStatusBulk,
+    OrderStatusItem,
+)
+from src.schemas.delivery import DeliveryCreate
+from src.schemas.order import OrderCreate
+from src.services.crud.delivery import DeliveryService, get_delivery_service
+from src.services.crud.order import orderService, get_order_service
+
+
+# Пакетные операции: пути вида /v1/<service>:bulk, поэтому router подключается с префиксом /v1
+router = APIRouter()
+
+SchemaType = TypeVar('SchemaType', bound=BaseModel)
+
+
+def validate_items(
+    schema: Type[SchemaType], items: List[Dict[str, Any]], results: List[BulkItemResult]
+) -> List[Tuple[int, SchemaType]]:
+    """Validate batch items one by one, collecting errors per item
+
+    Args:
+        schema (Type[SchemaType]): schema of one item
+        items (List[Dict[str, Any]]): raw batch items
+        results (List[BulkItemResult]): results per item, filled with validation errors
+
+    Returns:
+        List[Tuple[int, SchemaType]]: positions and parsed values of the valid items
+    """
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.parse_obj(item)))
+        except ValidationError as e:
+            results[index].errors = e.errors()
+    return valid
+
+
+def bulk_result(results: List[BulkItemResult]) -> BulkResult:
+    failed = sum(1 for result in results if result.errors)
+    return BulkResult(succeeded=len(results) - failed, failed=failed, items=results)
+
+
+@router.post("/order:bulk", response_model=BulkResult)
+async def create_orders_bulk(
+    *,
+    bulk_in: BulkCreate,
+    db: AsyncSession = Depends(get_postgresql),
+    service: orderService = Depends(get_order_service),
+) -> BulkResult:
+    """Create Orders in one transaction
+
+    Args:  
+        bulk_in (BulkCreate): Orders to create  
+
+    Returns:  
+        BulkResult: ID or validation errors per item, items with errors are not created
+    """
+    results = [BulkItemResult(index=index) for index in range(len(bulk_in.items))]
+    valid = validate_items(OrderCreate, bulk_in.items, results)
+
+    order_ids = await service.create_many(db, objs_in=[obj_in for _, obj_in in valid])
+    for (index, _), order_id in zip(valid, order_ids):
+        results[index].id = order_id
+
+    return bulk_result(results)
+
+
+@router.post("/delivery:bulk", response_model=BulkResult)
+async def create_deliveries_bulk(
+    *,
+    bulk_in: BulkCreate,
+    db: AsyncSession = Depends(get_postgresql),
+    service: DeliveryService = Depends(get_delivery_service),
+) -> BulkResult:
+    """Create Deliveries in one transaction
+
+    Args:  
+        bulk_in (BulkCreate): Deliveries to create  
+
+    Returns:  
+        BulkResult: ID or errors per item, items with errors or unknown
+        order or zone are not created
+    """
+    results = [BulkItemResult(index=index) for index in range(len(bulk_in.items))]
+    valid = validate_items(DeliveryCreate, bulk_in.items, results)
+
+    missing = await service.missing_references(db, objs_in=[obj_in for _, obj_in in valid])
+    for (index, _), fields in zip(valid, missing):
+        if fields:
+            results[index].errors = [
+                {'loc': [field], 'msg': 'referenced object not found', 'type': 'value_error.not_found'}
+                for field in fields
+            ]
+    valid = [(index, obj_in) for (index, obj_in), fields in zip(valid, missing) if not fields]
+
+    delivery_ids = await service.create_many(db, objs_in=[obj_in for _, obj_in in valid])
+    for (index, _), delivery_id in zip(valid, delivery_ids):
+        results[index].id = delivery_id
+
+    return bulk_result(results)
+
+
+@router.post("/order/status:bulk", response_model=BulkResult)
+async def update_orders_status_bulk(
+    *,
+    bulk_in: OrderStatusBulk,
+    db: AsyncSession = Depends(get_postgresql),
+    service: orderService = Depends(get_order_service),
+) -> BulkResult:
+    """Set statuses of Orders in one transaction
+
+    Args:  
+        bulk_in (OrderStatusBulk): Order IDs with new statuses and the author of the change  
+
+    Returns:  
+        BulkResult: ID or errors per item, orders already in the status are left unchanged
+    """
+    results = [BulkItemResult(index=index) for index in range(len(bulk_in.items))]
+    statuses: Dict[UUID, Any] = {}
+    positions: Dict[UUID, int] = {}
+    for index, item in validate_items(OrderStatusItem, bulk_in.items, results):
+        if item.id in statuses:
+            results[index].errors = [
+                {'loc': ['id'], 'msg': 'duplicate order in the batch', 'type': 'value_error.duplicate'}
+            ]
+            continue
+        statuses[item.id] = item.status
+        positions[item.id] = index
+
+    found = await service.update_status_many(db, statuses=statuses, updated_by=bulk_in.updated_by)
+    for order_id, index in positions.items():
+        if order_id in found:
+            results[index].id = order_id
+        else:
+            results[index].errors = [
+                {'loc': ['id'], 'msg': 'order not found', 'type': 'value_error.not_found'}
+            ]
+
+    return bulk_result(results)
@@ -0,0 +1,229 @@
+from datetime import date
+from typing import Iterator, List, Optional
+from uuid import UUID
+from http import HTTPStatus
+
+import orjson
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+)
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config.app_settings import AppSettings
+from src.db.postgresql import get_postgresql, get_postgresql_read
+from src.schemas.courier import (
+    CourierDistance,
+    CourierPing,
+    CourierPosition,
+    CourierPositionUpdate,
+    CourierRoute,
+    CourierTrackPoint,
+    PositionsIngested,
+)
+from src.services.crud.assignment import AssignmentService, get_assignment_service
+from src.services.crud.route import RouteService, get_route_service
+from src.services.crud.tracking import TrackingService, get_tracking_service
+
+
+app_config = AppSettings()
+
+# Объект router, в котором регистрируем обработчики
+router = APIRouter()
+
+
+class PingParser:
+    """ Разбор NDJSON-потока позиций с подсчётом отброшенных строк """
+
+    def __init__(self):
+        self.rejected = 0
+
+    def parse(self, lines: List[bytes]) -> Iterator[CourierPing]:
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield CourierPing.parse_obj(orjson.loads(line))     # pylint: disable=no-member
+            except (orjson.JSONDecodeError, ValidationError):     # pylint: disable=no-member
+                self.rejected += 1
+
+
+@router.get("/nearest", response_model=List[CourierDistance])
+async def nearest_couriers(
+    *,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(app_config.geo.courier_candidates, gt=0, le=100),
+    service: AssignmentService = Depends(get_assignment_service),
+) -> List[CourierDistance]:
+    """Find nearest available couriers in the zone of the point
+
+    Args:  
+        lat (float): delivery latitude  
+        lon (float): delivery longitude  
+        k (int): number of couriers  
+
+    Returns:  
+        List[CourierDistance]: couriers ordered by distance
+    """
+    return await service.nearest(latitude=lat, longitude=lon, k=k)
+
+
+@router.post("/positions", response_model=PositionsIngested)
+async def ingest_positions(
+    *,
+    request: Request,
+    service: TrackingService = Depends(get_tracking_service),
+) -> PositionsIngested:
+    """Accept a stream of courier positions
+
+    Body is NDJSON (`application/x-ndjson`), one `CourierPing` per line.
+    Positions are applied as the body arrives and written to the database in batches.
+
+    Returns:  
+        PositionsIngested: numbers of accepted and rejected lines
+    """
+    parser = PingParser()
+    accepted = 0
+    tail = b''
+    async for chunk in request.stream():
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        accepted += await service.ingest(parser.parse(lines))
+    accepted += await service.ingest(parser.parse([tail]))
+
+    return PositionsIngested(accepted=accepted, rejected=parser.rejected)
+
+
+@router.websocket("/ws")
+async def positions_websocket(
+    websocket: WebSocket,
+    service: TrackingService = Depends(get_tracking_service),
+):
+    """Accept courier positions over a WebSocket, one or more NDJSON lines per message"""
+    await websocket.accept()
+    parser = PingParser()
+    while True:
+        message = await websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            break
+        data = message.get('bytes') or (message.get('text') or '').encode()
+        await service.ingest(parser.parse(data.split(b'\n')))
+
+
+@router.get("/{courier_id}/position", response_model=CourierTrackPoint)
+async def get_courier_position(
+    *,
+    courier_id: UUID,
+    service: TrackingService = Depends(get_tracking_service),
+) -> CourierTrackPoint:
+    """Get the latest courier position
+
+    Args:  
+        courier_id (UUID): Courier ID  
+
+    Returns:  
+        CourierTrackPoint: latest position
+    """
+    position = await service.latest(courier_id)
+    if not position:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Courier position not found')
+
+    return position
+
+
+@router.get("/{courier_id}/track", response_model=List[CourierTrackPoint])
+async def get_courier_track(
+    *,
+    courier_id: UUID,
+    service: TrackingService = Depends(get_tracking_service),
+) -> List[CourierTrackPoint]:
+    """Get recent courier positions kept in memory
+
+    Args:  
+        courier_id (UUID): Courier ID  
+
+    Returns:  
+        List[CourierTrackPoint]: positions from the oldest to the newest
+    """
+    return await service.track(courier_id)
+
+
+@router.get("/{courier_id}/route", response_model=CourierRoute)
+async def get_courier_route(
+    *,
+    courier_id: UUID,
+    delivery_date: date = Query(...),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    db: AsyncSession = Depends(get_postgresql_read),
+    service: RouteService = Depends(get_route_service),
+) -> CourierRoute:
+    """Get courier deliveries of the day in visiting order
+
+    Args:  
+        courier_id (UUID): Courier ID  
+        delivery_date (date): day of the deliveries  
+        lat (float, optional): start point latitude, the last known courier position by default  
+        lon (float, optional): start point longitude  
+
+    Returns:  
+        CourierRoute: deliveries in visiting order with leg distances
+    """
+    return await service.sequence(
+        db, courier_id=courier_id, delivery_date=delivery_date, latitude=lat, longitude=lon
+    )
+
+
+@router.put("/{courier_id}/position", response_model=CourierPosition)
+async def update_courier_position(
+    *,
+    courier_id: UUID,
+    position_in: CourierPositionUpdate,
+    service: AssignmentService = Depends(get_assignment_service),
+) -> CourierPosition:
+    """Update courier position and availability
+
+    Args:  
+        courier_id (UUID): Courier ID  
+        position_in (CourierPositionUpdate): body request  
+
+    Returns:  
+        CourierPosition: courier state
+    """
+    return await service.update_position(
+        courier_id,
+        latitude=position_in.latitude,
+        longitude=position_in.longitude,
+        available=position_in.available,
+    )
+
+
+@router.post("/{courier_id}/release", response_model=CourierPosition)
+async def release_courier(
+    *,
+    courier_id: UUID,
+    db: AsyncSession = Depends(get_postgresql),
+    service: AssignmentService = Depends(get_assignment_service),
+) -> CourierPosition:
+    """Release the courier reservation
+
+    Args:  
+        courier_id (UUID): Courier ID  
+
+    Returns:  
+        CourierPosition: courier state
+    """
+    if not await service.release(db, courier_id):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Courier reservation not found')
+
+    courier = service.positions.get(courier_id)
+    if not courier:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Courier not found')
+
+    return courier
@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Union
 from uuid import UUID
 from http import HTTPStatus
 
@@ -6,17 +7,22 @@ from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.core.modules import Page
-from src.db.postgresql import get_postgresql
+from src.core.filters import DeliveryFilter
+from src.core.modules import Page, encode_cursor
+from src.db.postgresql import get_postgresql, get_postgresql_read
+from src.schemas.pagination import PageMeta, Paginated
 from src.schemas.delivery import (
     Delivery,
     DeliveryCreate,
     DeliveryUpdate,
 )
+from src.schemas.history import DeliveryVersion, VersionDiff
 from src.services.crud.delivery import DeliveryService, get_delivery_service
+from src.services.crud.history import HistoryService, get_delivery_history_service
 
 
 # Объект router, в котором регистрируем обработчики
@@ -27,7 +33,7 @@ router = APIRouter()
 async def get_delivery(
     *,
     delivery_id: UUID,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql_read),
     service: DeliveryService = Depends(get_delivery_service),
 ) -> Optional[Delivery]:
     """Get delivery by ID
@@ -45,33 +51,124 @@ async def get_delivery(
     return delivery     
 
 
-@router.get("/", response_model=List[Delivery])
+@router.get("/{delivery_id}/as-of", response_model=DeliveryVersion)
+async def get_delivery_as_of(
+    *,
+    delivery_id: UUID,
+    at: datetime = Query(..., description='Момент времени в UTC'),
+    db: AsyncSession = Depends(get_postgresql_read),
+    history: HistoryService = Depends(get_delivery_history_service),
+) -> DeliveryVersion:
+    """Get the delivery version that was current at the moment
+
+    Args:  
+        delivery_id (UUID): delivery ID  
+        at (datetime): moment in UTC  
+
+    Returns:  
+        DeliveryVersion: delivery data as of the moment, `valid_to` - when it was replaced
+    """
+    version = await history.as_of(db, item_id=delivery_id, at=at)
+    if not version:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Delivery did not exist at the moment')
+
+    return version      # type: ignore
+
+
+@router.get("/{delivery_id}/versions", response_model=List[DeliveryVersion])
+async def list_delivery_versions(
+    *,
+    delivery_id: UUID,
+    from_version: int = Query(1, gt=0),
+    to_version: Optional[int] = Query(None, gt=0, description='Последняя версия, по умолчанию - текущая'),
+    db: AsyncSession = Depends(get_postgresql_read),
+    history: HistoryService = Depends(get_delivery_history_service),
+) -> List[DeliveryVersion]:
+    """Get delivery versions in the range
+
+    Args:  
+        delivery_id (UUID): delivery ID  
+        from_version (int, optional): first version  
+        to_version (int, optional): last version  
+
+    Returns:  
+        List[DeliveryVersion]: versions ordered by number, the current one has no `valid_to`
+    """
+    if to_version is not None and to_version < from_version:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='empty version range')
+
+    versions = await history.versions(db, item_id=delivery_id, from_version=from_version, to_version=to_version)
+    if not versions:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Delivery versions not found')
+
+    return versions     # type: ignore
+
+
+@router.get("/{delivery_id}/diff", response_model=VersionDiff)
+async def diff_delivery_versions(
+    *,
+    delivery_id: UUID,
+    from_version: int = Query(..., gt=0),
+    to_version: int = Query(..., gt=0),
+    db: AsyncSession = Depends(get_postgresql_read),
+    history: HistoryService = Depends(get_delivery_history_service),
+) -> VersionDiff:
+    """Compare two delivery versions
+
+    Args:  
+        delivery_id (UUID): delivery ID  
+        from_version (int): old version  
+        to_version (int): new version  
+
+    Returns:  
+        VersionDiff: fields with different values, old and new
+    """
+    diff = await history.diff(db, item_id=delivery_id, from_version=from_version, to_version=to_version)
+    if not diff:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Delivery version not found')
+
+    return diff
+
+
+@router.get("/", response_model=Union[List[Delivery], Paginated[Delivery]])
 async def list_deliveries(
     *,
     page: Page = Depends(),
-    db: Session = Depends(get_postgresql),
+    filters: DeliveryFilter = Depends(),
+    db: AsyncSession = Depends(get_postgresql_read),
     service: DeliveryService = Depends(get_delivery_service),
-) -> Optional[List[Delivery]]:
+) -> Union[List[Delivery], Paginated[Delivery]]:
     """Get deliveries list
 
     Args:  
-        page (Page, optional): page size and page limits  
+        page (Page, optional): page size and page number, or `page[after]` cursor  
+        filters (DeliveryFilter, optional): order and zone of the delivery  
 
     Returns:  
-        Optional[List[Delivery]]: List of Deliverys
+        Union[List[Delivery], Paginated[Delivery]]: List of Deliverys, or a page
+        with the next cursor in `meta.next` when `page[after]` is passed and the number
+        of matching objects in `meta.total` when `page[total]=true`
     """
-    Deliverys = await service.list(db, skip=page.number, limit=page.size)
-    if not Deliverys:
-        return []
+    cursor = None
+    if page.keyset:
+        Deliverys, cursor = await service.list_after(db, after=page.cursor, limit=page.size, filters=filters)
+    else:
+        Deliverys = await service.list(db, skip=page.number, limit=page.size, filters=filters)
+    if not page.envelope:
+        return Deliverys      # type: ignore
 
-    return Deliverys      # type: ignore
+    meta = PageMeta(next=encode_cursor(cursor) if cursor else None)
+    if page.total:
+        # Большие выборки не считаются целиком: total_estimated=true - оценка планировщика
+        meta.total, meta.total_estimated = await service.count(db, filters=filters)
+    return Paginated[Delivery](data=Deliverys, meta=meta)
 
 
 @router.post("/", response_model=Delivery)
 async def create_delivery(
     *,
     delivery_in: DeliveryCreate,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: DeliveryService = Depends(get_delivery_service),
 ) -> Delivery:
     """Create a new Delivery
@@ -91,7 +188,7 @@ async def update_delivery(
     *,
     delivery_id: UUID,
     delivery_in: DeliveryUpdate,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: DeliveryService = Depends(get_delivery_service),
 ) -> Optional[Delivery]:
     """Update Delivery
@@ -102,18 +199,18 @@ async def update_delivery(
     Returns:
         Optional[Delivery]: Delivery full data
     """
-    delivery = await service.get(db, item_id=delivery_id)
+    delivery = await service.update_by_id(db, item_id=delivery_id, obj_in=delivery_in)
     if not delivery:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Delivery not found')
 
-    return await service.update(db, db_obj=delivery, obj_in=delivery_in)
+    return delivery
 
 
 @router.delete("/{delivery_id}", response_model=Delivery)
 async def delete_Delivery(
     *,
     delivery_id: UUID,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: DeliveryService = Depends(get_delivery_service),
 ) -> Delivery:
     """Delete a Delivery
@@ -124,8 +221,8 @@ async def delete_Delivery(
     Returns:
         Delivery: Delivery full data
     """
-    delivery = await service.get(db, item_id=delivery_id)
+    delivery = await service.remove(db, item_id=delivery_id)
     if not delivery:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='delivery not found')
 
-    return await service.remove(db, item_id=delivery_id)
+    return delivery
@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Union
 from uuid import UUID
 from http import HTTPStatus
 
@@ -6,17 +7,26 @@ from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
 )
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.core.modules import Page
-from src.db.postgresql import get_postgresql
+from src.core.exceptions import CourierNotAvailable
+from src.core.filters import OrderFilter
+from src.core.modules import Page, encode_cursor
+from src.db.postgresql import get_postgresql, get_postgresql_read
+from src.schemas.pagination import PageMeta, Paginated
 from src.schemas.order import (
     Order,
     OrderFull,
     OrderCreate,
     OrderUpdate,
 )
+from src.schemas.courier import OrderAssign, OrderAssignment
+from src.schemas.history import OrderVersion, VersionDiff
+from src.services.crud.assignment import AssignmentService, get_assignment_service
+from src.services.crud.history import HistoryService, get_order_history_service
 from src.services.crud.order import orderService, get_order_service
 
 
@@ -24,11 +34,63 @@ from src.services.crud.order import orderService, get_order_service
 router = APIRouter()
 
 
+@router.get("/full", response_model=Union[List[OrderFull], Paginated[OrderFull]])
+async def list_orders_full(
+    *,
+    page: Page = Depends(),
+    filters: OrderFilter = Depends(),
+    db: AsyncSession = Depends(get_postgresql_read),
+    service: orderService = Depends(get_order_service),
+) -> Union[List[OrderFull], Paginated[OrderFull]]:
+    """Get Orders list with delivery and zone
+
+    Args:  
+        page (Page, optional): page size and page number, or `page[after]` cursor  
+        filters (OrderFilter, optional): customer, courier, zone, statuses and delivery date range  
+
+    Returns:  
+        Union[List[OrderFull], Paginated[OrderFull]]: List of Orders loaded in one query, or a page
+        with the next cursor in `meta.next` when `page[after]` is passed and the number
+        of matching objects in `meta.total` when `page[total]=true`
+    """
+    cursor = None
+    if page.keyset:
+        orders, cursor = await service.list_after(db, after=page.cursor, limit=page.size, full=True, filters=filters)
+    else:
+        orders = await service.list(db, skip=page.number, limit=page.size, full=True, filters=filters)
+    if not page.envelope:
+        return orders      # type: ignore
+
+    meta = PageMeta(next=encode_cursor(cursor) if cursor else None)
+    if page.total:
+        # Большие выборки не считаются целиком: total_estimated=true - оценка планировщика
+        meta.total, meta.total_estimated = await service.count(db, filters=filters)
+    return Paginated[OrderFull](data=orders, meta=meta)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_orders(
+    *,
+    filters: OrderFilter = Depends(),
+    db: AsyncSession = Depends(get_postgresql_read),
+    service: orderService = Depends(get_order_service),
+) -> StreamingResponse:
+    """Export Orders as NDJSON
+
+    Args:  
+        filters (OrderFilter, optional): customer, courier, zone, statuses and delivery date range  
+
+    Returns:  
+        StreamingResponse: one Order with its `zone_id` per line, ordered by delivery date
+    """
+    return StreamingResponse(service.export(db, filters=filters), media_type='application/x-ndjson')
+
+
 @router.get("/{order_id}", response_model=OrderFull)
 async def get_order(
     *,
     order_id: UUID,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql_read),
     service: orderService = Depends(get_order_service),
 ) -> Optional[OrderFull]:
     """Get Order by ID
@@ -46,33 +108,124 @@ async def get_order(
     return order     
 
 
-@router.get("/", response_model=List[Order])
+@router.get("/{order_id}/as-of", response_model=OrderVersion)
+async def get_order_as_of(
+    *,
+    order_id: UUID,
+    at: datetime = Query(..., description='Момент времени в UTC'),
+    db: AsyncSession = Depends(get_postgresql_read),
+    history: HistoryService = Depends(get_order_history_service),
+) -> OrderVersion:
+    """Get the order version that was current at the moment
+
+    Args:  
+        order_id (UUID): order ID  
+        at (datetime): moment in UTC  
+
+    Returns:  
+        OrderVersion: order data as of the moment, `valid_to` - when it was replaced
+    """
+    version = await history.as_of(db, item_id=order_id, at=at)
+    if not version:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order did not exist at the moment')
+
+    return version      # type: ignore
+
+
+@router.get("/{order_id}/versions", response_model=List[OrderVersion])
+async def list_order_versions(
+    *,
+    order_id: UUID,
+    from_version: int = Query(1, gt=0),
+    to_version: Optional[int] = Query(None, gt=0, description='Последняя версия, по умолчанию - текущая'),
+    db: AsyncSession = Depends(get_postgresql_read),
+    history: HistoryService = Depends(get_order_history_service),
+) -> List[OrderVersion]:
+    """Get order versions in the range
+
+    Args:  
+        order_id (UUID): order ID  
+        from_version (int, optional): first version  
+        to_version (int, optional): last version  
+
+    Returns:  
+        List[OrderVersion]: versions ordered by number, the current one has no `valid_to`
+    """
+    if to_version is not None and to_version < from_version:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='empty version range')
+
+    versions = await history.versions(db, item_id=order_id, from_version=from_version, to_version=to_version)
+    if not versions:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order versions not found')
+
+    return versions     # type: ignore
+
+
+@router.get("/{order_id}/diff", response_model=VersionDiff)
+async def diff_order_versions(
+    *,
+    order_id: UUID,
+    from_version: int = Query(..., gt=0),
+    to_version: int = Query(..., gt=0),
+    db: AsyncSession = Depends(get_postgresql_read),
+    history: HistoryService = Depends(get_order_history_service),
+) -> VersionDiff:
+    """Compare two order versions
+
+    Args:  
+        order_id (UUID): order ID  
+        from_version (int): old version  
+        to_version (int): new version  
+
+    Returns:  
+        VersionDiff: fields with different values, old and new
+    """
+    diff = await history.diff(db, item_id=order_id, from_version=from_version, to_version=to_version)
+    if not diff:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order version not found')
+
+    return diff
+
+
+@router.get("/", response_model=Union[List[Order], Paginated[Order]])
 async def list_orders(
     *,
     page: Page = Depends(),
-    db: Session = Depends(get_postgresql),
+    filters: OrderFilter = Depends(),
+    db: AsyncSession = Depends(get_postgresql_read),
     service: orderService = Depends(get_order_service),
-) -> Optional[List[Order]]:
+) -> Union[List[Order], Paginated[Order]]:
     """Get Orders list
 
     Args:  
-        page (Page, optional): page size and page limits  
+        page (Page, optional): page size and page number, or `page[after]` cursor  
+        filters (OrderFilter, optional): customer, courier, zone, statuses and delivery date range  
 
     Returns:  
-        Optional[List[Order]]: List of Orders
+        Union[List[Order], Paginated[Order]]: List of Orders, or a page
+        with the next cursor in `meta.next` when `page[after]` is passed and the number
+        of matching objects in `meta.total` when `page[total]=true`
     """
-    orders = await service.list(db, skip=page.number, limit=page.size)
-    if not orders:
-        return []
+    cursor = None
+    if page.keyset:
+        orders, cursor = await service.list_after(db, after=page.cursor, limit=page.size, filters=filters)
+    else:
+        orders = await service.list(db, skip=page.number, limit=page.size, filters=filters)
+    if not page.envelope:
+        return orders      # type: ignore
 
-    return orders      # type: ignore
+    meta = PageMeta(next=encode_cursor(cursor) if cursor else None)
+    if page.total:
+        # Большие выборки не считаются целиком: total_estimated=true - оценка планировщика
+        meta.total, meta.total_estimated = await service.count(db, filters=filters)
+    return Paginated[Order](data=orders, meta=meta)
 
 
 @router.post("/", response_model=OrderFull)
 async def create_order(
     *,
     order_in: OrderCreate,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: orderService = Depends(get_order_service),
 ) -> OrderFull:
     """Create a new Order
@@ -87,12 +240,40 @@ async def create_order(
     return await service.create(db, obj_in=order_in)
 
 
+@router.post("/{order_id}/assign", response_model=OrderAssignment)
+async def assign_order(
+    *,
+    order_id: UUID,
+    assign_in: OrderAssign,
+    db: AsyncSession = Depends(get_postgresql),
+    service: orderService = Depends(get_order_service),
+    assignment: AssignmentService = Depends(get_assignment_service),
+) -> OrderAssignment:
+    """Assign the nearest available courier to the Order
+
+    Args:
+        order_id (UUID): Order ID  
+        assign_in (OrderAssign): body request
+
+    Returns:
+        OrderAssignment: assigned courier and other candidates
+    """
+    order = await service.get(db, item_id=order_id)
+    if not order:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order not found')
+
+    try:
+        return await assignment.assign(db, order=order, updated_by=assign_in.updated_by)
+    except CourierNotAvailable as error:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=error.message)
+
+
 @router.put("/{order_id}", response_model=OrderFull)
 async def update_order(
     *,
     order_id: UUID,
     order_in: OrderUpdate,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: orderService = Depends(get_order_service),
 ) -> Optional[OrderFull]:
     """Update Order
@@ -103,18 +284,18 @@ async def update_order(
     Returns:
         Optional[OrderFull]: Order full data
     """
-    order = await service.get(db, item_id=order_id)
+    order = await service.update_by_id(db, item_id=order_id, obj_in=order_in)
     if not order:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order not found')
 
-    return await service.update(db, db_obj=order, obj_in=order_in)
+    return order
 
 
 @router.delete("/{order_id}", response_model=OrderFull)
 async def delete_Order(
     *,
     order_id: UUID,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: orderService = Depends(get_order_service),
 ) -> OrderFull:
     """Delete a Order
@@ -125,8 +306,8 @@ async def delete_Order(
     Returns:
         OrderFull: Order full data
     """
-    order = await service.get(db, item_id=order_id)
+    order = await service.remove(db, item_id=order_id)
     if not order:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order not found')
 
-    return await service.remove(db, item_id=order_id)
+    return order
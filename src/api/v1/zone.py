@@ -1,33 +1,149 @@
-from typing import List, Optional
+from typing import Iterator, List, Optional, Union
 from uuid import UUID
 from http import HTTPStatus
 
+import numpy as np
+import orjson
+
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
 )
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.core.modules import Page
-from src.db.postgresql import get_postgresql
+from src.core.config.app_settings import AppSettings
+from src.core.exceptions import ZoneOverlapError
+from src.core.modules import Page, encode_cursor
+from src.db.postgresql import get_postgresql, get_postgresql_read
+from src.schemas.pagination import PageMeta, Paginated
 from src.schemas.zone import (
     Zone,
     ZoneCreate,
     ZoneUpdate,
+    ZoneLocation,
+    ZoneLocateBatch,
+    ZoneDistance,
+    ZoneNeighbour,
 )
 from src.services.crud.zone import ZoneService, get_zone_service
+from src.services.geo.zone_index import get_zone_index
+
 
+app_config = AppSettings()
 
 # Объект router, в котором регистрируем обработчики
 router = APIRouter()
 
 
+def stream_zone_ids(service: ZoneService, points: np.ndarray) -> Iterator[bytes]:
+    """ Resolve points chunk by chunk and emit them as a single JSON array """
+    chunk = app_config.geo.zone_locate_batch_chunk
+    yield b'['
+    for start in range(0, len(points), chunk):
+        if start:
+            yield b','
+        # Отрезаем скобки массива, чтобы склеить куски в один JSON-массив
+        yield orjson.dumps(service.locate_many(points[start:start + chunk]))[1:-1]    # pylint: disable=no-member
+    yield b']'
+
+
+@router.get("/locate", response_model=ZoneLocation)
+async def locate_zone(
+    *,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    db: AsyncSession = Depends(get_postgresql_read),
+    service: ZoneService = Depends(get_zone_service),
+) -> ZoneLocation:
+    """Find the delivery zone containing the point
+
+    Args:  
+        lat (float): point latitude  
+        lon (float): point longitude  
+
+    Returns:  
+        ZoneLocation: zone ID and requested point
+    """
+    zone_id = await service.locate(latitude=lat, longitude=lon, db=db)
+    if not zone_id:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Zone not found')
+
+    return ZoneLocation(zone_id=zone_id, latitude=lat, longitude=lon)
+
+
+@router.post("/locate:batch", response_model=List[Optional[UUID]])
+async def locate_zones_batch(
+    *,
+    batch_in: ZoneLocateBatch,
+    service: ZoneService = Depends(get_zone_service),
+) -> StreamingResponse:
+    """Find delivery zones for a batch of points
+
+    Args:  
+        batch_in (ZoneLocateBatch): list of `[lat, lon]` pairs  
+
+    Returns:  
+        StreamingResponse: JSON array of zone IDs (`null` for points outside
+        all zones) in the order of the input points
+    """
+    if not get_zone_index().ready:
+        # Пакет слишком велик для поиска запросами к БД, пока индекс не загружен
+        raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail='Zone index is not loaded yet')
+
+    points = np.asarray(batch_in.points, dtype=np.float64).reshape(-1, 2)
+
+    return StreamingResponse(stream_zone_ids(service, points), media_type='application/json')
+
+
+@router.get("/nearest", response_model=List[ZoneDistance])
+async def nearest_zones(
+    *,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(app_config.geo.zone_nearest_radius, gt=0),
+    limit: int = Query(5, gt=0, le=100),
+    db: AsyncSession = Depends(get_postgresql_read),
+    service: ZoneService = Depends(get_zone_service),
+) -> List[ZoneDistance]:
+    """Find zones near the point
+
+    Args:  
+        lat (float): point latitude  
+        lon (float): point longitude  
+        radius (float): search radius in meters  
+        limit (int): maximum number of zones  
+
+    Returns:  
+        List[ZoneDistance]: zones ordered by distance to the point
+    """
+    return await service.find_nearest(db, latitude=lat, longitude=lon, radius=radius, limit=limit)
+
+
+@router.get("/{zone_id}/neighbours", response_model=List[ZoneNeighbour])
+async def zone_neighbours(
+    *,
+    zone_id: UUID,
+    service: ZoneService = Depends(get_zone_service),
+) -> List[ZoneNeighbour]:
+    """Get zones adjacent to or overlapping the zone
+
+    Args:  
+        zone_id (UUID): zone ID  
+
+    Returns:  
+        List[ZoneNeighbour]: related zones
+    """
+    return await service.neighbours(zone_id)
+
+
 @router.get("/{zone_id}", response_model=Zone)
 async def get_order(
     *,
     zone_id: UUID,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql_read),
     service: ZoneService = Depends(get_zone_service),
 ) -> Optional[Zone]:
     """Get Order by ID
@@ -45,33 +161,43 @@ async def get_order(
     return zone     
 
 
-@router.get("/", response_model=List[Zone])
+@router.get("/", response_model=Union[List[Zone], Paginated[Zone]])
 async def list_orders(
     *,
     page: Page = Depends(),
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql_read),
     service: ZoneService = Depends(get_zone_service),
-) -> Optional[List[Zone]]:
+) -> Union[List[Zone], Paginated[Zone]]:
     """Get Orders list
 
     Args:  
-        page (Page, optional): page size and page limits  
+        page (Page, optional): page size and page number, or `page[after]` cursor  
 
     Returns:  
-        Optional[List[Order]]: List of Orders
+        Union[List[Zone], Paginated[Zone]]: List of Orders, or a page
+        with the next cursor in `meta.next` when `page[after]` is passed and the number
+        of zones in `meta.total` when `page[total]=true`
     """
-    zones = await service.list(db, skip=page.number, limit=page.size)
-    if not zones:
-        return []
+    cursor = None
+    if page.keyset:
+        zones, cursor = await service.list_after(db, after=page.cursor, limit=page.size)
+    else:
+        zones = await service.list(db, skip=page.number, limit=page.size)
+    if not page.envelope:
+        return zones      # type: ignore
 
-    return zones      # type: ignore
+    meta = PageMeta(next=encode_cursor(cursor) if cursor else None)
+    if page.total:
+        # Большие выборки не считаются целиком: total_estimated=true - оценка планировщика
+        meta.total, meta.total_estimated = await service.count(db)
+    return Paginated[Zone](data=zones, meta=meta)
 
 
 @router.post("/", response_model=Zone)
 async def create_order(
     *,
     zone_in: ZoneCreate,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: ZoneService = Depends(get_zone_service),
 ) -> Zone:
     """Create a new Order
@@ -83,7 +209,10 @@ async def create_order(
         Zone: Order full data
     """
 
-    return await service.create(db, obj_in=zone_in)
+    try:
+        return await service.create(db, obj_in=zone_in)
+    except ZoneOverlapError as error:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=error.message)
 
 
 @router.put("/{zone_id}", response_model=Zone)
@@ -91,7 +220,7 @@ async def update_order(
     *,
     zone_id: UUID,
     zone_in: ZoneUpdate,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: ZoneService = Depends(get_zone_service),
 ) -> Optional[Zone]:
     """Update Order
@@ -102,18 +231,22 @@ async def update_order(
     Returns:
         Optional[Zone]: Order full data
     """
-    zone = await service.get(db, item_id=zone_id)
+    try:
+        zone = await service.update_by_id(db, item_id=zone_id, obj_in=zone_in)
+    except ZoneOverlapError as error:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=error.message)
+
     if not zone:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order not found')
 
-    return await service.update(db, db_obj=zone, obj_in=zone_in)
+    return zone
 
 
 @router.delete("/{zone_id}", response_model=Zone)
 async def delete_Order(
     *,
     zone_id: UUID,
-    db: Session = Depends(get_postgresql),
+    db: AsyncSession = Depends(get_postgresql),
     service: ZoneService = Depends(get_zone_service),
 ) -> Zone:
     """Delete a Order
@@ -124,8 +257,8 @@ async def delete_Order(
     Returns:
         Zone: Order full data
     """
-    zone = await service.get(db, item_id=zone_id)
+    zone = await service.remove(db, item_id=zone_id)
     if not zone:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Order not found')
 
-    return await service.remove(db, item_id=zone_id)
+    return zone
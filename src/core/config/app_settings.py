@@ -1,6 +1,7 @@
 from pydantic import BaseSettings, Field
 
 from src.core.config.database_settings import DBSettings
+from src.core.config.geo_settings import GeoSettings
 from src.core.config.redis_settings import RedisSettings
 
 
@@ -10,6 +11,7 @@ class AppSettings(BaseSettings):
 
     db: DBSettings = Field(default_factory=DBSettings)
     redis_db: RedisSettings = Field(default_factory=RedisSettings)
+    geo: GeoSettings = Field(default_factory=GeoSettings)
 
 
 # Функция понадобится при внедрении зависимостей
@@ -1,11 +1,66 @@
+from typing import List, Literal, Optional
 from pydantic import (
     BaseSettings,
     PostgresDsn,
 )
 
 
+def to_async_dsn(dsn: str) -> str:
+    return f"postgresql+asyncpg://{dsn.split('://', 1)[1]}"
+
+
 class DBSettings(BaseSettings):
     pg_dsn: PostgresDsn
+    # Строка подключения для SQLAlchemy AsyncEngine с драйвером asyncpg
+    async_dsn: Optional[str]
+
+    # Пул соединений одного воркера
+    pool_size: int = 5
+    pool_max_overflow: int = 10
+    # Сколько секунд ждать свободное соединение
+    pool_timeout: float = 30.0
+    # Проверять соединение перед выдачей из пула
+    pool_pre_ping: bool = False
+    # Пересоздавать соединения старше pool_recycle секунд, -1 - не пересоздавать
+    pool_recycle: int = -1
+
+    # Реплики для чтения, JSON-список: DATABASE_REPLICA_DSNS='["postgresql://...", ...]'
+    replica_dsns: List[PostgresDsn] = []
+    # Как часто проверять доступность и отставание реплик, секунды
+    replica_check_interval: float = 1.0
+    # Реплика, отставшая от primary больше чем на столько байт WAL, не получает запросы
+    replica_max_lag_bytes: int = 16 * 1024 * 1024
+
+    # meta.total: до стольких строк считается точно, выше - оценка планировщика
+    count_exact_threshold: int = 10_000
+    # Сколько секунд хранится посчитанный total для одного набора фильтров
+    count_cache_ttl: float = 10.0
+
+    # Сколько месячных секций истории создаётся вперёд от текущего месяца
+    history_partitions_ahead: int = 3
+    # sync - строки истории пишутся в транзакции изменения,
+    # outbox - в транзакции пишется запись в history_outbox, историю из неё строит воркер
+    history_mode: Literal['sync', 'outbox'] = 'sync'
+    # Записей history_outbox в одной транзакции воркера
+    history_outbox_batch_size: int = 10_000
+    # Пауза воркера в секундах, когда history_outbox пуст
+    history_outbox_interval: float = 1.0
+    # Строки истории старше стольких дней переносятся в архив
+    history_retention_days: int = 365
+    # Каталог сжатого архива истории, из него же читает API истории
+    history_archive_dir: str = 'history_archive'
+    # Строк истории в одном файле архива и одной транзакции переноса
+    history_archive_batch_size: int = 50_000
+    # Строк в одном сжатом блоке файла архива
+    history_archive_block_rows: int = 1_000
+
+    def __init__(self, **data):
+        super(DBSettings, self).__init__(**data)
+        self.async_dsn = to_async_dsn(self.pg_dsn)
+
+    @property
+    def replica_async_dsns(self) -> List[str]:
+        return [to_async_dsn(dsn) for dsn in self.replica_dsns]
 
     class Config:
         env_prefix = 'DATABASE_'
@@ -0,0 +1,34 @@
+from typing import Literal
+
+from pydantic import BaseSettings
+
+
+class GeoSettings(BaseSettings):
+    # Размер ячейки сетки пространственного индекса зон, в градусах
+    zone_index_cell_size: float = 0.05
+    # Как часто процесс сверяет свой индекс зон с zone_state.generation, в секундах
+    zone_refresh_interval: float = 1.0
+    # Сколько точек пакетного запроса разрешается за один шаг при потоковой выдаче
+    zone_locate_batch_chunk: int = 10_000
+    # Радиус поиска ближайших зон по умолчанию, в метрах
+    zone_nearest_radius: float = 5_000
+    # Допуск упрощения полигона зоны для отрисовки на карте, в градусах (~10 м)
+    zone_simplify_tolerance: float = 0.0001
+    # Что делать с пересекающимися зонами при записи: reject - отклонять, record - сохранять связь
+    zone_overlap_policy: Literal['reject', 'record'] = 'reject'
+    # Зоны, границы которых ближе допуска, считаются соседними, в метрах
+    zone_adjacency_tolerance: float = 20.0
+    # Сколько ближайших свободных курьеров возвращать при назначении
+    courier_candidates: int = 5
+    # Как часто процесс подтягивает резервирования и позиции курьеров, записанные другими процессами, в секундах
+    courier_refresh_interval: float = 1.0
+    # Время на улучшение маршрута курьера методом 2-opt, в секундах
+    route_time_budget: float = 0.2
+    # Сколько последних позиций курьера хранить в памяти
+    courier_track_size: int = 32
+    # Позиции пишутся в БД пачкой при накоплении flush_size строк или раз в flush_interval секунд
+    position_flush_size: int = 5_000
+    position_flush_interval: float = 2.0
+
+    class Config:
+        env_prefix = 'GEO_'
@@ -14,3 +14,29 @@ class TicketStatusNotAllowed(Error):
         self.expression = expression
         self.message = message
         super().__init__(self.message)
+
+
+class CourierNotAvailable(Error):
+    """Exception raised when no courier can be assigned to an order.
+
+        Attributes:
+            expression -- input expression in which the error occurred
+            message -- explanation of the error
+        """
+    def __init__(self, expression, message):
+        self.expression = expression
+        self.message = message
+        super().__init__(self.message)
+
+
+class ZoneOverlapError(Error):
+    """Exception raised when a zone overlaps existing zones.
+
+        Attributes:
+            expression -- input expression in which the error occurred
+            message -- explanation of the error
+        """
+    def __init__(self, expression, message):
+        self.expression = expression
+        self.message = message
+        super().__init__(self.message)
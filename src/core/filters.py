@@ -0,0 +1,43 @@
+from datetime import datetime
+from http import HTTPStatus
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Query
+
+from src.models.order import OrderStatus
+
+
+# Параметры фильтрации списка заказов, фильтр выполняется в SQL по индексам
+class OrderFilter:
+    def __init__(
+            self,
+            customer_id: Optional[UUID] = None,
+            courier_id: Optional[UUID] = None,
+            zone_id: Optional[UUID] = Query(None, description='Зона доставки заказа'),
+            status: Optional[List[OrderStatus]] = Query(None, description='Статусы заказа, параметр можно повторять'),
+            active: Optional[bool] = Query(None, description='true - только заказы в статусе, отличном от `delivered`'),
+            date_from: Optional[datetime] = Query(None, alias='delivery_date[gte]'),
+            date_to: Optional[datetime] = Query(None, alias='delivery_date[lt]'),
+    ):
+        if date_from is not None and date_to is not None and date_from >= date_to:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='empty delivery date range')
+
+        self.customer_id = customer_id
+        self.courier_id = courier_id
+        self.zone_id = zone_id
+        self.status = status
+        self.active = active
+        self.date_from = date_from
+        self.date_to = date_to
+
+
+# Параметры фильтрации списка доставок
+class DeliveryFilter:
+    def __init__(
+            self,
+            order_id: Optional[UUID] = None,
+            zone_id: Optional[UUID] = None,
+    ):
+        self.order_id = order_id
+        self.zone_id = zone_id
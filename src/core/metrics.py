@@ -0,0 +1,22 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Время ожидания соединения из пула PostgreSQL, включая открытие нового соединения
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'db_pool_checkout_seconds',
+    'Time spent waiting for a PostgreSQL connection from the pool',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# Куда направлены сессии чтения: replica или primary
+DB_READ_SESSIONS = Counter(
+    'db_read_sessions_total',
+    'Read-only database sessions by target',
+    ['target'],
+)
+
+# Число реплик, которые сейчас получают запросы
+DB_HEALTHY_REPLICAS = Gauge(
+    'db_healthy_replicas',
+    'PostgreSQL read replicas passing the health check',
+)
@@ -1,7 +1,13 @@
+import base64
+import binascii
 import json
 import pickle
+from datetime import datetime
+from http import HTTPStatus
+from uuid import UUID
 
-from fastapi import Query
+import orjson
+from fastapi import HTTPException, Query
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import (
@@ -9,6 +15,7 @@ from typing import (
     Optional,
     List,
     Dict,
+    Tuple,
     Any,
 )
 
@@ -19,17 +26,67 @@ from src.core.config.app_settings import AppSettings
 app_config = AppSettings()
 ModelType = TypeVar("ModelType", bound=Base)
 SchemaType = TypeVar("SchemaType", bound=BaseModel)
+# Позиция курсора: (created_at, id) последнего объекта страницы
+Cursor = Tuple[datetime, UUID]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """
+    Pack the position of the last item into an opaque page[after] value
+    :param cursor: created_at and id of the last item on the page
+    :return: url-safe cursor string
+    """
+    created_at, item_id = cursor
+    data = orjson.dumps([created_at.isoformat(), str(item_id)])     # pylint: disable=no-member
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(value: str) -> Cursor:
+    """
+    Unpack a page[after] value
+    :param value: cursor string from the previous page
+    :return: created_at and id of the last item of the previous page
+    """
+    try:
+        created_at, item_id = orjson.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))  # pylint: disable=no-member
+        return datetime.fromisoformat(created_at), UUID(item_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='Invalid page[after] cursor')
 
 
 # Класс для параметров страницы: число объектов и номер страницы
+# или курсор page[after] для постраничного обхода по ключу (created_at, id)
 class Page:
     def __init__(
             self,
             size: int = Query(10, alias='page[size]', gt=0, le=100),
             number: int = Query(0, alias='page[number]', gt=0),
+            after: Optional[str] = Query(
+                None,
+                alias='page[after]',
+                description='Курсор из meta.next предыдущей страницы, пустое значение - первая страница',
+            ),
+            total: bool = Query(
+                False,
+                alias='page[total]',
+                description='Добавить в meta число объектов; для больших выборок - оценка',
+            ),
     ):
         self.size = size
         self.number = number
+        self.after = after
+        self.total = total
+        self.cursor: Optional[Cursor] = decode_cursor(after) if after else None
+
+    @property
+    def keyset(self) -> bool:
+        # Режим курсора включается любым page[after], в том числе пустым
+        return self.after is not None
+
+    @property
+    def envelope(self) -> bool:
+        # Ответ в виде {data, meta}: для курсора или запрошенного total
+        return self.keyset or self.total
 
 
 async def prepare_list_items_to_cache(objs: List[SchemaType]):
@@ -1,24 +1,202 @@
-from typing import Optional
-from databases import Database
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+import asyncio
+import itertools
+import logging
+import time
+from typing import AsyncIterator, List, Optional
 
 from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.core.config.app_settings import AppSettings
+from src.core.metrics import DB_HEALTHY_REPLICAS, DB_POOL_CHECKOUT_SECONDS, DB_READ_SESSIONS
 
 
 app_config = AppSettings()
-database: Optional[Database] = None
+logger = logging.getLogger(__name__)
+
+# Заголовок с позицией WAL primary после записи; клиент передаёт его в следующих
+# запросах на чтение, чтобы увидеть свою запись
+CONSISTENCY_HEADER = 'X-Consistency-Token'
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """ Пул соединений, замеряющий время ожидания соединения """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+def make_engine(dsn: str) -> AsyncEngine:
+    return create_async_engine(
+        dsn,
+        poolclass=TimedQueuePool,
+        pool_size=app_config.db.pool_size,
+        max_overflow=app_config.db.pool_max_overflow,
+        pool_timeout=app_config.db.pool_timeout,
+        pool_pre_ping=app_config.db.pool_pre_ping,
+        pool_recycle=app_config.db.pool_recycle,
+    )
+
+
+def make_sessionmaker(bind: AsyncEngine) -> sessionmaker:
+    # Объекты не истекают после commit: иначе обращение к атрибутам
+    # при сериализации ответа потребует неявного синхронного запроса к БД
+    return sessionmaker(bind, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+
+
+engine = make_engine(app_config.db.async_dsn)
+SessionLocal = make_sessionmaker(engine)
+
+
+def parse_lsn(value: Optional[str]) -> int:
+    """ WAL position like `16/B374D848` as a number, 0 for a missing or malformed value """
+    try:
+        high, low = (value or '').split('/')
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return 0
+
+
+# Позиция вставки WAL после COMMIT не меньше конца записи о фиксации транзакции
+COMMIT_LSN_SQL = 'SELECT pg_current_wal_insert_lsn()::text'
+
+
+def track_commit_lsn(session, state) -> None:
+    """ Store the WAL position after each commit of the session in `state.commit_lsn`
+
+    The position is read on the connection of the committed transaction before it
+    goes back to the pool. A failed read is logged and leaves the previous value:
+    the write is already committed and the response must not fail.
+
+    Args:
+        session (Session): sync session of an AsyncSession
+        state: object receiving the `commit_lsn` attribute, e.g. `request.state`
+    """
+    connections = []
+
+    def after_begin(session, transaction, connection):
+        connections.append(connection)
+
+    def after_commit(session):
+        try:
+            for connection in connections:
+                state.commit_lsn = connection.exec_driver_sql(COMMIT_LSN_SQL).scalar()
+        except Exception:       # pylint: disable=broad-except
+            logger.warning('Failed to read the WAL position after commit', exc_info=True)
+        finally:
+            connections.clear()
 
-engine = create_engine(app_config.db.pg_dsn)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-db_session = scoped_session(SessionLocal)
+    event.listen(session, 'after_begin', after_begin)
+    event.listen(session, 'after_commit', after_commit)
+    event.listen(session, 'after_rollback', lambda session: connections.clear())
+
+
+async def current_lsn() -> str:
+    """ Current WAL position of the primary, the consistency token of the last write """
+    async with engine.connect() as connection:
+        return (await connection.execute(text('SELECT pg_current_wal_lsn()::text'))).scalar()
+
+
+class Replica:
+    """ Реплика для чтения: свой пул соединений и последнее известное состояние """
+
+    def __init__(self, dsn: str):
+        self.engine = make_engine(dsn)
+        self.session = make_sessionmaker(self.engine)
+        self.healthy = False
+        # Позиция WAL, воспроизведённая репликой на момент последней проверки
+        self.replayed = 0
+
+
+class ReplicaSet:
+    """ Реплики для чтения с выбором по кругу.
+        Фоновая проверка отмечает недоступные и отставшие реплики; запрос с токеном
+        согласованности получает только реплику, которая уже воспроизвела его позицию WAL.
+    """
+
+    def __init__(self, dsns: List[str], max_lag_bytes: int):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.max_lag_bytes = max_lag_bytes
+        self._turn = itertools.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self, min_lsn: int = 0) -> Optional[Replica]:
+        """Next healthy replica that has replayed the WAL position
+
+        Args:
+            min_lsn (int): WAL position the read must observe
+
+        Returns:
+            Optional[Replica]: replica or None if the read must go to the primary
+        """
+        candidates = [replica for replica in self.replicas if replica.healthy and replica.replayed >= min_lsn]
+        if not candidates:
+            return None
+        return candidates[next(self._turn) % len(candidates)]
+
+    async def _check(self, replica: Replica, primary_lsn: int) -> None:
+        try:
+            async with replica.engine.connect() as connection:
+                replayed = (await connection.execute(text('SELECT pg_last_wal_replay_lsn()::text'))).scalar()
+        except Exception:       # pylint: disable=broad-except
+            if replica.healthy:
+                logger.warning('replica %s is unavailable', replica.engine.url.host, exc_info=True)
+            replica.healthy = False
+            return
+
+        replica.replayed = parse_lsn(replayed)
+        replica.healthy = replayed is not None and primary_lsn - replica.replayed <= self.max_lag_bytes
+
+    async def check(self) -> None:
+        """ Refresh availability and replayed WAL position of all replicas """
+        try:
+            primary_lsn = parse_lsn(await current_lsn())
+        except Exception:       # pylint: disable=broad-except
+            # Без primary отставание не измерить, реплики проверяются только на доступность
+            logger.warning('primary is unavailable for the replica lag check', exc_info=True)
+            primary_lsn = 0
+        await asyncio.gather(*(self._check(replica, primary_lsn) for replica in self.replicas))
+        DB_HEALTHY_REPLICAS.set(sum(replica.healthy for replica in self.replicas))
+
+    async def run_checker(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replicas = ReplicaSet(app_config.db.replica_async_dsns, app_config.db.replica_max_lag_bytes)
 
 Base = declarative_base()
 
 
-# Функция понадобится при внедрении зависимостей
-def get_postgresql(request: Request) -> Request:
-    return request.state.db
+# Сессия выдаётся только обработчикам, которые её запрашивают,
+# соединение берётся из пула при первом запросе к БД
+async def get_postgresql(request: Request) -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as db:
+        if replicas:
+            # Ответ на запрос с записью получит токен согласованности
+            track_commit_lsn(db.sync_session, request.state)
+        yield db
+
+
+# Сессия для обработчиков только на чтение: реплика по кругу или primary,
+# если реплик нет или ни одна ещё не видит запись из токена согласованности
+async def get_postgresql_read(request: Request) -> AsyncIterator[AsyncSession]:
+    replica = replicas.choose(parse_lsn(request.headers.get(CONSISTENCY_HEADER))) if replicas else None
+    DB_READ_SESSIONS.labels(target='replica' if replica else 'primary').inc()
+    async with (replica.session if replica else SessionLocal)() as db:
+        yield db
@@ -1,21 +1,26 @@
+import asyncio
 import logging
-import databases
 import uvicorn
 
 from logging import config as logging_config
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, Request
 from fastapi.responses import ORJSONResponse
+from prometheus_client import make_asgi_app
 
 from src.core import logger
 from src.core.config.app_settings import AppSettings
 from src.db import postgresql
-from src.api.v1 import delivery, order, zone
+from src.api.v1 import bulk, courier, delivery, order, zone
+from src.services.crud.assignment import get_assignment_service
+from src.services.crud.tracking import get_tracking_service
+from src.services.crud.zone import get_zone_service
 
 # Применяем настройки логирования
 logging_config.dictConfig(logger.LOGGING)
 
 # Настройки приложения
 app_config = AppSettings()
+background_tasks = []
 
 
 app = FastAPI(
@@ -31,30 +36,70 @@ app = FastAPI(
 )
 
 
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    response = Response("Internal server error", status_code=500)
-    try:
-        request.state.db = postgresql.SessionLocal()
-        response = await call_next(request)
-    finally:
-        request.state.db.close()
-    return response
-
-
 @app.on_event('startup')
 async def startup():
     # Подключаемся к базам при старте сервера
     # Подключиться можем при работающем event-loop
     # Поэтому логика подключения происходит в асинхронной функции
 
-    postgresql.database = await databases.Database(app_config.db.pg_dsn).connect()
+    # Реплики проверяются до первого запроса, затем в фоне
+    if postgresql.replicas:
+        await postgresql.replicas.check()
+        background_tasks.append(asyncio.create_task(
+            postgresql.replicas.run_checker(app_config.db.replica_check_interval)
+        ))
+
+    # Строим пространственный индекс зон в памяти процесса
+    try:
+        async with postgresql.SessionLocal() as db:
+            await get_zone_service().rebuild_index(db)
+    except Exception:       # pylint: disable=broad-except
+        # Индекс построит фоновая проверка, пока точки ищутся запросом к БД
+        logging.getLogger(__name__).exception('Failed to build the zone index')
+    # Зоны, изменённые другими процессами и загрузчиком, подхватываются по zone_state.generation
+    background_tasks.append(asyncio.create_task(
+        get_zone_service().run_refresher(app_config.geo.zone_refresh_interval)
+    ))
+
+    # Резервирования курьеров восстанавливаются из БД; позиции других процессов читаются с конца таблицы
+    try:
+        async with postgresql.SessionLocal() as db:
+            await get_assignment_service().load_reservations(db)
+            await get_tracking_service().load_positions(db)
+    except Exception:       # pylint: disable=broad-except
+        logging.getLogger(__name__).exception('Failed to load courier reservations and positions')
+    background_tasks.append(asyncio.create_task(
+        get_assignment_service().run_refresher(app_config.geo.courier_refresh_interval)
+    ))
+    background_tasks.append(asyncio.create_task(
+        get_tracking_service().run_refresher(app_config.geo.courier_refresh_interval)
+    ))
+
+    # Фоновая запись GPS-позиций курьеров пачками
+    background_tasks.append(asyncio.create_task(get_tracking_service().run_flusher()))
 
 
 @app.on_event('shutdown')
 async def shutdown():
     # Отключаемся от баз при выключении сервера
-    await postgresql.database.disconnect()
+    for task in background_tasks:
+        task.cancel()
+    await get_tracking_service().flush()
+
+    await postgresql.engine.dispose()
+    await postgresql.replicas.dispose()
+
+
+@app.middleware('http')
+async def consistency_token(request: Request, call_next):
+    # После записи клиент получает позицию WAL primary; с этим токеном чтение
+    # попадёт только на реплику, которая уже видит запись, иначе на primary
+    response = await call_next(request)
+    # Позиция прочитана в транзакции записи, здесь запросов к БД нет
+    commit_lsn = getattr(request.state, 'commit_lsn', None)
+    if commit_lsn:
+        response.headers[postgresql.CONSISTENCY_HEADER] = commit_lsn
+    return response
 
 
 # Подключаем роутер к серверу, указав префикс /v1/<service>
@@ -62,6 +107,12 @@ async def shutdown():
 app.include_router(delivery.router, prefix='/v1/delivery', tags=['delivery'])
 app.include_router(order.router, prefix='/v1/order', tags=['order'])
 app.include_router(zone.router, prefix='/v1/zone', tags=['zone'])
+app.include_router(courier.router, prefix='/v1/courier', tags=['courier'])
+# Пакетные операции имеют пути /v1/<service>:bulk
+app.include_router(bulk.router, prefix='/v1', tags=['bulk'])
+
+# Метрики Prometheus, в том числе время ожидания соединения из пула
+app.mount('/metrics', make_asgi_app())
 
 
 if __name__ == '__main__':
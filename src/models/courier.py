@@ -0,0 +1,48 @@
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    text,
+)
+
+from src.db.postgresql import Base
+
+
+class CourierPosition(Base):
+    """ Модель хранит историю GPS-позиций курьеров """
+
+    __tablename__ = 'courier_positions'
+    __table_args__ = (
+        Index('ix_courier_positions_courier_id_recorded_at', 'courier_id', 'recorded_at'),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    courier_id = Column(UUID(as_uuid=True), nullable=False)
+    zone_id = Column(UUID(as_uuid=True), nullable=True)
+    recorded_at = Column(DateTime, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<CourierPosition {self.courier_id} {self.recorded_at}>"
+
+
+class CourierReservation(Base):
+    """ Курьер, зарезервированный под заказ сервисом назначения.
+        Первичный ключ по курьеру делает резервирование атомарным между процессами API:
+        второй INSERT того же курьера не проходит. Строка удаляется при освобождении курьера,
+        доставке заказа и вместе с заказом.
+    """
+
+    __tablename__ = 'courier_reservations'
+
+    courier_id = Column(UUID(as_uuid=True), primary_key=True)
+    order_id = Column(UUID(as_uuid=True), ForeignKey('orders.id', ondelete='CASCADE'), nullable=False, unique=True)
+    created_at = Column(DateTime, nullable=False, server_default=text('now()'))
+
+    def __repr__(self) -> str:
+        return f"<CourierReservation {self.courier_id} {self.order_id}>"
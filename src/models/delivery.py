@@ -1,8 +1,10 @@
 from sqlalchemy.sql.schema import ForeignKey
+from sqlalchemy.ext.declarative import declared_attr
 
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy import (
     Column,
+    Index,
     Float,
 )
 
@@ -14,14 +16,25 @@ from src.models.history_meta import Versioned
 class DeliveryMixin(TimestampMixin, AuditMixin):
     """ Delivery base model """
 
-    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id"), onupdate="CASCADE")
-    zone_id = Column(UUID(as_uuid=True), ForeignKey("zones.id"), onupdate="CASCADE")
+    @declared_attr
+    def order_id(cls):          # pylint: disable=no-self-argument
+        return Column(UUID(as_uuid=True), ForeignKey("orders.id"))
+
+    @declared_attr
+    def zone_id(cls):           # pylint: disable=no-self-argument
+        return Column(UUID(as_uuid=True), ForeignKey("zones.id"))
     longitude = Column(Float, nullable=False)
     latitude = Column(Float, nullable=False)
 
 
 class Delivery(Versioned, Base, BaseMixin, DeliveryMixin):
     """ Модель хранит информацию о доставке  """    
+    # Ключ постраничного обхода по курсору и индексы фильтров списка
+    __table_args__ = (
+        Index('ix_deliverys_created_at_id', 'created_at', 'id'),
+        Index('ix_deliverys_order_id', 'order_id'),
+        Index('ix_deliverys_zone_id_created_at_id', 'zone_id', 'created_at', 'id'),
+    )
 
     def __repr__(self) -> str:
         return f"<Delivery {self.id}>"
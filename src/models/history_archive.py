@@ -0,0 +1,329 @@
+"""Retention of the history tables with a compressed archive on local disk.
+
+History rows older than the retention period are moved out of
+``orders_history`` and ``deliverys_history`` in large batches. Every batch
+becomes two files in ``<archive dir>/<history table>/``:
+
+* ``<batch>.ndjson.gz`` - rows as NDJSON sorted by (id, version), split into
+  blocks; each block is a separate gzip member, so it can be read on its
+  own and the whole file is still a regular gzip stream;
+* ``<batch>.index.json`` - the first and last id, offset and length of each
+  block, the range of ``changed`` of the batch and a Bloom filter of its ids,
+  so a lookup of an object that is not in the batch reads no blocks.
+
+The rows are deleted in the same transaction, after both files are written
+and synced to disk. A batch interrupted between the two steps is written
+again on the next run; readers drop duplicate versions. Emptied partitions
+older than the retention period are dropped.
+
+Usage::
+
+    python -m src.models.history_archive --older-than-days 365
+"""
+
+import argparse
+import base64
+import bisect
+import gzip
+import hashlib
+import logging
+import math
+import os
+import sys
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+from sqlalchemy import DateTime, Enum, create_engine, delete, select, text, tuple_
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.engine import Engine
+
+from src.core.config.database_settings import DBSettings
+from src.models import order, delivery      # noqa: F401
+from src.models.history_meta import versioned_tables
+from src.models.partitions import add_months, is_partitioned, list_partitions, partition_month
+
+
+logger = logging.getLogger('history_archive')
+
+DATA_SUFFIX = '.ndjson.gz'
+INDEX_SUFFIX = '.index.json'
+# Доля ложных срабатываний фильтра Блума: примерно 10 бит на id
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+# Индексов пакетов в памяти одного читателя
+INDEX_CACHE_SIZE = 256
+
+
+def _fsync_write(path: str, write) -> None:
+    # Файл пишется под временным именем и переименовывается после fsync:
+    # читатели не увидят недописанный архив
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+
+
+def _bloom_positions(key: str, bits: int, hashes: int) -> List[int]:
+    # Двойное хеширование: позиции h1 + i * h2 из одного дайджеста
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+    return [(first + i * second) % bits for i in range(hashes)]
+
+
+def bloom_filter(keys: Iterable[str], count: int) -> Dict[str, Any]:
+    """Bloom filter of the keys for the batch index
+
+    Args:
+        keys (Iterable[str]): keys to add
+        count (int): number of the keys
+
+    Returns:
+        Dict[str, Any]: number of bits and hashes, bits as base64
+    """
+    count = max(count, 1)
+    bits = max(math.ceil(-count * math.log(BLOOM_FALSE_POSITIVE_RATE) / math.log(2) ** 2), 8)
+    hashes = max(round(bits / count * math.log(2)), 1)
+    data = bytearray((bits + 7) // 8)
+    for key in keys:
+        for position in _bloom_positions(key, bits, hashes):
+            data[position >> 3] |= 1 << (position & 7)
+    return {'bits': bits, 'hashes': hashes, 'data': base64.b64encode(bytes(data)).decode()}
+
+
+def bloom_contains(bloom: Dict[str, Any], key: str) -> bool:
+    """ False if the key is certainly not in the filter; `data` must be decoded to bytes """
+    data = bloom['data']
+    return all(
+        data[position >> 3] >> (position & 7) & 1 for position in _bloom_positions(key, bloom['bits'], bloom['hashes'])
+    )
+
+
+def write_batch(directory: str, rows: List[Dict[str, Any]], block_rows: int) -> str:
+    """Write rows of one history table as a compressed archive batch
+
+    Args:
+        directory (str): archive directory of the history table
+        rows (List[Dict[str, Any]]): history rows
+        block_rows (int): rows per compressed block
+
+    Returns:
+        str: batch name
+    """
+    rows.sort(key=lambda row: (str(row['id']), row['version']))
+    name = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    blocks = []
+
+    def write_data(file):
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            payload = gzip.compress(b''.join(
+                orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in block    # pylint: disable=no-member
+            ))
+            blocks.append([str(block[0]['id']), str(block[-1]['id']), file.tell(), len(payload)])
+            file.write(payload)
+
+    os.makedirs(directory, exist_ok=True)
+    _fsync_write(os.path.join(directory, name + DATA_SUFFIX), write_data)
+    ids = {str(row['id']) for row in rows}
+    index = {
+        'rows': len(rows),
+        'min_changed': min(row['changed'] for row in rows).isoformat(),
+        'max_changed': max(row['changed'] for row in rows).isoformat(),
+        'blocks': blocks,
+        'bloom': bloom_filter(ids, len(ids)),
+    }
+    _fsync_write(os.path.join(directory, name + INDEX_SUFFIX), lambda file: file.write(orjson.dumps(index)))  # pylint: disable=no-member
+    return name
+
+
+def archive_table(
+    engine: Engine, directory: str, table_name: str, cutoff: datetime, batch_size: int, block_rows: int
+) -> int:
+    """Move history rows changed before ``cutoff`` to the archive
+
+    Args:
+        engine (Engine): SQLAlchemy engine
+        directory (str): archive root directory
+        table_name (str): versioned table, e.g. orders
+        cutoff (datetime): rows changed before it are archived
+        batch_size (int): rows per batch file and transaction
+        block_rows (int): rows per compressed block
+
+    Returns:
+        int: number of archived rows
+    """
+    history = versioned_tables[table_name][1]
+    archived = 0
+    while True:
+        with engine.begin() as connection:
+            rows = [dict(row) for row in connection.execute(
+                select(history).where(history.c.changed < cutoff).limit(batch_size).with_for_update(skip_locked=True)
+            ).mappings()]
+            if not rows:
+                break
+
+            name = write_batch(os.path.join(directory, history.name), rows, block_rows)
+            connection.execute(
+                delete(history).where(
+                    history.c.changed < cutoff,
+                    tuple_(history.c.id, history.c.version).in_([(row['id'], row['version']) for row in rows]),
+                )
+            )
+        archived += len(rows)
+        logger.info('%s: %d rows archived to %s', history.name, len(rows), name)
+        if len(rows) < batch_size:
+            break
+    return archived
+
+
+def drop_empty_partitions(engine: Engine, table_name: str, cutoff: datetime) -> List[str]:
+    """Drop partitions of the history table that end before ``cutoff`` and are empty
+
+    Returns:
+        List[str]: names of the dropped partitions
+    """
+    history = versioned_tables[table_name][1]
+    dropped = []
+    with engine.begin() as connection:
+        if not is_partitioned(connection, history.name):
+            return dropped
+        for name in list_partitions(connection, history.name):
+            month = partition_month(name)
+            if month is None or add_months(month, 1) > cutoff:
+                continue
+            if connection.execute(text(f'SELECT 1 FROM {name} LIMIT 1')).first() is None:
+                connection.execute(text(f'ALTER TABLE {history.name} DETACH PARTITION {name}'))
+                connection.execute(text(f'DROP TABLE {name}'))
+                dropped.append(name)
+    return dropped
+
+
+def _parse_value(column, value):
+    if value is None:
+        return None
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, UUID):
+        return uuid.UUID(value)
+    if isinstance(column.type, Enum) and column.type.enum_class is not None:
+        return column.type.enum_class(value)
+    return value
+
+
+class HistoryArchive:
+    """ Чтение версий объекта из архива истории.
+        Индексы пакетов кэшируются в памяти (файлы архива не меняются), не больше `cache_size` последних.
+        Пакеты, в фильтре Блума которых объекта нет, пропускаются без чтения блоков;
+        в остальных читаются только блоки, в диапазон id которых он попадает.
+    """
+
+    def __init__(self, directory: str, cache_size: int = INDEX_CACHE_SIZE):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._indexes: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+    def _batches(self, history_name: str) -> List[Dict[str, Any]]:
+        directory = os.path.join(self.directory, history_name)
+        if not os.path.isdir(directory):
+            return []
+
+        batches = []
+        for entry in sorted(os.listdir(directory)):
+            if not entry.endswith(INDEX_SUFFIX):
+                continue
+            path = os.path.join(directory, entry)
+            index = self._indexes.get(path)
+            if index is None:
+                with open(path, 'rb') as file:
+                    index = orjson.loads(file.read())       # pylint: disable=no-member
+                index['data'] = path[:-len(INDEX_SUFFIX)] + DATA_SUFFIX
+                index['first_ids'] = [block[0] for block in index['blocks']]
+                index['max_changed'] = datetime.fromisoformat(index['max_changed'])
+                if 'bloom' in index:
+                    index['bloom']['data'] = base64.b64decode(index['bloom']['data'])
+                self._indexes[path] = index
+                if len(self._indexes) > self.cache_size:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(path)
+            batches.append(index)
+        return batches
+
+    def versions(self, history, item_id: uuid.UUID, changed_after: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Archived versions of one object
+
+        Args:
+            history (Table): history table
+            item_id (uuid.UUID): object ID
+            changed_after (Optional[datetime]): skip batches without versions replaced after it
+
+        Returns:
+            List[Dict[str, Any]]: versions ordered by number, values typed as in the table
+        """
+        key = str(item_id)
+        found: Dict[int, Dict[str, Any]] = {}
+        for index in self._batches(history.name):
+            if changed_after is not None and index['max_changed'] <= changed_after:
+                continue
+            # Пакеты, записанные до появления фильтра, проверяются по диапазонам id блоков
+            if 'bloom' in index and not bloom_contains(index['bloom'], key):
+                continue
+
+            # Версии объекта могут начинаться в конце предыдущего блока с тем же первым id
+            position = max(bisect.bisect_left(index['first_ids'], key) - 1, 0)
+            file = None
+            try:
+                for first, last, offset, length in index['blocks'][position:]:
+                    if first > key:
+                        break
+                    if last < key:
+                        continue
+                    if file is None:
+                        file = open(index['data'], 'rb')
+                    file.seek(offset)
+                    for line in gzip.decompress(file.read(length)).splitlines():
+                        row = orjson.loads(line)        # pylint: disable=no-member
+                        if row['id'] == key:
+                            found[row['version']] = row
+            finally:
+                if file is not None:
+                    file.close()
+
+        return [
+            {column.key: _parse_value(column, found[version].get(column.key)) for column in history.c}
+            for version in sorted(found)
+        ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    settings = DBSettings()
+    parser = argparse.ArgumentParser(description='Move old history rows to the compressed archive')
+    parser.add_argument('--older-than-days', type=int, default=settings.history_retention_days, help='retention period')
+    parser.add_argument('--dir', default=settings.history_archive_dir, help='archive directory')
+    parser.add_argument('--batch-size', type=int, default=settings.history_archive_batch_size, help='rows per batch file')
+    parser.add_argument('--block-rows', type=int, default=settings.history_archive_block_rows, help='rows per compressed block')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.older_than_days < 1:
+        parser.error('--older-than-days must be at least 1')
+
+    cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+    engine = create_engine(settings.pg_dsn)
+    try:
+        for table_name in sorted(versioned_tables):
+            archived = archive_table(engine, args.dir, table_name, cutoff, args.batch_size, args.block_rows)
+            dropped = drop_empty_partitions(engine, table_name, cutoff)
+            logger.info('%s: %d rows archived, partitions dropped: %s', table_name, archived, ', '.join(dropped) or 'none')
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
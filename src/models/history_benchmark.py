@@ -0,0 +1,98 @@
+"""Flush overhead of versioned writes.
+
+Updates every order of an in-memory SQLite database in one flush, with the
+history listener of src/models/history_meta.py attached and detached, and
+reports the time per updated order and the number of SQL statements per flush. SQLite
+keeps the database round trips out of the numbers, so the difference is the
+cost of the versioning itself.
+
+Usage::
+
+    python -m src.models.history_benchmark --rows 10000 --rounds 5
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+
+from src.models import history_meta
+from src.models.order import Order, OrderStatus
+
+
+@compiles(UUID, 'sqlite')
+def compile_uuid(element, compiler, **kw):
+    # В SQLite UUID хранится строкой
+    return 'CHAR(36)'
+
+
+def make_database(rows: int):
+    engine = create_engine('sqlite://')
+    tables = [Order.__table__, Order.__history_mapper__.local_table]
+    Order.metadata.create_all(engine, tables=tables)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(Order.__table__.insert(), [
+            {
+                'id': uuid.uuid4(), 'created_at': now, 'updated_at': now, 'created_by': 'bench',
+                'updated_by': 'bench', 'customer_id': uuid.uuid4(), 'delivery_date': now,
+                'status': OrderStatus.ACCEPT, 'version': 1,
+            }
+            for _ in range(rows)
+        ])
+    return engine
+
+
+def measure(engine, rounds: int) -> Tuple[float, int]:
+    """ Seconds per updated order averaged over the rounds, SQL statements per flush """
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(1))
+    elapsed = 0.0
+    writes = 0
+    with Session(engine) as session:
+        orders = session.execute(select(Order)).scalars().all()
+        for number in range(rounds):
+            for order in orders:
+                order.desctiption = f'round {number}'
+                order.status = OrderStatus.DELIVERING if number % 2 else OrderStatus.ACCEPT
+            statements.clear()
+            started = time.perf_counter()
+            session.flush()
+            elapsed += time.perf_counter() - started
+            writes += len(orders)
+        session.rollback()
+    return elapsed / writes, len(statements)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Flush overhead of versioned writes')
+    parser.add_argument('--rows', type=int, default=10_000, help='orders updated in one flush')
+    parser.add_argument('--rounds', type=int, default=5, help='flushes to average over')
+    args = parser.parse_args(argv)
+
+    engine = make_database(args.rows)
+    listener = history_meta._version_before_flush       # pylint: disable=protected-access
+
+    versioned = measure(engine, args.rounds)
+    event.remove(Session, 'before_flush', listener)
+    try:
+        plain = measure(engine, args.rounds)
+    finally:
+        event.listen(Session, 'before_flush', listener)
+
+    print(f'{args.rows} orders per flush, {args.rounds} rounds')
+    print(f'without history: {plain[0] * 1e6:8.1f} us/write {plain[1]:3d} statements/flush')
+    print(f'with history:    {versioned[0] * 1e6:8.1f} us/write {versioned[1]:3d} statements/flush')
+    print(f'overhead:        {(versioned[0] - plain[0]) * 1e6:8.1f} us/write')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
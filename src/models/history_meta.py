@@ -1,21 +1,41 @@
 """Versioned mixin class and other utilities."""
 
 import datetime
+import enum
+import itertools
+import uuid
 
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy import event
 from sqlalchemy import ForeignKeyConstraint
+from sqlalchemy import func
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import literal_column
+from sqlalchemy import select
 from sqlalchemy import Table
 from sqlalchemy import util
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import attributes
 from sqlalchemy.orm import mapper
-from sqlalchemy.orm import object_mapper
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import UnmappedColumnError
 from sqlalchemy.orm.properties import RelationshipProperty      # pylint: disable=no-name-in-module
 
+from src.core.config.app_settings import AppSettings
+from src.models.history_outbox import HistoryOutbox
+
+
+app_config = AppSettings()
+
+# "sync" writes history rows in the transaction of the change, "outbox"
+# writes compact change records that src/models/history_worker.py expands
+HISTORY_OUTBOX = app_config.db.history_mode == "outbox"
+
+# versioned table name -> (table, history table), for the outbox worker
+versioned_tables = {}
+
 
 def col_references_table(col, table):
     for fk in col.foreign_keys:
@@ -109,11 +129,18 @@ def _history_mapper(local_mapper):
 
         # "changed" column stores the UTC timestamp of when the
         # history row was created.
-        # This column is optional and can be omitted.
+        # It is the partition key of the history table, so it is
+        # part of the primary key (see src/models/partitions.py).
+        # The key no longer makes (id, version) unique on its own:
+        # writers guarantee it instead - a version is written once,
+        # under the lock of the live row (with_history, ORM update)
+        # or by the outbox worker in the transaction that deletes the
+        # outbox record. "partitions check" reports violations.
         cols.append(
             Column(
                 "changed",
                 DateTime,
+                primary_key=True,
                 default=datetime.datetime.utcnow,
                 info=version_meta,
             )
@@ -122,11 +149,22 @@ def _history_mapper(local_mapper):
         if super_fks:
             cols.append(ForeignKeyConstraint(*zip(*super_fks)))
 
+        # versions of one object by time, for "as of" reads; reads by
+        # version use the (id, version, changed) primary key
+        cols.append(
+            Index(
+                "ix_%s_history_id_changed" % local_mapper.local_table.name,
+                *[col.key for col in local_mapper.local_table.primary_key],
+                "changed"
+            )
+        )
+
         table = Table(
             local_mapper.local_table.name + "_history",
             local_mapper.local_table.metadata,
             *cols,
-            schema=local_mapper.local_table.schema
+            schema=local_mapper.local_table.schema,
+            postgresql_partition_by="RANGE (changed)"
         )
     else:
         # single table inheritance.  take any additional columns that may have
@@ -158,6 +196,11 @@ def _history_mapper(local_mapper):
         properties=properties,
     )
     cls.__history_mapper__ = m
+    if table is not None:
+        versioned_tables[local_mapper.local_table.name] = (
+            local_mapper.local_table,
+            table,
+        )
 
     if not super_history_mapper:
         local_mapper.local_table.append_column(
@@ -184,97 +227,215 @@ class Versioned:
         return map_
 
 
-def versioned_objects(iter_):
-    for obj in iter_:
-        if hasattr(obj, "__history_mapper__"):
-            yield obj
-
-
-def create_version(obj, session, deleted=False):
-    obj_mapper = object_mapper(obj)
-    history_mapper = obj.__history_mapper__
-    history_cls = history_mapper.class_
+_history_plans = {}
 
-    obj_state = attributes.instance_state(obj)
 
-    attr = {}
+def _history_plan(obj_mapper):
+    """Columns to copy for a versioned mapper, computed once per mapper.
 
-    obj_changed = False
+    Returns ``(tables, relationship_keys)``: ``tables`` is a list of
+    ``(history table, [(history column key, attribute key), ...])`` with the
+    root table first, ``relationship_keys`` are many-to-one relationships
+    whose change alone makes a new version.
+    """
+    plan = _history_plans.get(obj_mapper)
+    if plan is not None:
+        return plan
 
+    history_mapper = obj_mapper.class_.__history_mapper__
+    tables = []
     for om, hm in zip(
         obj_mapper.iterate_to_root(), history_mapper.iterate_to_root()
     ):
         if hm.single:
             continue
 
+        keys = []
         for hist_col in hm.local_table.c:
             if _is_versioning_col(hist_col):
                 continue
-
-            obj_col = om.local_table.c[hist_col.key]
-
-            # get the value of the
-            # attribute based on the MapperProperty related to the
-            # mapped column.  this will allow usage of MapperProperties
-            # that have a different keyname than that of the mapped column.
             try:
-                prop = obj_mapper.get_property_by_column(obj_col)
+                prop = obj_mapper.get_property_by_column(
+                    om.local_table.c[hist_col.key]
+                )
             except UnmappedColumnError:
                 # in the case of single table inheritance, there may be
                 # columns on the mapped table intended for the subclass only.
-                # the "unmapped" status of the subclass column on the
-                # base class is a feature of the declarative module.
                 continue
-
+            keys.append((hist_col.key, prop.key))
+        tables.append((hm.local_table, keys))
+    tables.reverse()
+
+    relationship_keys = [
+        prop.key
+        for prop in obj_mapper.iterate_properties
+        if isinstance(prop, RelationshipProperty)
+        and any(col.foreign_keys for col in prop.local_columns)
+    ]
+    plan = _history_plans[obj_mapper] = (tables, relationship_keys)
+    return plan
+
+
+def _json_value(value):
+    # the same representation as to_jsonb() of the column in PostgreSQL
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _compact_keys(table, keys):
+    """Columns of a compact outbox record: the changed ones and the ones
+    rewritten by every UPDATE (``onupdate``), without ``version``."""
+    return [
+        column.key
+        for column in table.c
+        if column.key != "version"
+        and (column.key in keys or column.onupdate is not None)
+    ]
+
+
+def _collect_version(obj, rows, changed, deleted=False):
+    """Add the version being replaced of ``obj`` to ``rows``.
+
+    Old values come from the committed state recorded by the attributes
+    (``active_history`` is set on all of them), so only the attributes that
+    were actually set are compared. In the outbox mode one record with the
+    old values of the changed columns is added instead of the history rows;
+    the outbox supports classes mapped to a single table.
+    """
+    state = attributes.instance_state(obj)
+    tables, relationship_keys = _history_plan(state.mapper)
+    committed = state.committed_state
+
+    obj_changed = deleted or any(key in committed for key in relationship_keys)
+    changed_keys = set()
+    version_rows = []
+    for table, keys in tables:
+        row = {}
+        for column_key, key in keys:
             # expired object attributes and also deferred cols might not
             # be in the dict.  force it to load no matter what by
             # using getattr().
-            if prop.key not in obj_state.dict:
-                getattr(obj, prop.key)
-
-            a, u, d = attributes.get_history(obj, prop.key)
-
-            if d:
-                attr[prop.key] = d[0]
-                obj_changed = True
-            elif u:
-                attr[prop.key] = u[0]
-            elif a:
+            if key not in state.dict:
+                getattr(obj, key)
+            value = state.dict.get(key)
+            old = committed.get(key, value)
+            if old is attributes.NO_VALUE:
                 # if the attribute had no value.
-                attr[prop.key] = a[0]
-                obj_changed = True
+                old = value
+                changed_keys.add(column_key)
+            elif old is not value and old != value:
+                changed_keys.add(column_key)
+            row[column_key] = old
+        row["version"] = obj.version
+        row["changed"] = changed
+        version_rows.append((table, row))
+
+    if not (obj_changed or changed_keys):
+        return
 
-    if not obj_changed:
-        # not changed, but we have relationships.  OK
-        # check those too
-        for prop in obj_mapper.iterate_properties:
-            if (
-                isinstance(prop, RelationshipProperty) and attributes.get_history(
-                    obj, prop.key, passive=attributes.PASSIVE_NO_INITIALIZE
-                ).has_changes()
-            ):
-                for p in prop.local_columns:
-                    if p.foreign_keys:
-                        obj_changed = True
-                        break
-                if obj_changed is True:
-                    break
-
-    if not obj_changed and not deleted:
+    if HISTORY_OUTBOX:
+        table, row = version_rows[0]
+        if not deleted:
+            row = {key: row[key] for key in _compact_keys(state.mapper.local_table, changed_keys)}
+        rows.setdefault(HistoryOutbox.__table__, []).append({
+            "table_name": table.name,
+            "row_id": obj.id,
+            "version": obj.version,
+            "changed": changed,
+            "data": {key: _json_value(value) for key, value in row.items() if key not in ("version", "changed")},
+        })
+    else:
+        for table, row in version_rows:
+            rows.setdefault(table, []).append(row)
+    if not deleted:
+        obj.version += 1
+
+
+@event.listens_for(Session, "before_flush")
+def _version_before_flush(session, flush_context, instances):
+    """Write the replaced versions of all versioned objects of the flush.
+
+    One listener for every session: the rows of a flush are collected first
+    and written with one executemany INSERT per history table, before the
+    UPDATE and DELETE statements of the flush itself. The statement is
+    compiled once and cached; the driver sends the whole batch at once
+    (asyncpg pipelines it, psycopg2 folds it into multi-row VALUES).
+    In the outbox mode the rows go to ``history_outbox`` instead.
+    """
+    rows = {}
+    changed = datetime.datetime.utcnow()
+    for obj in session.dirty:
+        if hasattr(obj, "__history_mapper__"):
+            _collect_version(obj, rows, changed)
+    for obj in session.deleted:
+        if hasattr(obj, "__history_mapper__"):
+            _collect_version(obj, rows, changed, deleted=True)
+
+    if not rows:
         return
+    connection = session.connection()
+    for table, values in rows.items():
+        connection.execute(table.insert(), values)
+
+
+def _history_insert(cls, source):
+    table = cls.__table__
+    history_table = cls.__history_mapper__.local_table
+    columns = [column.key for column in table.c]
+    changed = func.timezone("utc", func.now())
+    query = select(*[source.c[key] for key in columns], changed)
+    return history_table.insert().from_select(columns + ["changed"], query)
+
+
+def _outbox_insert(cls, source, columns=None):
+    table = cls.__table__
+    history_table = cls.__history_mapper__.local_table
+    if columns is None:
+        # the whole row, the version is removed by the worker
+        data = func.to_jsonb(literal_column(source.name))
+    else:
+        data = func.jsonb_build_object(*itertools.chain.from_iterable(
+            (literal_column("'%s'" % key), source.c[key])
+            for key in _compact_keys(table, columns)
+        ))
+    changed = func.timezone("utc", func.now())
+    query = select(
+        literal_column("'%s'" % history_table.name),
+        source.c.id,
+        source.c.version,
+        changed,
+        data,
+    ).select_from(source)
+    return HistoryOutbox.__table__.insert().from_select(
+        ["table_name", "row_id", "version", "changed", "data"], query
+    )
+
 
-    attr["version"] = obj.version
-    hist = history_cls()
-    for key, value in attr.items():
-        setattr(hist, key, value)
-    session.add(hist)
-    obj.version += 1
-
-
-def versioned_session(session):
-    @event.listens_for(session, "before_flush")
-    def before_flush(session, flush_context, instances):
-        for obj in versioned_objects(session.dirty):
-            create_version(obj, session)
-        for obj in versioned_objects(session.deleted):
-            create_version(obj, session, deleted=True)
+def with_history(statement, cls, whereclause, columns=None):
+    """UPDATE or DELETE of the rows of a versioned class matching
+    ``whereclause`` that copies them into the history table.
+
+    The rows are read with FOR UPDATE in the CTE ``old`` and the statement
+    is joined to it (``UPDATE ... FROM old`` / ``DELETE ... USING old``):
+    PostgreSQL runs a data-modifying CTE not referenced by the main
+    statement after it, when the rows are already changed by the same
+    command and the locking read skips them. Joined to ``old``, the
+    snapshot is taken and the rows are locked before the write; the history
+    INSERT reads the same materialized ``old``.
+
+    ``columns`` are the columns the UPDATE sets; in the outbox mode only
+    their old values are recorded, ``None`` (a DELETE) records the whole
+    row. The caller is expected to bump ``version`` in its UPDATE.
+    """
+    table = cls.__table__
+    old = select(table).where(whereclause).with_for_update().cte("old")
+    if HISTORY_OUTBOX:
+        history = _outbox_insert(cls, old, columns=columns).cte("history")
+    else:
+        history = _history_insert(cls, old).cte("history")
+    return statement.where(table.c.id == old.c.id).add_cte(history)
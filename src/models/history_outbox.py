@@ -0,0 +1,36 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from src.db.postgresql import Base
+
+
+class HistoryOutbox(Base):
+    """ Запись об изменении версионируемой строки в режиме истории `outbox`.
+        Пишется в одной транзакции с изменением и содержит только старые значения
+        изменённых колонок (для удаления - всю строку); полную строку истории
+        из неё восстанавливает src/models/history_worker.py.
+    """
+
+    __tablename__ = 'history_outbox'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # Таблица истории, в которую попадёт версия, например orders_history
+    table_name = Column(String, nullable=False)
+    row_id = Column(UUID(as_uuid=True), nullable=False)
+    version = Column(Integer, nullable=False)
+    changed = Column(DateTime, nullable=False)
+    data = Column(JSONB, nullable=False)
+
+    __table_args__ = (
+        Index('ix_history_outbox_table_name_row_id_version', 'table_name', 'row_id', 'version'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<HistoryOutbox {self.table_name} {self.row_id} {self.version}>"
@@ -0,0 +1,145 @@
+"""Expansion of the history outbox into the history tables.
+
+In the outbox history mode (DATABASE_HISTORY_MODE=outbox) a change of a
+versioned row writes only a compact record to ``history_outbox``: the old
+values of the changed columns, or the whole row for a delete. The worker
+reads the records in batches and rebuilds full history rows by walking the
+versions of each row back from its current state:
+
+    version N-1 = current row + record of version N-1
+    version N-2 = version N-1 + record of version N-2 ...
+
+The live rows are locked while their records are expanded, so no new
+version appears in between. History rows and the deletion of the expanded
+records are committed together, and only one worker expands at a time.
+
+Usage::
+
+    python -m src.models.history_worker [--batch-size 10000] [--once]
+"""
+
+import argparse
+import itertools
+import logging
+import sys
+import time
+from operator import attrgetter
+from typing import List, Optional
+
+import orjson
+from sqlalchemy import create_engine, delete, func, literal_column, select, text
+from sqlalchemy.engine import Connection
+
+from src.core.config.database_settings import DBSettings
+from src.models import order, delivery      # noqa: F401
+from src.models.history_meta import versioned_tables
+from src.models.history_outbox import HistoryOutbox
+
+
+logger = logging.getLogger('history_worker')
+
+outbox = HistoryOutbox.__table__
+# Ключ advisory-блокировки: записи разворачивает только один воркер
+WORKER_LOCK = select(func.pg_try_advisory_xact_lock(func.hashtext('history_outbox')))
+
+
+def expand_rows(connection: Connection, history_name: str, row_ids: List) -> int:
+    """Expand all outbox records of the rows into the history table
+
+    Args:
+        connection (Connection): SQLAlchemy connection in a transaction
+        history_name (str): history table of the records
+        row_ids (List): IDs of the versioned rows
+
+    Returns:
+        int: number of written history rows
+    """
+    live, history = next(
+        (live, history) for live, history in versioned_tables.values() if history.name == history_name
+    )
+    current = dict(connection.execute(
+        select(live.c.id, func.to_jsonb(literal_column(live.name)))
+        .where(live.c.id.in_(row_ids))
+        .with_for_update()
+    ).all())
+    records = connection.execute(
+        select(outbox)
+        .where(outbox.c.table_name == history_name, outbox.c.row_id.in_(row_ids))
+        .order_by(outbox.c.row_id, outbox.c.version.desc())
+    ).all()
+
+    rows = []
+    for row_id, versions in itertools.groupby(records, key=attrgetter('row_id')):
+        # Удалённой строки нет в таблице, её последняя запись содержит строку целиком
+        state = dict(current.get(row_id) or {})
+        for record in versions:
+            state.update(record.data)
+            rows.append({**state, 'version': record.version, 'changed': record.changed})
+
+    connection.execute(
+        text(
+            f"INSERT INTO {history.name} "
+            f"SELECT * FROM jsonb_populate_recordset(NULL::{history.name}, CAST(:rows AS jsonb))"
+        ),
+        {'rows': orjson.dumps(rows).decode()},      # pylint: disable=no-member
+    )
+    connection.execute(delete(outbox).where(outbox.c.id.in_([record.id for record in records])))
+    return len(rows)
+
+
+def expand_batch(connection: Connection, batch_size: int) -> Optional[int]:
+    """Expand the oldest outbox records
+
+    Args:
+        connection (Connection): SQLAlchemy connection in a transaction
+        batch_size (int): number of records to take
+
+    Returns:
+        Optional[int]: number of taken records, None if another worker is running
+    """
+    if not connection.execute(WORKER_LOCK).scalar():
+        return None
+
+    taken = connection.execute(
+        select(outbox.c.table_name, outbox.c.row_id).order_by(outbox.c.id).limit(batch_size)
+    ).all()
+    targets = {}
+    for history_name, row_id in taken:
+        targets.setdefault(history_name, set()).add(row_id)
+    for history_name, row_ids in targets.items():
+        expand_rows(connection, history_name, list(row_ids))
+    return len(taken)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    settings = DBSettings()
+    parser = argparse.ArgumentParser(description='Expand the history outbox into the history tables')
+    parser.add_argument('--batch-size', type=int, default=settings.history_outbox_batch_size, help='records per transaction')
+    parser.add_argument('--interval', type=float, default=settings.history_outbox_interval, help='seconds to wait when the outbox is empty')
+    parser.add_argument('--once', action='store_true', help='exit when the outbox is empty')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    engine = create_engine(settings.pg_dsn)
+    try:
+        while True:
+            with engine.begin() as connection:
+                taken = expand_batch(connection, args.batch_size)
+            if taken is None:
+                logger.info('another worker is running')
+            elif taken:
+                logger.info('expanded %d outbox records', taken)
+            if not taken or taken < args.batch_size:
+                if args.once:
+                    break
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    String,
+)
+
+from src.db.postgresql import Base
+
+
+class ImportCheckpoint(Base):
+    """ Прогресс загрузки файла командой импорта.
+        Обновляется в одной транзакции с каждой записанной пачкой строк,
+        поэтому после сбоя загрузка продолжается с первой незаписанной строки.
+    """
+
+    __tablename__ = 'import_checkpoints'
+
+    kind = Column(String, primary_key=True)
+    source = Column(String, primary_key=True)
+    # Число прочитанных записей файла, включая отклонённые
+    position = Column(BigInteger, nullable=False, default=0)
+    imported = Column(BigInteger, nullable=False, default=0)
+    rejected = Column(BigInteger, nullable=False, default=0)
+    finished = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ImportCheckpoint {self.kind} {self.source} {self.position}>"
@@ -0,0 +1,500 @@
+"""Bulk import of zones, orders and deliveries from CSV or NDJSON files.
+
+Records are validated with the API schemas in chunks, valid rows are streamed
+into a temporary staging table with ``COPY FROM STDIN`` and merged into the
+target table with ``INSERT ... SELECT ... ON CONFLICT (id) DO NOTHING``. Each
+chunk is committed together with its checkpoint, so an interrupted import is
+resumed by running the same command again.
+
+Usage::
+
+    python -m src.models.importer zones ./zones.ndjson
+    python -m src.models.importer orders ./orders.csv --chunk-size 20000
+
+Zones are checked for overlaps with the stored zones and with each other
+according to ``GEO_ZONE_OVERLAP_POLICY``, under the same advisory lock as
+zone writes of the API. Their links are stored and ``zone_state.generation``
+is bumped in the chunk transaction, so running API processes rebuild their
+zone index on the next refresh.
+
+Rejected records are appended to ``<file>.rejects.ndjson`` with their
+position and errors; records that cannot be decoded also carry their line
+number and raw text. Rejects of a chunk are written before its commit, and
+a resumed import first drops the rejects of records after the checkpoint,
+so every rejected record is listed once.
+"""
+
+import argparse
+import csv
+import enum
+import io
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type, Union
+
+import orjson
+import psycopg2
+from psycopg2.extras import execute_values
+from pydantic import BaseModel, ValidationError
+
+from src.core.config.app_settings import AppSettings
+from src.core.config.database_settings import DBSettings
+from src.models import delivery as delivery_model
+from src.models import order as order_model
+from src.models import zone as zone_model
+from src.schemas.delivery import DeliveryCreate
+from src.schemas.order import OrderCreate
+from src.schemas.zone import ZoneCreate
+from src.services.crud.zone import ZONE_LOCK_KEY, derived_fields, expand_bbox
+from src.services.geo.polygon import OVERLAP, Polygon, relate
+from src.services.geo.zone_index import ZoneIndex
+
+
+app_config = AppSettings()
+logger = logging.getLogger('importer')
+
+
+# Идентификатор и время создания можно передать в файле, чтобы перенести исторические данные как есть
+class ImportRecord(BaseModel):
+    id: Optional[uuid.UUID]
+    created_at: Optional[datetime]
+
+
+class ZoneImport(ZoneCreate, ImportRecord):
+    pass
+
+
+class OrderImport(OrderCreate, ImportRecord):
+    pass
+
+
+class DeliveryImport(DeliveryCreate, ImportRecord):
+    pass
+
+
+class ImportKind:
+    """ Описание загружаемой сущности: схема проверки, целевая таблица
+        и проверка ссылок на другие таблицы перед слиянием.
+    """
+
+    def __init__(
+        self,
+        schema: Type[ImportRecord],
+        table,
+        prepare: Callable[[Dict[str, Any]], Dict[str, Any]] = lambda row: row,
+        references: Tuple[Tuple[str, str], ...] = (),
+    ):
+        self.schema = schema
+        self.table = table
+        self.prepare = prepare
+        # (колонка, таблица) внешних ключей, строки с отсутствующей ссылкой отклоняются
+        self.references = references
+        # geom заполняет триггер PostGIS, колонки нет в модели
+        self.columns = [column.name for column in table.columns]
+
+
+def zone_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {**row, **derived_fields(row['coordinates'])}
+
+
+KINDS = {
+    'zones': ImportKind(ZoneImport, zone_model.Zone.__table__, prepare=zone_row),
+    'orders': ImportKind(OrderImport, order_model.Order.__table__),
+    'deliveries': ImportKind(
+        DeliveryImport,
+        delivery_model.Delivery.__table__,
+        references=(('order_id', 'orders'), ('zone_id', 'zones')),
+    ),
+}
+
+
+class MalformedRecord(NamedTuple):
+    """ Record that could not be decoded, it is rejected but keeps its position """
+    line: int
+    raw: str
+    error: str
+
+
+def csv_line(values: List[str]) -> str:
+    out = io.StringIO()
+    csv.writer(out, lineterminator='').writerow(values)
+    return out.getvalue()
+
+
+def read_records(path: str, raw) -> Iterator[Union[Dict[str, Any], MalformedRecord]]:
+    """Records of a CSV or NDJSON file, the format is taken from the extension
+
+    Args:
+        path (str): file path
+        raw: the file opened in binary mode
+
+    Returns:
+        Iterator[Union[Dict[str, Any], MalformedRecord]]: raw records, MalformedRecord for undecodable ones
+    """
+    if path.endswith(('.ndjson', '.jsonl')):
+        for number, line in enumerate(raw, 1):
+            if not line.strip():
+                continue
+            try:
+                yield orjson.loads(line)        # pylint: disable=no-member
+            except orjson.JSONDecodeError as e:     # pylint: disable=no-member
+                yield MalformedRecord(number, line.decode('utf-8', 'replace').rstrip('\r\n'), str(e))
+        return
+
+    reader = csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+    for record in reader:
+        # Пустая ячейка CSV - отсутствующее значение, массивы (координаты зон) записываются как JSON
+        try:
+            yield {
+                key: orjson.loads(value) if value.startswith('[') else value        # pylint: disable=no-member
+                for key, value in record.items() if value != ''
+            }
+        except orjson.JSONDecodeError as e:     # pylint: disable=no-member
+            # Номер строки файла, на которой закончилась запись; текст записи собирается из её ячеек
+            yield MalformedRecord(reader.line_num, csv_line(list(record.values())), str(e))
+
+
+def copy_value(value: Any) -> str:
+    """ Value in the text format of COPY """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, enum.Enum):
+        # Enum в PostgreSQL хранит имена членов, как SQLAlchemy Enum
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return '{' + ','.join(repr(float(item)) for item in value) + '}'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+class Importer:
+    """ Загрузка одного файла пачками с контрольной точкой после каждой пачки """
+
+    def __init__(self, connection, kind: str, path: str, chunk_size: int):
+        self.connection = connection
+        self.kind = kind
+        self.spec = KINDS[kind]
+        self.path = path
+        self.source = os.path.abspath(path)
+        self.chunk_size = chunk_size
+        self.staging = f'import_staging_{kind}'
+
+        self.position = 0
+        self.imported = 0
+        self.rejected = 0
+        self.finished = False
+
+    def load_checkpoint(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT position, imported, rejected, finished FROM import_checkpoints'
+                ' WHERE kind = %s AND source = %s',
+                (self.kind, self.source),
+            )
+            row = cursor.fetchone()
+        self.connection.commit()
+        if row is not None:
+            self.position, self.imported, self.rejected, self.finished = row
+
+    def reset_checkpoint(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM import_checkpoints WHERE kind = %s AND source = %s', (self.kind, self.source)
+            )
+        self.connection.commit()
+
+    def save_checkpoint(self, cursor) -> None:
+        cursor.execute(
+            'INSERT INTO import_checkpoints (kind, source, position, imported, rejected, finished, updated_at)'
+            ' VALUES (%s, %s, %s, %s, %s, %s, %s)'
+            ' ON CONFLICT (kind, source) DO UPDATE SET position = EXCLUDED.position,'
+            ' imported = EXCLUDED.imported, rejected = EXCLUDED.rejected,'
+            ' finished = EXCLUDED.finished, updated_at = EXCLUDED.updated_at',
+            (self.kind, self.source, self.position, self.imported, self.rejected, self.finished,
+             datetime.utcnow()),
+        )
+
+    def create_staging(self) -> None:
+        columns = ', '.join(self.spec.columns)
+        with self.connection.cursor() as cursor:
+            # Временная таблица живёт до конца соединения и очищается при каждом COMMIT
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS {self.staging} ON COMMIT DELETE ROWS'
+                f' AS SELECT {columns} FROM {self.spec.table.name} WITH NO DATA'
+            )
+        self.connection.commit()
+
+    def validate(self, records: List[Tuple[int, Any]]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        """Validate a chunk of records with the API schema
+
+        Args:
+            records (List[Tuple[int, Any]]): positions and raw records
+
+        Returns:
+            Tuple[List[Tuple[int, Dict]], List[Dict]]: positions and table rows of valid records, rejects
+        """
+        rows, rejects = [], []
+        now = datetime.utcnow()
+        versioned = 'version' in self.spec.columns
+        for position, record in records:
+            if isinstance(record, MalformedRecord):
+                rejects.append({
+                    'position': position, 'line': record.line, 'raw': record.raw,
+                    'errors': [{'loc': [], 'msg': record.error, 'type': 'value_error.jsondecode'}],
+                })
+                continue
+
+            try:
+                obj_in = self.spec.schema.parse_obj(record)
+            except ValidationError as e:
+                rejects.append({'position': position, 'errors': e.errors()})
+                continue
+
+            row = self.spec.prepare(obj_in.dict())
+            row['id'] = row['id'] or uuid.uuid4()
+            row['created_at'] = row['created_at'] or now
+            row['updated_at'] = row['created_at']
+            if versioned:
+                row['version'] = 1
+            rows.append((position, row))
+        return rows, rejects
+
+    def write_chunk(self, rows: List[Tuple[int, Dict[str, Any]]], rejects: List[Dict]) -> None:
+        """ COPY valid rows into staging, merge them and move the checkpoint in one transaction """
+        columns = self.spec.columns
+        table = self.spec.table.name
+        with self.connection.cursor() as cursor:
+            rows = self.check(cursor, rows, rejects)
+            buffer = io.StringIO()
+            for _, row in rows:
+                buffer.write('\t'.join(copy_value(row.get(column)) for column in columns))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY {self.staging} ({", ".join(columns)}) FROM STDIN', buffer)
+
+            positions = {row['id']: position for position, row in rows}
+            for column, reference in self.spec.references:
+                cursor.execute(
+                    f'DELETE FROM {self.staging} AS s WHERE s.{column} IS NULL'
+                    f' OR NOT EXISTS (SELECT 1 FROM {reference} AS r WHERE r.id = s.{column}) RETURNING s.id'
+                )
+                for (missing_id,) in cursor.fetchall():
+                    rejects.append({
+                        'position': positions[uuid.UUID(str(missing_id))],
+                        'errors': [{'loc': [column], 'msg': 'referenced object not found',
+                                    'type': 'value_error.not_found'}],
+                    })
+
+            column_list = ', '.join(columns)
+            # Уже загруженные ID пропускаются: повторный запуск не создаёт дублей
+            cursor.execute(
+                f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {self.staging}'
+                ' ON CONFLICT (id) DO NOTHING'
+            )
+            merged = cursor.rowcount
+            self.after_merge(cursor, merged)
+            self.imported += merged
+            self.rejected += len(rejects)
+            self.save_checkpoint(cursor)
+            # Отказы пишутся до фиксации пачки: при сбое между записью и COMMIT пачка читается заново,
+            # а её отказы отбрасывает trim_rejects
+            self.write_rejects(rejects)
+        self.connection.commit()
+
+    @property
+    def rejects_path(self) -> str:
+        return f'{self.path}.rejects.ndjson'
+
+    def write_rejects(self, rejects: List[Dict]) -> None:
+        if not rejects:
+            return
+        with open(self.rejects_path, 'ab') as out:
+            for reject in sorted(rejects, key=lambda item: item['position']):
+                out.write(orjson.dumps(reject) + b'\n')      # pylint: disable=no-member
+            out.flush()
+            os.fsync(out.fileno())
+
+    def trim_rejects(self) -> None:
+        """ Drop rejects of records after the checkpoint, they are read again """
+        if not os.path.exists(self.rejects_path):
+            return
+
+        kept = []
+        with open(self.rejects_path, 'rb') as rejects:
+            for line in rejects:
+                try:
+                    if orjson.loads(line)['position'] < self.position:      # pylint: disable=no-member
+                        kept.append(line)
+                except (orjson.JSONDecodeError, KeyError, TypeError):      # pylint: disable=no-member
+                    # Недописанная при сбое строка
+                    continue
+
+        temporary = f'{self.rejects_path}.tmp'
+        with open(temporary, 'wb') as out:
+            out.writelines(kept)
+        os.replace(temporary, self.rejects_path)
+
+    def check(
+        self, cursor, rows: List[Tuple[int, Dict[str, Any]]], rejects: List[Dict]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """ Checks of a chunk against the stored data in its transaction, returns the rows to merge """
+        return rows
+
+    def after_merge(self, cursor, merged: int) -> None:
+        """ Writes that go with the merged rows in the chunk transaction """
+
+    def run(self) -> None:
+        size = os.path.getsize(self.path)
+        started = time.monotonic()
+        skip = self.position
+        if skip:
+            logger.info('%s: resuming %s from record %d', self.kind, self.path, skip)
+
+        self.create_staging()
+        self.trim_rejects()
+        with open(self.path, 'rb') as raw:
+            chunk: List[Tuple[int, Any]] = []
+            for position, record in enumerate(read_records(self.path, raw)):
+                if position < skip:
+                    continue
+                chunk.append((position, record))
+                if len(chunk) < self.chunk_size:
+                    continue
+
+                self.position = position + 1
+                self.write_chunk(*self.validate(chunk))
+                chunk = []
+                self.report(raw.tell() / size if size else 1.0, started, skip)
+
+            if chunk:
+                self.position = chunk[-1][0] + 1
+            self.finished = True
+            self.write_chunk(*self.validate(chunk))
+            self.report(1.0, started, skip)
+
+    def report(self, progress: float, started: float, skip: int) -> None:
+        elapsed = time.monotonic() - started
+        rate = (self.position - skip) / elapsed if elapsed else 0.0
+        logger.info(
+            '%s: %.1f%%, %d records read, %d imported, %d rejected, %.0f records/s',
+            self.kind, progress * 100, self.position, self.imported, self.rejected, rate,
+        )
+
+
+class ZoneImporter(Importer):
+    """ Загрузка зон с проверкой пересечений и сохранением связей зон, как при записи через API """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.links: List[Tuple[uuid.UUID, uuid.UUID, str]] = []
+
+    def check(
+        self, cursor, rows: List[Tuple[int, Dict[str, Any]]], rejects: List[Dict]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        # Блокировка записи зон API: пока пачка проверяется и записывается, набор зон не меняется
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (ZONE_LOCK_KEY,))
+        self.links = []
+        if not rows:
+            return rows
+
+        # Уже загруженные зоны (повторный запуск) не проверяются: слияние их пропустит
+        cursor.execute('SELECT id FROM zones WHERE id = ANY(%s::uuid[])', ([str(row['id']) for _, row in rows],))
+        seen = {uuid.UUID(str(zone_id)) for zone_id, in cursor.fetchall()}
+
+        tolerance = app_config.geo.zone_adjacency_tolerance
+        min_longitude, min_latitude, max_longitude, max_latitude = expand_bbox((
+            min(row['min_longitude'] for _, row in rows),
+            min(row['min_latitude'] for _, row in rows),
+            max(row['max_longitude'] for _, row in rows),
+            max(row['max_latitude'] for _, row in rows),
+        ), tolerance)
+        cursor.execute(
+            'SELECT id, coordinates FROM zones WHERE min_longitude <= %s AND max_longitude >= %s'
+            ' AND min_latitude <= %s AND max_latitude >= %s',
+            (max_longitude, min_longitude, max_latitude, min_latitude),
+        )
+        index = ZoneIndex(app_config.geo.zone_index_cell_size, classify=False)
+        index.build((uuid.UUID(str(zone_id)), coordinates) for zone_id, coordinates in cursor.fetchall())
+
+        accepted = []
+        for position, row in rows:
+            if row['id'] in seen:
+                continue
+            seen.add(row['id'])
+
+            polygon = Polygon(row['coordinates'])
+            related = []
+            for other_zone_id in index.near(expand_bbox(polygon.bbox, tolerance)):
+                relation = relate(polygon, index.polygon(other_zone_id), tolerance)
+                if relation is not None:
+                    related.append((other_zone_id, relation))
+
+            # Зоны пачки проверяются и друг с другом: принятая зона сразу попадает в индекс
+            overlaps = [str(other_zone_id) for other_zone_id, relation in related if relation == OVERLAP]
+            if overlaps and app_config.geo.zone_overlap_policy == 'reject':
+                rejects.append({
+                    'position': position,
+                    'errors': [{'loc': ['coordinates'], 'msg': f'zone overlaps zones {", ".join(overlaps)}',
+                                'type': 'value_error.zone_overlap'}],
+                })
+                continue
+
+            index.upsert(row['id'], row['coordinates'])
+            accepted.append((position, row))
+            self.links.extend((row['id'], other_zone_id, relation) for other_zone_id, relation in related)
+        return accepted
+
+    def after_merge(self, cursor, merged: int) -> None:
+        if not merged:
+            return
+        # Связи хранятся в обе стороны, как в ZoneService
+        execute_values(
+            cursor,
+            'INSERT INTO zone_links (zone_id, other_zone_id, relation) VALUES %s ON CONFLICT DO NOTHING',
+            [
+                (str(first), str(second), relation)
+                for zone_id, other_zone_id, relation in self.links
+                for first, second in ((zone_id, other_zone_id), (other_zone_id, zone_id))
+            ],
+        )
+        # Процессы API перестроят индекс зон на следующей проверке поколения
+        cursor.execute('UPDATE zone_state SET generation = generation + 1 WHERE id = 1')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Bulk import of zones, orders and deliveries')
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('path', help='CSV or NDJSON (.ndjson, .jsonl) file')
+    parser.add_argument('--chunk-size', type=int, default=10_000, help='records per transaction')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and read the file again')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    connection = psycopg2.connect(DBSettings().pg_dsn)
+    try:
+        importer_class = ZoneImporter if args.kind == 'zones' else Importer
+        importer = importer_class(connection, args.kind, args.path, args.chunk_size)
+        if args.restart:
+            importer.reset_checkpoint()
+        importer.load_checkpoint()
+        if importer.finished:
+            logger.info('%s: %s is already imported, use --restart to read it again', args.kind, args.path)
+            return 0
+        importer.run()
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
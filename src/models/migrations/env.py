@@ -3,7 +3,8 @@ from logging.config import dictConfig
 from src.core.config.database_settings import DBSettings
 from src.core.logger import LOGGING
 from src.db.postgresql import Base
-from src.models import order, zone, delivery        # noqa: F401
+from src.models import order, zone, delivery, courier, import_checkpoint, history_outbox     # noqa: F401
+from src.models.partitions import ensure_partitions
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -79,6 +80,8 @@ def run_migrations_online():
 
         with context.begin_transaction():       # pylint: disable=no-member
             context.run_migrations()            # pylint: disable=no-member
+            # Каждый upgrade заодно создаёт секции истории на ближайшие месяцы
+            ensure_partitions(connection, app_db_settings.history_partitions_ahead)
 
 
 if context.is_offline_mode():                   # pylint: disable=no-member
@@ -0,0 +1,35 @@
+"""zone audit columns
+
+`zones.created_by` and `zones.updated_by`, written by the zone API but
+missing from databases created before migrations existed. Existing zones
+get the author 'unknown'. IF NOT EXISTS keeps the revision safe for
+databases that already have the columns.
+
+Revision ID: 3b8d0e6f2a17
+Revises: 5a2f1c3e8b90
+Create Date: 2021-10-05 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8d0e6f2a17'
+down_revision = '5a2f1c3e8b90'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ('created_by', 'updated_by')
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.execute(f"ALTER TABLE zones ADD COLUMN IF NOT EXISTS {column} text NOT NULL DEFAULT 'unknown'")
+        # Значение по умолчанию нужно только для заполнения существующих строк
+        op.execute(f'ALTER TABLE zones ALTER COLUMN {column} DROP DEFAULT')
+
+
+def downgrade():
+    for column in reversed(COLUMNS):
+        op.drop_column('zones', column)
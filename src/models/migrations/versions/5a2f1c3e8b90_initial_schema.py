@@ -0,0 +1,122 @@
+"""initial schema
+
+Schema of databases created before migrations existed.
+
+Revision ID: 5a2f1c3e8b90
+Revises: 
+Create Date: 2021-10-04 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2f1c3e8b90'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+order_status = postgresql.ENUM(
+    'ACCEPT', 'DELIVERING', 'DELIVERED', 'NOT_DELIVERED', name='orderstatus', create_type=False
+)
+
+
+def timestamp_columns():
+    return [
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    ]
+
+
+def audit_columns():
+    return [
+        *timestamp_columns(),
+        sa.Column('created_by', sa.Text(), nullable=False),
+        sa.Column('updated_by', sa.Text(), nullable=False),
+    ]
+
+
+def order_columns():
+    return [
+        sa.Column('customer_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('courier_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('delivery_date', sa.DateTime(), nullable=False),
+        sa.Column('desctiption', sa.String(), nullable=True),
+        sa.Column('status', order_status, nullable=True),
+    ]
+
+
+def delivery_columns():
+    return [
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+    ]
+
+
+def upgrade():
+    order_status.create(op.get_bind(), checkfirst=True)
+
+    op.create_table(
+        'zones',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        # Колонки автора у зон добавляет 3b8d0e6f2a17
+        *timestamp_columns(),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('coordinates', postgresql.ARRAY(sa.Float()), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('id'),
+    )
+    op.create_table(
+        'orders',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        *audit_columns(),
+        *order_columns(),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('id'),
+    )
+    op.create_table(
+        'orders_history',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        *audit_columns(),
+        *order_columns(),
+        sa.Column('version', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('changed', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id', 'version'),
+    )
+    op.create_table(
+        'deliverys',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        *audit_columns(),
+        *delivery_columns(),
+        sa.Column('order_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('zone_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id']),
+        sa.ForeignKeyConstraint(['zone_id'], ['zones.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('id'),
+    )
+    op.create_table(
+        'deliverys_history',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        *audit_columns(),
+        *delivery_columns(),
+        sa.Column('order_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('zone_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('version', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('changed', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id', 'version'),
+    )
+
+
+def downgrade():
+    op.drop_table('deliverys_history')
+    op.drop_table('deliverys')
+    op.drop_table('orders_history')
+    op.drop_table('orders')
+    op.drop_table('zones')
+    order_status.drop(op.get_bind(), checkfirst=True)
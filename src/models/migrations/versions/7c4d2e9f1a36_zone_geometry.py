@@ -0,0 +1,82 @@
+"""zone geometry
+
+Optional PostGIS polygon for zones. The column is maintained by a trigger
+from `zones.coordinates`, so the application keeps writing the plain array
+and the migration is a no-op on servers without PostGIS.
+
+Revision ID: 7c4d2e9f1a36
+Revises: 3b8d0e6f2a17
+Create Date: 2021-10-11 12:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4d2e9f1a36'
+down_revision = '3b8d0e6f2a17'
+branch_labels = None
+depends_on = None
+
+
+def postgis_available() -> bool:
+    if context.is_offline_mode():       # pylint: disable=no-member
+        return True
+
+    return bool(op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")
+    ).scalar())
+
+
+def upgrade():
+    if not postgis_available():
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+    op.execute('ALTER TABLE zones ADD COLUMN geom geometry(Polygon, 4326)')
+
+    # Полигон из плоского массива [lon0, lat0, lon1, lat1, ...], кольцо замыкается при необходимости
+    op.execute("""
+        CREATE OR REPLACE FUNCTION zone_polygon(coordinates double precision[]) RETURNS geometry AS $$
+            SELECT ST_SetSRID(
+                ST_MakePolygon(
+                    CASE WHEN ST_IsClosed(ring.line) THEN ring.line
+                         ELSE ST_AddPoint(ring.line, ST_StartPoint(ring.line))
+                    END
+                ),
+                4326
+            )
+            FROM (
+                SELECT ST_MakeLine(ST_MakePoint(coordinates[i], coordinates[i + 1]) ORDER BY i) AS line
+                FROM generate_subscripts(coordinates, 1) AS i
+                WHERE i % 2 = 1
+            ) AS ring
+        $$ LANGUAGE sql IMMUTABLE
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION zones_sync_geom() RETURNS trigger AS $$
+        BEGIN
+            NEW.geom := zone_polygon(NEW.coordinates);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER zones_sync_geom
+        BEFORE INSERT OR UPDATE OF coordinates ON zones
+        FOR EACH ROW EXECUTE FUNCTION zones_sync_geom()
+    """)
+
+    op.execute('UPDATE zones SET geom = zone_polygon(coordinates)')
+
+    # ST_Contains использует индекс по geometry, ST_DWithin в метрах - индекс по geography
+    op.execute('CREATE INDEX ix_zones_geom ON zones USING gist (geom)')
+    op.execute('CREATE INDEX ix_zones_geog ON zones USING gist ((geom::geography))')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS zones_sync_geom ON zones')
+    op.execute('DROP FUNCTION IF EXISTS zones_sync_geom()')
+    op.execute('DROP FUNCTION IF EXISTS zone_polygon(double precision[])')
+    op.execute('ALTER TABLE zones DROP COLUMN IF EXISTS geom')
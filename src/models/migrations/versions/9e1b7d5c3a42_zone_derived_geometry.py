@@ -0,0 +1,131 @@
+"""zone derived geometry
+
+The bounding box, centroid and simplified ring of the existing zones are
+computed by a copy of the geometry code as it was at this revision, so
+later changes of src.services.geo do not change what this migration does.
+
+Revision ID: 9e1b7d5c3a42
+Revises: 7c4d2e9f1a36
+Create Date: 2021-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from src.core.config.geo_settings import GeoSettings
+
+
+# revision identifiers, used by Alembic.
+revision = '9e1b7d5c3a42'
+down_revision = '7c4d2e9f1a36'
+branch_labels = None
+depends_on = None
+
+
+BBOX_COLUMNS = ('min_longitude', 'min_latitude', 'max_longitude', 'max_latitude')
+DERIVED_COLUMNS = BBOX_COLUMNS + ('centroid_longitude', 'centroid_latitude', 'simplified_coordinates')
+
+
+def coordinates_to_ring(coordinates):
+    ring = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    return ring
+
+
+def polygon_centroid(ring):
+    # Центр масс кольца, для вырожденного кольца - среднее вершин
+    xs, ys = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(xs, -1), np.roll(ys, -1)
+    cross = xs * y2 - x2 * ys
+    area = cross.sum() / 2
+    if area == 0:
+        return float(xs.mean()), float(ys.mean())
+    return float(((xs + x2) * cross).sum() / (6 * area)), float(((ys + y2) * cross).sum() / (6 * area))
+
+
+def simplify_path(path, tolerance):
+    # Douglas-Peucker без рекурсии: стек отрезков, для каждого ищем самую дальнюю точку
+    keep = np.zeros(len(path), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(path) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start, end = path[first], path[last]
+        inner = path[first + 1:last]
+        dx, dy = end - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(*(inner - start).T)
+        else:
+            distances = np.abs(dx * (inner[:, 1] - start[1]) - dy * (inner[:, 0] - start[0])) / length
+
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            keep[first + 1 + farthest] = True
+            stack.append((first, first + 1 + farthest))
+            stack.append((first + 1 + farthest, last))
+
+    return path[keep]
+
+
+def simplify_ring(ring, tolerance):
+    if len(ring) <= 3 or tolerance <= 0:
+        return ring
+
+    # Делим кольцо на две ломаные по самой удалённой от первой вершины точке
+    split = int(np.hypot(*(ring - ring[0]).T).argmax())
+    head = simplify_path(ring[:split + 1], tolerance)
+    tail = simplify_path(np.vstack([ring[split:], ring[:1]]), tolerance)
+    simplified = np.vstack([head, tail[1:-1]])
+    return simplified if len(simplified) >= 3 else ring
+
+
+def derived_values(coordinates, tolerance):
+    ring = coordinates_to_ring(coordinates)
+    min_x, min_y = ring.min(axis=0)
+    max_x, max_y = ring.max(axis=0)
+    centroid_x, centroid_y = polygon_centroid(ring)
+    return {
+        'min_longitude': float(min_x),
+        'min_latitude': float(min_y),
+        'max_longitude': float(max_x),
+        'max_latitude': float(max_y),
+        'centroid_longitude': centroid_x,
+        'centroid_latitude': centroid_y,
+        'simplified_coordinates': simplify_ring(ring, tolerance).ravel().tolist(),
+    }
+
+
+def upgrade():
+    for name in BBOX_COLUMNS + ('centroid_longitude', 'centroid_latitude'):
+        op.add_column('zones', sa.Column(name, sa.Float(), nullable=True))
+    op.add_column('zones', sa.Column('simplified_coordinates', postgresql.ARRAY(sa.Float()), nullable=True))
+
+    zones = sa.table(
+        'zones',
+        sa.column('id', postgresql.UUID(as_uuid=True)),
+        sa.column('coordinates', postgresql.ARRAY(sa.Float())),
+        *(sa.column(name) for name in DERIVED_COLUMNS),
+    )
+    tolerance = GeoSettings().zone_simplify_tolerance
+    bind = op.get_bind()
+    for zone_id, coordinates in bind.execute(sa.select(zones.c.id, zones.c.coordinates)).fetchall():
+        bind.execute(zones.update().where(zones.c.id == zone_id).values(derived_values(coordinates, tolerance)))
+
+    for name in DERIVED_COLUMNS:
+        op.alter_column('zones', name, nullable=False)
+    for name in BBOX_COLUMNS:
+        op.create_index(f'ix_zones_{name}', 'zones', [name])
+
+
+def downgrade():
+    for name in BBOX_COLUMNS:
+        op.drop_index(f'ix_zones_{name}', table_name='zones')
+    for name in reversed(DERIVED_COLUMNS):
+        op.drop_column('zones', name)
@@ -0,0 +1,34 @@
+"""zone topology built
+
+Flag in zone_state telling whether the zone links graph was computed. API
+processes compute it from all zones only while the flag is false, instead
+of on every start with an empty zone_links table.
+
+Revision ID: a2c4e6f8b013
+Revises: f1a3c5e7b902
+Create Date: 2021-12-28 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c4e6f8b013'
+down_revision = 'f1a3c5e7b902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('zone_state', sa.Column('topology_built', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.alter_column('zone_state', 'topology_built', server_default=None)
+    # Связи уже есть или считать нечего - граф считается построенным
+    op.execute(
+        'UPDATE zone_state SET topology_built = EXISTS (SELECT 1 FROM zone_links)'
+        ' OR (SELECT count(*) FROM zones) < 2'
+    )
+
+
+def downgrade():
+    op.drop_column('zone_state', 'topology_built')
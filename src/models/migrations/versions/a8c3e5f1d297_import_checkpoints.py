@@ -0,0 +1,34 @@
+"""import checkpoints
+
+Revision ID: a8c3e5f1d297
+Revises: f2b9c4e7a158
+Create Date: 2021-11-22 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c3e5f1d297'
+down_revision = 'f2b9c4e7a158'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'import_checkpoints',
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('source', sa.String(), nullable=False),
+        sa.Column('position', sa.BigInteger(), nullable=False),
+        sa.Column('imported', sa.BigInteger(), nullable=False),
+        sa.Column('rejected', sa.BigInteger(), nullable=False),
+        sa.Column('finished', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'source'),
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoints')
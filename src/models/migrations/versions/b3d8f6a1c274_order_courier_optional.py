@@ -0,0 +1,26 @@
+"""order courier optional
+
+Revision ID: b3d8f6a1c274
+Revises: 9e1b7d5c3a42
+Create Date: 2021-10-25 12:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d8f6a1c274'
+down_revision = '9e1b7d5c3a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('orders', 'courier_id', existing_type=postgresql.UUID(as_uuid=True), nullable=True)
+    op.alter_column('orders_history', 'courier_id', existing_type=postgresql.UUID(as_uuid=True), nullable=True)
+
+
+def downgrade():
+    op.alter_column('orders_history', 'courier_id', existing_type=postgresql.UUID(as_uuid=True), nullable=False)
+    op.alter_column('orders', 'courier_id', existing_type=postgresql.UUID(as_uuid=True), nullable=False)
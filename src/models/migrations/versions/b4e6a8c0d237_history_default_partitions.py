@@ -0,0 +1,44 @@
+"""history default partitions
+
+DEFAULT partitions of orders_history and deliverys_history. A history row
+changed in a month without a partition (``partitions create`` did not run in
+time) lands there instead of failing the transaction of the change;
+``partitions create`` moves such rows into partitions of their months.
+
+Downgrade moves the rows of the DEFAULT partitions out the same way and
+drops them.
+
+Revision ID: b4e6a8c0d237
+Revises: a2c4e6f8b013
+Create Date: 2022-01-10 12:00:00.000000
+
+"""
+from alembic import op
+
+from src.models.partitions import (
+    HISTORY_TABLES,
+    add_months,
+    create_partitions,
+    default_months,
+    default_partition_name,
+)
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e6a8c0d237'
+down_revision = 'a2c4e6f8b013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in HISTORY_TABLES:
+        op.execute(f'CREATE TABLE {default_partition_name(table)} PARTITION OF {table} DEFAULT')
+
+
+def downgrade():
+    connection = op.get_bind()
+    for table in HISTORY_TABLES:
+        for month in default_months(connection, table):
+            create_partitions(connection, table, month, add_months(month, 1))
+        op.drop_table(default_partition_name(table))
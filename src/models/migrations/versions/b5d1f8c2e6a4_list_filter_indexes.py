@@ -0,0 +1,42 @@
+"""list filter indexes
+
+Indexes behind the order and delivery list filters. Partial indexes cover
+orders that are not delivered yet: they are the ones operations and courier
+routes ask for, and they stay small as delivered orders accumulate.
+
+Revision ID: b5d1f8c2e6a4
+Revises: a8c3e5f1d297
+Create Date: 2021-11-29 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d1f8c2e6a4'
+down_revision = 'a8c3e5f1d297'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE = sa.text("status <> 'DELIVERED'")
+INDEXES = (
+    ('ix_orders_customer_id_created_at_id', 'orders', ['customer_id', 'created_at', 'id'], None),
+    ('ix_orders_courier_id_delivery_date', 'orders', ['courier_id', 'delivery_date'], None),
+    ('ix_orders_delivery_date', 'orders', ['delivery_date'], None),
+    ('ix_orders_active_created_at_id', 'orders', ['created_at', 'id'], ACTIVE),
+    ('ix_orders_active_courier_id_delivery_date', 'orders', ['courier_id', 'delivery_date'], ACTIVE),
+    ('ix_deliverys_order_id', 'deliverys', ['order_id'], None),
+    ('ix_deliverys_zone_id_created_at_id', 'deliverys', ['zone_id', 'created_at', 'id'], None),
+)
+
+
+def upgrade():
+    for name, table, columns, where in INDEXES:
+        op.create_index(name, table, columns, postgresql_where=where)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
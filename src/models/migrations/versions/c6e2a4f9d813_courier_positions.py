@@ -0,0 +1,38 @@
+"""courier positions
+
+Revision ID: c6e2a4f9d813
+Revises: b3d8f6a1c274
+Create Date: 2021-11-01 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e2a4f9d813'
+down_revision = 'b3d8f6a1c274'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'courier_positions',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('courier_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('zone_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('recorded_at', sa.DateTime(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_courier_positions_courier_id_recorded_at', 'courier_positions', ['courier_id', 'recorded_at']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_courier_positions_courier_id_recorded_at', table_name='courier_positions')
+    op.drop_table('courier_positions')
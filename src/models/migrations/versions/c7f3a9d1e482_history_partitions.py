@@ -0,0 +1,63 @@
+"""history partitions
+
+orders_history and deliverys_history become tables partitioned by month of
+``changed``. PostgreSQL requires the partition key in the primary key, so it
+changes from (id, version) to (id, version, changed); rows without
+``changed`` get ``updated_at`` of the version. Existing rows are copied into
+partitions covering their months, partitions for the coming months are
+created by src/models/partitions.py.
+
+Downgrade copies back only the partitions still attached to the parent.
+
+Revision ID: c7f3a9d1e482
+Revises: b5d1f8c2e6a4
+Create Date: 2021-12-06 12:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+
+from src.core.config.database_settings import DBSettings
+from src.models.partitions import HISTORY_TABLES, add_months, create_partitions, month_start
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f3a9d1e482'
+down_revision = 'b5d1f8c2e6a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    current = month_start(datetime.utcnow())
+    end = add_months(current, DBSettings().history_partitions_ahead + 1)
+    for table in HISTORY_TABLES:
+        old = f'{table}_unpartitioned'
+        op.execute(f'UPDATE {table} SET changed = updated_at WHERE changed IS NULL')
+        op.rename_table(table, old)
+        op.execute(f'ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey')
+
+        op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (changed)')
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN changed SET NOT NULL')
+        op.create_primary_key(f'{table}_pkey', table, ['id', 'version', 'changed'])
+
+        first = connection.exec_driver_sql(f'SELECT min(changed) FROM {old}').scalar()
+        create_partitions(connection, table, min(first, current) if first else current, end)
+        op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+        op.drop_table(old)
+
+
+def downgrade():
+    for table in HISTORY_TABLES:
+        old = f'{table}_partitioned'
+        op.rename_table(table, old)
+        op.execute(f'ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey')
+
+        op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)')
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN changed DROP NOT NULL')
+        op.create_primary_key(f'{table}_pkey', table, ['id', 'version'])
+        op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+        # Секции удаляются вместе с родительской таблицей
+        op.drop_table(old)
@@ -0,0 +1,42 @@
+"""history outbox
+
+Compact change records of versioned rows written in the outbox history mode
+(DATABASE_HISTORY_MODE=outbox) and expanded into the history tables by
+src/models/history_worker.py.
+
+Revision ID: d4e8b1f6a935
+Revises: c7f3a9d1e482
+Create Date: 2021-12-13 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8b1f6a935'
+down_revision = 'c7f3a9d1e482'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'history_outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('row_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('changed', sa.DateTime(), nullable=False),
+        sa.Column('data', postgresql.JSONB(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_history_outbox_table_name_row_id_version', 'history_outbox', ['table_name', 'row_id', 'version']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_history_outbox_table_name_row_id_version', table_name='history_outbox')
+    op.drop_table('history_outbox')
@@ -0,0 +1,35 @@
+"""zone links
+
+Revision ID: e4a7b2c9d516
+Revises: c6e2a4f9d813
+Create Date: 2021-11-08 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7b2c9d516'
+down_revision = 'c6e2a4f9d813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'zone_links',
+        sa.Column('zone_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('other_zone_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('relation', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['zone_id'], ['zones.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['other_zone_id'], ['zones.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('zone_id', 'other_zone_id'),
+    )
+    op.create_index('ix_zone_links_other_zone_id', 'zone_links', ['other_zone_id'])
+
+
+def downgrade():
+    op.drop_index('ix_zone_links_other_zone_id', table_name='zone_links')
+    op.drop_table('zone_links')
@@ -0,0 +1,35 @@
+"""history read indexes
+
+(id, changed) indexes of the history tables for "as of" reads of one object.
+Reads by version range use the (id, version, changed) primary key. On the
+partitioned tables each partition gets its own copy of the index.
+
+Revision ID: e6b2c8d4f170
+Revises: d4e8b1f6a935
+Create Date: 2021-12-20 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2c8d4f170'
+down_revision = 'd4e8b1f6a935'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_orders_history_id_changed', 'orders_history'),
+    ('ix_deliverys_history_id_changed', 'deliverys_history'),
+)
+
+
+def upgrade():
+    for name, table in INDEXES:
+        op.create_index(name, table, ['id', 'changed'])
+
+
+def downgrade():
+    for name, table in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,34 @@
+"""zone state
+
+Counter of zone changes. Zone writes and the importer increment it in their
+transaction, API processes poll it and rebuild their in-memory zone index
+when it differs from the generation the index was built from.
+
+Revision ID: f1a3c5e7b902
+Revises: e6b2c8d4f170
+Create Date: 2021-12-27 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c5e7b902'
+down_revision = 'e6b2c8d4f170'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'zone_state',
+        sa.Column('id', sa.SmallInteger(), nullable=False),
+        sa.Column('generation', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute('INSERT INTO zone_state (id, generation) VALUES (1, 0)')
+
+
+def downgrade():
+    op.drop_table('zone_state')
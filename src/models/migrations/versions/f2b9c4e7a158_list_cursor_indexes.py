@@ -0,0 +1,28 @@
+"""list cursor indexes
+
+Revision ID: f2b9c4e7a158
+Revises: e4a7b2c9d516
+Create Date: 2021-11-15 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9c4e7a158'
+down_revision = 'e4a7b2c9d516'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('orders', 'deliverys', 'zones')
+
+
+def upgrade():
+    for table in TABLES:
+        op.create_index(f'ix_{table}_created_at_id', table, ['created_at', 'id'])
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_created_at_id', table_name=table)
@@ -0,0 +1,44 @@
+"""courier reservations
+
+Reservations of couriers for orders, previously kept only in the memory of
+the API process. The table is seeded from orders with a courier that are
+not delivered yet; a courier with several such orders is reserved for the
+latest one.
+
+Revision ID: f8d2a6c4e319
+Revises: b4e6a8c0d237
+Create Date: 2022-01-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8d2a6c4e319'
+down_revision = 'b4e6a8c0d237'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'courier_reservations',
+        sa.Column('courier_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('order_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('courier_id'),
+        sa.UniqueConstraint('order_id'),
+    )
+    op.execute(
+        "INSERT INTO courier_reservations (courier_id, order_id)"
+        " SELECT DISTINCT ON (courier_id) courier_id, id FROM orders"
+        " WHERE courier_id IS NOT NULL AND status <> 'DELIVERED'"
+        " ORDER BY courier_id, created_at DESC, id"
+    )
+
+
+def downgrade():
+    op.drop_table('courier_reservations')
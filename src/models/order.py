@@ -5,16 +5,18 @@ from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy import (
     Column,
+    Index,
     DateTime,
     String,
     Enum,
+    text,
 )
 
 from src.db.postgresql import Base
 from src.models.base_mixins import BaseMixin, TimestampMixin, AuditMixin
 from src.models.history_meta import Versioned
 
-# Этот импорт нужен для связи one-to-one для модели Order
+# Эти импорты нужны для связей модели Order
 from src.models.delivery import Delivery            # noqa: F401
 from src.models.zone import Zone                    # noqa: F401
 
@@ -33,7 +35,8 @@ class OrderMixin(TimestampMixin, AuditMixin):
     """ Order base model """
 
     customer_id = Column(UUID(as_uuid=True), nullable=False)
-    courier_id = Column(UUID(as_uuid=True), nullable=False)
+    # Курьер назначается сервисом назначения, поэтому при создании заказа может отсутствовать
+    courier_id = Column(UUID(as_uuid=True), nullable=True)
     delivery_date = Column(DateTime, nullable=False)
     desctiption = Column(String, nullable=True)
     status = Column(Enum(OrderStatus, nullable=False, default=OrderStatus.NOT_DELIVERED))
@@ -48,6 +51,22 @@ class Order(Versioned, Base, BaseMixin, OrderMixin):
         BaseMixin ([type]): [description]
         OrderMixin ([type]): [description]
     """    
+    # Ключ постраничного обхода по курсору и индексы фильтров списка;
+    # частичные индексы ix_orders_active_* покрывают только недоставленные заказы
+    __table_args__ = (
+        Index('ix_orders_created_at_id', 'created_at', 'id'),
+        Index('ix_orders_customer_id_created_at_id', 'customer_id', 'created_at', 'id'),
+        Index('ix_orders_courier_id_delivery_date', 'courier_id', 'delivery_date'),
+        Index('ix_orders_delivery_date', 'delivery_date'),
+        Index(
+            'ix_orders_active_created_at_id', 'created_at', 'id',
+            postgresql_where=text("status <> 'DELIVERED'"),
+        ),
+        Index(
+            'ix_orders_active_courier_id_delivery_date', 'courier_id', 'delivery_date',
+            postgresql_where=text("status <> 'DELIVERED'"),
+        ),
+    )
     @declared_attr
     def delivery(cls):              # pylint: disable=no-self-argument
         return relationship(
@@ -59,11 +78,12 @@ class Order(Versioned, Base, BaseMixin, OrderMixin):
 
     @declared_attr
     def zone(cls):                  # pylint: disable=no-self-argument
+        # Зона заказа определяется через его доставку
         return relationship(
             "Zone",
-            backref="order",
-            cascade="all, delete",
+            secondary=Delivery.__table__,
             uselist=False,
+            viewonly=True,
         )
 
     def __repr__(self) -> str:
@@ -0,0 +1,269 @@
+"""Monthly range partitions of the history tables.
+
+``orders_history`` and ``deliverys_history`` are partitioned by ``changed``,
+one partition per calendar month named ``<table>_pYYYY_MM``. Partitions for
+the coming months are created ahead of time, old ones are detached from the
+parent and stay in the database as plain tables until they are archived or
+dropped.
+
+Rows outside of the monthly partitions (``create`` did not run in time) go to
+the DEFAULT partition ``<table>_default`` instead of failing the write.
+``create`` moves them into partitions of their months: a month partition is
+built as a plain table, filled with the rows of its month deleted from the
+default partition and attached to the parent.
+
+The partition key is a part of the primary key ``(id, version, changed)``,
+so the database does not keep ``(id, version)`` unique across partitions. The
+writers do: a version is written once, by the transaction holding the lock of
+the live row or by the outbox worker together with the deletion of its outbox
+record. ``check`` scans the tables and reports duplicated versions.
+
+Usage::
+
+    python -m src.models.partitions create --ahead 3
+    python -m src.models.partitions detach --keep 24 [--drop]
+    python -m src.models.partitions check
+
+``alembic upgrade`` runs ``create`` with the default settings as well.
+"""
+
+import argparse
+import logging
+import re
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
+
+from src.core.config.database_settings import DBSettings
+
+
+logger = logging.getLogger('partitions')
+
+# Таблицы истории версий, секционированные по месяцам значения changed
+HISTORY_TABLES = ('orders_history', 'deliverys_history')
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f'{table}_p{month:%Y_%m}'
+
+
+def default_partition_name(table: str) -> str:
+    return f'{table}_default'
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    match = PARTITION_SUFFIX.search(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {'table': table}
+    ).scalar()
+    return relkind == 'p'
+
+
+def list_partitions(connection: Connection, table: str) -> List[str]:
+    return list(connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass) ORDER BY child.relname"
+        ),
+        {'table': table},
+    ).scalars())
+
+
+def create_partitions(connection: Connection, table: str, start: datetime, end: datetime) -> List[str]:
+    """Create the monthly partitions of a table covering ``[start, end)``
+
+    Rows of these months found in the DEFAULT partition are moved into them.
+
+    Args:
+        connection (Connection): SQLAlchemy connection
+        table (str): partitioned table
+        start (datetime): first month to cover
+        end (datetime): month after the last one to cover
+
+    Returns:
+        List[str]: names of the partitions that did not exist before
+    """
+    existing = set(list_partitions(connection, table))
+    default = default_partition_name(table)
+    created = []
+    month = month_start(start)
+    while month < end:
+        name = partition_name(table, month)
+        bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        if name not in existing and default in existing:
+            # Пока строки месяца лежат в секции по умолчанию, секцию месяца нельзя создать:
+            # она собирается отдельной таблицей и подключается после переноса строк
+            connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+            moved = connection.execute(
+                text(
+                    f"WITH moved AS (DELETE FROM {default} WHERE changed >= :start AND changed < :end RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved"
+                ),
+                {'start': month, 'end': add_months(month, 1)},
+            ).rowcount
+            connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+            if moved:
+                logger.warning('%s: %d rows moved from %s', name, moved, default)
+            created.append(name)
+        elif name not in existing:
+            connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}"))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def default_months(connection: Connection, table: str) -> List[datetime]:
+    """ Months of the rows stored in the DEFAULT partition of a table """
+    default = default_partition_name(table)
+    if default not in list_partitions(connection, table):
+        return []
+    return list(connection.execute(
+        text(f"SELECT DISTINCT date_trunc('month', changed) AS month FROM {default} ORDER BY month")
+    ).scalars())
+
+
+def ensure_partitions(connection: Connection, ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """Create partitions from the current month up to ``ahead`` months forward
+
+    Rows in the DEFAULT partition are moved into partitions of their months,
+    which are created for that as well. Tables that are not partitioned
+    (schema before the partitioning migration) are skipped.
+
+    Args:
+        connection (Connection): SQLAlchemy connection
+        ahead (int): number of months after the current one
+        now (Optional[datetime]): current UTC time
+
+    Returns:
+        List[str]: names of the created partitions
+    """
+    current = month_start(now or datetime.utcnow())
+    created = []
+    for table in HISTORY_TABLES:
+        if not is_partitioned(connection, table):
+            continue
+        created += create_partitions(connection, table, current, add_months(current, ahead + 1))
+        for month in default_months(connection, table):
+            created += create_partitions(connection, table, month, add_months(month, 1))
+    return created
+
+
+def detach_partitions(
+    connection: Connection, keep: int, drop: bool = False, now: Optional[datetime] = None
+) -> List[str]:
+    """Detach partitions older than ``keep`` months
+
+    Detached partitions are plain tables with the same name; the history
+    stored in them is no longer visible through the parent table. The
+    DEFAULT partition is never detached.
+
+    Args:
+        connection (Connection): SQLAlchemy connection
+        keep (int): number of months to keep, the current one included
+        drop (bool): drop the detached tables
+        now (Optional[datetime]): current UTC time
+
+    Returns:
+        List[str]: names of the detached partitions
+    """
+    oldest = add_months(month_start(now or datetime.utcnow()), 1 - keep)
+    detached = []
+    for table in HISTORY_TABLES:
+        if not is_partitioned(connection, table):
+            continue
+        for name in list_partitions(connection, table):
+            month = partition_month(name)
+            if month is None or month >= oldest:
+                continue
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if drop:
+                connection.execute(text(f"DROP TABLE {name}"))
+            detached.append(name)
+    return detached
+
+
+def find_duplicate_versions(connection: Connection, limit: int = 100) -> List[str]:
+    """Find versions stored more than once in the history tables
+
+    Reads the whole tables, meant for maintenance runs.
+
+    Args:
+        connection (Connection): SQLAlchemy connection
+        limit (int): maximum number of reported versions per table
+
+    Returns:
+        List[str]: duplicated versions as ``<table> <id> v<version> x<count>``
+    """
+    duplicates = []
+    for table in HISTORY_TABLES:
+        rows = connection.execute(text(
+            f"SELECT id, version, count(*) AS copies FROM {table} "
+            f"GROUP BY id, version HAVING count(*) > 1 ORDER BY id, version LIMIT :limit"
+        ), {'limit': limit})
+        duplicates.extend(f'{table} {row.id} v{row.version} x{row.copies}' for row in rows)
+    return duplicates
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    settings = DBSettings()
+    parser = argparse.ArgumentParser(description='Monthly partitions of the history tables')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser(
+        'create', help='create partitions for the coming months, move rows out of the default partition'
+    )
+    create.add_argument('--ahead', type=int, default=settings.history_partitions_ahead, help='months after the current one')
+    detach = commands.add_parser('detach', help='detach partitions older than --keep months')
+    detach.add_argument('--keep', type=int, required=True, help='months to keep, the current one included')
+    detach.add_argument('--drop', action='store_true', help='drop the detached tables')
+    commands.add_parser('check', help='report versions stored more than once')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'detach' and args.keep < 1:
+        parser.error('--keep must be at least 1')
+
+    engine = create_engine(settings.pg_dsn)
+    try:
+        with engine.begin() as connection:
+            if args.command == 'create':
+                names = ensure_partitions(connection, args.ahead)
+            elif args.command == 'detach':
+                names = detach_partitions(connection, args.keep, drop=args.drop)
+            else:
+                names = find_duplicate_versions(connection)
+    finally:
+        engine.dispose()
+
+    if args.command == 'check':
+        for name in names:
+            logger.error('duplicate version: %s', name)
+        logger.info('check: %s', 'duplicate versions found' if names else 'no duplicate versions')
+        return 1 if names else 0
+
+    logger.info('%s: %s', args.command, ', '.join(names) or 'nothing to do')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
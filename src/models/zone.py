@@ -1,18 +1,74 @@
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
     Column,
+    ForeignKey,
+    Index,
+    SmallInteger,
     String,
     Float,
 )
 
 from src.db.postgresql import Base
-from src.models.base_mixins import BaseMixin, TimestampMixin
+from src.models.base_mixins import BaseMixin, TimestampMixin, AuditMixin
 
 
-class Zone(Base, BaseMixin, TimestampMixin):
+class Zone(Base, BaseMixin, TimestampMixin, AuditMixin):
     """ Модель зоны доставки """
+    # Ключ постраничного обхода по курсору
+    __table_args__ = (
+        Index('ix_zones_created_at_id', 'created_at', 'id'),
+    )
 
     name = Column(String, nullable=False)
+    # Плоский список координат полигона: [lon0, lat0, lon1, lat1, ...]
     coordinates = Column(ARRAY(Float), nullable=False)
 
+    # Производные данные, вычисляются в ZoneService при записи координат
+    min_longitude = Column(Float, nullable=False, index=True)
+    min_latitude = Column(Float, nullable=False, index=True)
+    max_longitude = Column(Float, nullable=False, index=True)
+    max_latitude = Column(Float, nullable=False, index=True)
+    centroid_longitude = Column(Float, nullable=False)
+    centroid_latitude = Column(Float, nullable=False)
+    simplified_coordinates = Column(ARRAY(Float), nullable=False)
+
     def __repr__(self) -> str:
         return f"<Zone {self.id}>"
+
+
+class ZoneLink(Base):
+    """ Связь двух зон: соседство (adjacent) или пересечение (overlap).
+        Каждая связь хранится в обе стороны, чтобы соседей зоны можно было
+        выбрать по первичному ключу.
+    """
+
+    __tablename__ = 'zone_links'
+    __table_args__ = (
+        Index('ix_zone_links_other_zone_id', 'other_zone_id'),
+    )
+
+    zone_id = Column(UUID(as_uuid=True), ForeignKey('zones.id', ondelete='CASCADE'), primary_key=True)
+    other_zone_id = Column(UUID(as_uuid=True), ForeignKey('zones.id', ondelete='CASCADE'), primary_key=True)
+    relation = Column(String, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ZoneLink {self.zone_id} {self.relation} {self.other_zone_id}>"
+
+
+class ZoneState(Base):
+    """ Счётчик изменений зон (одна строка с id = 1).
+        Каждая запись зон увеличивает generation в своей транзакции; процессы API
+        сравнивают его с поколением своего индекса зон и перестраивают индекс при расхождении.
+    """
+
+    __tablename__ = 'zone_state'
+
+    id = Column(SmallInteger, primary_key=True)
+    generation = Column(BigInteger, nullable=False, default=0)
+    # Граф связей зон вычислен; до этого процесс API при старте вычисляет его из всех зон
+    topology_built = Column(Boolean, nullable=False, default=False)
+
+    def __repr__(self) -> str:
+        return f"<ZoneState {self.generation}>"
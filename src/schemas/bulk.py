@@ -0,0 +1,59 @@
+import orjson
+
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from pydantic import (
+    BaseModel,
+    Field,
+)
+
+from src.models.order import OrderStatus
+
+
+def orjson_dumps(v, *, default):
+    # orjson.dumps returns bytes, to match standard json.dumps we need to decode
+    # https://pydantic-docs.helpmanual.io/usage/exporting_models/#custom-json-deserialisation
+    return orjson.dumps(v, default=default).decode()    # pylint: disable=no-member
+
+
+# Максимальный размер пакета в одном запросе
+MAX_BULK_ITEMS = 10_000
+
+
+class BulkBase(BaseModel):
+
+    class Config:
+        json_loads = orjson.loads       # pylint: disable=no-member
+        json_dumps = orjson_dumps
+        allow_population_by_field_name = True
+
+
+# Элементы пакета проверяются по одному, чтобы вернуть ошибки каждого элемента,
+# поэтому тело принимается как список произвольных объектов
+class BulkCreate(BulkBase):
+    items: List[Dict[str, Any]] = Field(..., max_items=MAX_BULK_ITEMS)
+
+
+class OrderStatusItem(BulkBase):
+    id: UUID
+    status: OrderStatus
+
+
+class OrderStatusBulk(BulkBase):
+    updated_by: str
+    items: List[Dict[str, Any]] = Field(..., max_items=MAX_BULK_ITEMS)
+
+
+class BulkItemResult(BulkBase):
+    index: int = Field(..., description='''Позиция элемента в пакете''')
+    id: Optional[UUID]
+    errors: Optional[List[Dict[str, Any]]] = Field(
+        default=None,
+        description='''Ошибки элемента, элемент с ошибками не записан''',
+    )
+
+
+class BulkResult(BulkBase):
+    succeeded: int
+    failed: int
+    items: List[BulkItemResult]
@@ -0,0 +1,96 @@
+import orjson
+
+from datetime import date, datetime
+from typing import List, Optional
+from uuid import UUID
+from pydantic import (
+    BaseModel,
+    Field,
+)
+
+
+def orjson_dumps(v, *, default):
+    # orjson.dumps returns bytes, to match standard json.dumps we need to decode
+    # https://pydantic-docs.helpmanual.io/usage/exporting_models/#custom-json-deserialisation
+    return orjson.dumps(v, default=default).decode()    # pylint: disable=no-member
+
+
+class CourierBase(BaseModel):
+
+    class Config:
+        json_loads = orjson.loads       # pylint: disable=no-member
+        json_dumps = orjson_dumps
+        allow_population_by_field_name = True
+
+
+# Properties to receive on courier position update
+class CourierPositionUpdate(CourierBase):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    available: Optional[bool] = Field(
+        default=None,
+        description='''Готовность принять заказ, если не передано - не меняется''',
+    )
+
+
+class CourierPosition(CourierBase):
+    courier_id: UUID
+    zone_id: Optional[UUID]
+    latitude: float
+    longitude: float
+    available: bool
+
+    class Config:
+        orm_mode = True
+
+
+class CourierDistance(CourierBase):
+    courier_id: UUID
+    distance: float = Field(..., description='''Расстояние до точки доставки в метрах''')
+
+
+class OrderAssign(CourierBase):
+    updated_by: str
+
+
+class OrderAssignment(CourierBase):
+    order_id: UUID
+    zone_id: UUID
+    courier_id: UUID
+    candidates: List[CourierDistance]
+
+
+class CourierPing(CourierBase):
+    courier_id: UUID
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    recorded_at: Optional[datetime] = Field(
+        default=None,
+        description='''Время фиксации позиции на устройстве, по умолчанию - время получения''',
+    )
+
+
+class CourierTrackPoint(CourierBase):
+    recorded_at: datetime
+    latitude: float
+    longitude: float
+
+
+class PositionsIngested(CourierBase):
+    accepted: int
+    rejected: int
+
+
+class RouteStop(CourierBase):
+    order_id: UUID
+    delivery_id: UUID
+    latitude: float
+    longitude: float
+    distance: float = Field(..., description='''Расстояние от предыдущей точки маршрута в метрах''')
+
+
+class CourierRoute(CourierBase):
+    courier_id: UUID
+    delivery_date: date
+    distance: float = Field(..., description='''Длина маршрута в метрах''')
+    stops: List[RouteStop]
@@ -0,0 +1,68 @@
+import orjson
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+from uuid import UUID
+from pydantic import (
+    BaseModel,
+    Field,
+)
+
+from src.models.order import OrderStatus
+
+
+def orjson_dumps(v, *, default):
+    # orjson.dumps returns bytes, to match standard json.dumps we need to decode
+    # https://pydantic-docs.helpmanual.io/usage/exporting_models/#custom-json-deserialisation
+    return orjson.dumps(v, default=default).decode()    # pylint: disable=no-member
+
+
+class VersionBase(BaseModel):
+    id: UUID
+    version: int
+    created_at: datetime
+    updated_at: datetime
+    created_by: str
+    updated_by: str
+    valid_to: Optional[datetime] = Field(
+        default=None,
+        description='''Момент замены версии следующей (или удаления объекта), null - текущая версия''',
+    )
+
+    class Config:
+        json_loads = orjson.loads       # pylint: disable=no-member
+        json_dumps = orjson_dumps
+
+
+class OrderVersion(VersionBase):
+    customer_id: UUID
+    courier_id: Optional[UUID]
+    delivery_date: datetime
+    desctiption: Optional[str]
+    status: Optional[OrderStatus]
+
+
+class DeliveryVersion(VersionBase):
+    order_id: Optional[UUID]
+    zone_id: Optional[UUID]
+    longitude: float
+    latitude: float
+
+
+class FieldChange(BaseModel):
+    old: Any
+    new: Any
+
+
+class VersionDiff(BaseModel):
+    id: UUID
+    from_version: int
+    to_version: int
+    changes: Dict[str, FieldChange] = Field(
+        ...,
+        description='''Поля, значения которых различаются в двух версиях''',
+    )
+
+    class Config:
+        json_loads = orjson.loads       # pylint: disable=no-member
+        json_dumps = orjson_dumps
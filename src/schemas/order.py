@@ -35,7 +35,7 @@ class OrderBase(BaseModel):
 # Properties to receive on Order creation
 class OrderCreate(OrderBase):
     customer_id: UUID
-    courier_id: UUID
+    courier_id: Optional[UUID]
     delivery_date: datetime
 
     desctiption: Optional[str]
@@ -0,0 +1,42 @@
+import orjson
+
+from typing import Generic, List, Optional, TypeVar
+from pydantic import BaseModel, Field
+from pydantic.generics import GenericModel
+
+
+def orjson_dumps(v, *, default):
+    # orjson.dumps returns bytes, to match standard json.dumps we need to decode
+    # https://pydantic-docs.helpmanual.io/usage/exporting_models/#custom-json-deserialisation
+    return orjson.dumps(v, default=default).decode()    # pylint: disable=no-member
+
+
+ItemType = TypeVar('ItemType')
+
+
+class PageMeta(BaseModel):
+    next: Optional[str] = Field(
+        default=None,
+        description='''Курсор следующей страницы для page[after], null - страница последняя''',
+    )
+    total: Optional[int] = Field(
+        default=None,
+        description='''Число объектов с учётом фильтров, только при page[total]=true''',
+    )
+    total_estimated: Optional[bool] = Field(
+        default=None,
+        description='''true - total является оценкой планировщика PostgreSQL, а не точным COUNT''',
+    )
+
+    class Config:
+        json_loads = orjson.loads       # pylint: disable=no-member
+        json_dumps = orjson_dumps
+
+
+class Paginated(GenericModel, Generic[ItemType]):
+    data: List[ItemType]
+    meta: PageMeta
+
+    class Config:
+        json_loads = orjson.loads       # pylint: disable=no-member
+        json_dumps = orjson_dumps
@@ -1,10 +1,14 @@
+import numpy as np
 import orjson
 
 from datetime import datetime
-from typing import Optional, Any
+from typing import Optional, Any, List
 from uuid import UUID
 from pydantic import (
     BaseModel,
+    Field,
+    conlist,
+    validator,
 )
 
 
@@ -14,6 +18,23 @@ def orjson_dumps(v, *, default):
     return orjson.dumps(v, default=default).decode()    # pylint: disable=no-member
 
 
+def validate_coordinates(coordinates: Optional[List[float]]) -> Optional[List[float]]:
+    if coordinates is None:
+        return coordinates
+    if len(coordinates) % 2:
+        raise ValueError('coordinates must contain (longitude, latitude) pairs')
+    if len(coordinates) < 6:
+        raise ValueError('zone polygon must have at least 3 points')
+    # NaN и бесконечности не проходят сравнение, поэтому отсекаются той же проверкой
+    pairs = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    invalid = np.flatnonzero(~((np.abs(pairs[:, 0]) <= 180) & (np.abs(pairs[:, 1]) <= 90)))
+    if len(invalid):
+        raise ValueError(
+            f'point {int(invalid[0])} is out of range: longitude must be in [-180, 180], latitude in [-90, 90]'
+        )
+    return coordinates
+
+
 class ZoneBase(BaseModel):
 
     class Config:
@@ -25,8 +46,10 @@ class ZoneBase(BaseModel):
 # Properties to receive on Zone creation
 class ZoneCreate(ZoneBase):
     name: str
-    longitude: float
-    latitude: float
+    coordinates: List[float] = Field(
+        ...,
+        description='''Полигон зоны плоским списком `[lon0, lat0, lon1, lat1, ...]`''',
+    )
 
     created_by: str
     updated_by: Optional[str] 
@@ -35,20 +58,30 @@ class ZoneCreate(ZoneBase):
         super().__init__(**data)
         self.updated_by = self.created_by
 
+    _coordinates = validator('coordinates', allow_reuse=True)(validate_coordinates)
+
 
 class ZoneUpdate(ZoneBase):
     name: Optional[str]
-    longitude: Optional[float]
-    latitude: Optional[float]
+    coordinates: Optional[List[float]]
 
     updated_by: str
 
+    _coordinates = validator('coordinates', allow_reuse=True)(validate_coordinates)
+
 
 class ZoneInDBBase(ZoneBase):
     id: Optional[UUID]
     name: Optional[str]
-    longitude: Optional[float]
-    latitude: Optional[float]
+    coordinates: Optional[List[float]]
+
+    min_longitude: Optional[float]
+    min_latitude: Optional[float]
+    max_longitude: Optional[float]
+    max_latitude: Optional[float]
+    centroid_longitude: Optional[float]
+    centroid_latitude: Optional[float]
+    simplified_coordinates: Optional[List[float]]
 
     created_at: Optional[datetime]
     created_by: Optional[str]
@@ -60,3 +93,38 @@ class ZoneInDBBase(ZoneBase):
 
 class Zone(ZoneInDBBase):
     pass
+
+
+class ZoneLocation(ZoneBase):
+    zone_id: UUID
+    latitude: float
+    longitude: float
+
+
+class ZoneLocateBatch(ZoneBase):
+    # conlist вместо Tuple: схему кортежа FastAPI не может описать в OpenAPI
+    points: List[conlist(float, min_items=2, max_items=2)] = Field(     # type: ignore
+        ...,
+        description='''Список точек доставки в виде пар `[lat, lon]`''',
+    )
+
+    @validator('points')
+    def points_in_range(cls, points: List[List[float]]) -> List[List[float]]:
+        # Те же границы, что у параметров lat/lon в /locate; проверка одним проходом по массиву
+        pairs = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        invalid = np.flatnonzero(~((np.abs(pairs[:, 0]) <= 90) & (np.abs(pairs[:, 1]) <= 180)))
+        if len(invalid):
+            raise ValueError(
+                f'point {int(invalid[0])} is out of range: latitude must be in [-90, 90], longitude in [-180, 180]'
+            )
+        return points
+
+
+class ZoneDistance(ZoneBase):
+    zone_id: UUID
+    distance: float = Field(..., description='''Расстояние до границы зоны в метрах, 0 - точка внутри зоны''')
+
+
+class ZoneNeighbour(ZoneBase):
+    zone_id: UUID
+    relation: str = Field(..., description='''Связь с зоной: adjacent - соседняя, overlap - пересекается''')
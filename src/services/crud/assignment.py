@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from uuid import UUID
+from functools import lru_cache
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import (
+    Optional,
+    List,
+    Tuple,
+)
+
+from src.core.config.app_settings import AppSettings
+from src.core.exceptions import CourierNotAvailable
+from src.db import postgresql
+from src.models import courier as courier_model
+from src.models import order as order_model
+from src.schemas import courier as courier_schema
+from src.services.crud.order import orderService, get_order_service
+from src.services.crud.zone import ZoneService, get_zone_service
+from src.services.geo.couriers import CourierPositions, CourierState, get_courier_positions
+from src.services.geo.topology import ZoneTopology, get_zone_topology
+
+
+app_config = AppSettings()
+logger = logging.getLogger(__name__)
+
+
+class AssignmentService:
+    """ Назначение ближайшего свободного курьера на заказ.
+        Кандидаты ищутся в памяти процесса, PostgreSQL затрагивается одной
+        транзакцией: резервирование курьера в courier_reservations и запись
+        courier_id в заказ. Первичный ключ резервирования не даёт двум процессам
+        API занять одного курьера. Если в зоне никого нет, кандидаты ищутся
+        в соседних зонах по графу связей зон.
+    """
+
+    def __init__(
+        self, orders: orderService, zones: ZoneService, positions: CourierPositions, topology: ZoneTopology
+    ):
+        self.orders = orders
+        self.zones = zones
+        self.positions = positions
+        self.topology = topology
+
+    async def update_position(
+        self, courier_id: UUID, *, latitude: float, longitude: float, available: Optional[bool] = None
+    ) -> CourierState:
+        """ Store the courier position in the zone it belongs to
+
+        Args:
+            courier_id (UUID): Courier ID
+            latitude (float): courier latitude
+            longitude (float): courier longitude
+            available (Optional[bool]): new availability, None keeps the current one
+
+        Returns:
+            CourierState: courier state after the update
+        """
+        zone_id = await self.zones.locate(latitude=latitude, longitude=longitude)
+        return self.positions.update(
+            courier_id, zone_id=zone_id, latitude=latitude, longitude=longitude, available=available
+        )
+
+    async def nearest(
+        self, *, latitude: float, longitude: float, k: int
+    ) -> List[courier_schema.CourierDistance]:
+        """ Find k nearest available couriers in the zone of the point
+
+        Args:
+            latitude (float): delivery latitude
+            longitude (float): delivery longitude
+            k (int): number of couriers
+
+        Returns:
+            List[courier_schema.CourierDistance]: couriers ordered by distance
+        """
+        zone_id = await self.zones.locate(latitude=latitude, longitude=longitude)
+        if zone_id is None:
+            return []
+
+        return [
+            courier_schema.CourierDistance(courier_id=courier_id, distance=distance)
+            for courier_id, distance in self.positions.nearest(zone_id, latitude=latitude, longitude=longitude, k=k)
+        ]
+
+    def _nearest_in_neighbours(
+        self, zone_id: UUID, *, latitude: float, longitude: float, k: int
+    ) -> List[Tuple[UUID, float]]:
+        # Берём соседнюю зону с ближайшим свободным курьером
+        nearest = []
+        for neighbour_id in self.topology.neighbours(zone_id):
+            found = self.positions.nearest(neighbour_id, latitude=latitude, longitude=longitude, k=1)
+            if found:
+                nearest.append((found[0][1], neighbour_id))
+        if not nearest:
+            return []
+
+        _, neighbour_id = min(nearest, key=lambda item: item[0])
+        return self.positions.nearest(neighbour_id, latitude=latitude, longitude=longitude, k=k)
+
+    async def _reserve(self, db: AsyncSession, *, order_id: UUID, courier_id: UUID, updated_by: str) -> bool:
+        table = courier_model.CourierReservation.__table__
+        # Прежний курьер заказа освобождается той же транзакцией
+        await db.execute(delete(table).where(table.c.order_id == order_id))
+        reserved = (await db.execute(
+            insert(table).values(courier_id=courier_id, order_id=order_id)
+            .on_conflict_do_nothing().returning(table.c.courier_id)
+        )).first()
+        if reserved is None:
+            # Курьера уже зарезервировал другой процесс.
+            # Откат истекает объекты сессии, поэтому дальше используется только order_id
+            await db.rollback()
+            return False
+
+        await self.orders.update_by_id(
+            db, item_id=order_id, obj_in={'courier_id': courier_id, 'updated_by': updated_by}
+        )
+        return True
+
+    async def assign(
+        self, db: AsyncSession, *, order: order_model.Order, updated_by: str, k: Optional[int] = None
+    ) -> courier_schema.OrderAssignment:
+        """ Reserve the nearest available courier and assign it to the order
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            order (order_model.Order): Database model of order
+            updated_by (str): author of the change
+            k (Optional[int]): number of candidates to return
+
+        Raises:
+            CourierNotAvailable: order has no delivery point or no courier is free in its zone and neighbours,
+                or all candidates were reserved by other processes meanwhile
+
+        Returns:
+            courier_schema.OrderAssignment: assigned courier and the other candidates
+        """
+        delivery = order.delivery
+        if delivery is None:
+            raise CourierNotAvailable(order.id, 'order has no delivery point')
+
+        zone_id = await self.zones.locate(latitude=delivery.latitude, longitude=delivery.longitude, db=db)
+        zone_id = zone_id or delivery.zone_id
+        if zone_id is None:
+            raise CourierNotAvailable(order.id, 'delivery point is outside of all zones')
+
+        order_id, previous_courier_id = order.id, order.courier_id
+        k = k or app_config.geo.courier_candidates
+        candidates = self.positions.nearest(
+            zone_id, latitude=delivery.latitude, longitude=delivery.longitude, k=k
+        )
+        if not candidates:
+            candidates = self._nearest_in_neighbours(
+                zone_id, latitude=delivery.latitude, longitude=delivery.longitude, k=k
+            )
+        if not candidates:
+            raise CourierNotAvailable(order_id, 'no available courier in the zone and its neighbours')
+
+        for position, (courier_id, _) in enumerate(candidates):
+            if not await self._reserve(db, order_id=order_id, courier_id=courier_id, updated_by=updated_by):
+                # Копия резервирований отстала от БД: сверяем её, прежде чем пробовать следующего
+                await self.load_reservations(db)
+                continue
+
+            if previous_courier_id is not None:
+                self.positions.release(previous_courier_id, order_id)
+            self.positions.reserve(courier_id, order_id)
+            return courier_schema.OrderAssignment(
+                order_id=order_id,
+                zone_id=zone_id,
+                courier_id=courier_id,
+                candidates=[
+                    courier_schema.CourierDistance(courier_id=candidate_id, distance=distance)
+                    for candidate_id, distance in candidates[position:]
+                ],
+            )
+
+        raise CourierNotAvailable(order_id, 'all nearest couriers were reserved by other requests')
+
+    async def release(self, db: AsyncSession, courier_id: UUID) -> bool:
+        """ Make a reserved courier available again
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            courier_id (UUID): Courier ID
+
+        Returns:
+            bool: True if the courier had a reservation
+        """
+        table = courier_model.CourierReservation.__table__
+        order_id = (await db.execute(
+            delete(table).where(table.c.courier_id == courier_id).returning(table.c.order_id)
+        )).scalar()
+        await db.commit()
+        self.positions.release(courier_id)
+        return order_id is not None
+
+    async def load_reservations(self, db: AsyncSession) -> None:
+        """ Replace the in-memory reservations with the ones stored in the database
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+        """
+        table = courier_model.CourierReservation.__table__
+        rows = (await db.execute(select(table.c.courier_id, table.c.order_id))).all()
+        await db.commit()
+        self.positions.load_reservations({row.courier_id: row.order_id for row in rows})
+
+    async def run_refresher(self, interval: float) -> None:
+        """ Reload reservations made and released by other processes every `interval` seconds until cancelled """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with postgresql.SessionLocal() as db:
+                    await self.load_reservations(db)
+            except Exception:       # pylint: disable=broad-except
+                # Резервирования остаются прежними до следующей успешной сверки
+                logger.exception('Failed to reload courier reservations')
+
+
+@lru_cache
+def get_assignment_service() -> AssignmentService:
+    return AssignmentService(
+        get_order_service(),
+        get_zone_service(),
+        get_courier_positions(),
+        get_zone_topology(),
+    )
@@ -1,15 +1,50 @@
-from typing import TypeVar, Generic, Type, Optional, List, Union, Dict, Any
+import time
+import uuid
+from typing import TypeVar, Generic, Type, Optional, List, Sequence, Tuple, Union, Dict, Any
 from uuid import UUID
 
+import orjson
 from pydantic import BaseModel
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, delete, func, insert, inspect, literal_column, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from src.core.config.app_settings import AppSettings
+from src.core.modules import Cursor
 from src.models.base_mixins import BaseMixin
+from src.models.history_meta import Versioned, with_history
 
 ModelType = TypeVar("ModelType", bound=BaseMixin)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Строк в одном INSERT ... VALUES: держит число параметров ниже лимита asyncpg (32767)
+INSERT_CHUNK_SIZE = 1000
+
+app_config = AppSettings()
+
+# Посчитанные total по ключу запроса: (момент записи, total, оценка или нет)
+_count_cache: Dict[Tuple[str, str], Tuple[float, int, bool]] = {}
+# При таком размере кэша из него вычищаются устаревшие записи
+COUNT_CACHE_MAX_SIZE = 1024
+
+RELTUPLES = text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)").bindparams(
+    bindparam('table')
+)
+
+
+class Explain(Executable, ClauseElement):
+    """ EXPLAIN (FORMAT JSON) of a statement, the plan is returned as one row """
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
@@ -21,39 +56,142 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
 
-    async def get(self, db: Session, item_id: UUID) -> Optional[ModelType]:
-        return db.query(self.model).filter(self.model.id == item_id).first()
+    async def get(self, db: AsyncSession, item_id: UUID) -> Optional[ModelType]:
+        return await db.get(self.model, item_id)
+
+    async def list(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, options: Sequence[Any] = (),
+        where: Sequence[Any] = (),
+    ) -> List[ModelType]:
+        result = await db.execute(
+            select(self.model).options(*options).where(*where)
+            .order_by(self.model.created_at, self.model.id).offset(skip * limit).limit(limit)
+        )
+        return result.scalars().all()
+
+    async def list_after(
+        self, db: AsyncSession, *, after: Optional[Cursor] = None, limit: int = 100, options: Sequence[Any] = (),
+        where: Sequence[Any] = (),
+    ) -> Tuple[List[ModelType], Optional[Cursor]]:
+        # Keyset-пагинация по индексу (created_at, id): страница читается с места курсора
+        query = select(self.model).options(*options).where(*where).order_by(self.model.created_at, self.model.id).limit(limit + 1)
+        if after is not None:
+            query = query.where(tuple_(self.model.created_at, self.model.id) > after)
+
+        items = (await db.execute(query)).scalars().all()
+        if len(items) <= limit:
+            return items, None
+
+        items = items[:limit]
+        return items, (items[-1].created_at, items[-1].id)
 
-    async def list(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[ModelType]:
-        return db.query(self.model).offset(skip * limit).limit(limit).all()
+    async def count(self, db: AsyncSession, *, where: Sequence[Any] = ()) -> Tuple[int, bool]:
+        # Точный COUNT ограничен порогом: дальше строки не дочитываются, а берётся оценка планировщика
+        threshold = app_config.db.count_exact_threshold
+        rows = select(literal_column('1')).select_from(self.model).where(*where)
+        compiled = rows.compile()
+        key = (str(compiled), repr(sorted(compiled.params.items())))
+        now = time.monotonic()
+        cached = _count_cache.get(key)
+        if cached is not None and now - cached[0] < app_config.db.count_cache_ttl:
+            return cached[1], cached[2]
 
-    async def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
+        total = (await db.execute(select(func.count()).select_from(rows.limit(threshold + 1).subquery()))).scalar()
+        estimated = total > threshold
+        if estimated:
+            total = max(await self._estimate(db, rows, filtered=bool(where)), threshold + 1)
+
+        if len(_count_cache) >= COUNT_CACHE_MAX_SIZE:
+            for stale in [k for k, v in _count_cache.items() if now - v[0] >= app_config.db.count_cache_ttl]:
+                del _count_cache[stale]
+        _count_cache[key] = (now, total, estimated)
+        return total, estimated
+
+    async def _estimate(self, db: AsyncSession, rows, *, filtered: bool) -> int:
+        if not filtered:
+            # Без фильтров хватает статистики таблицы; -1 - таблица ещё не анализировалась
+            reltuples = (await db.execute(RELTUPLES, {'table': self.model.__tablename__})).scalar()
+            if reltuples is not None and reltuples >= 0:
+                return reltuples
+
+        plan = (await db.execute(Explain(rows))).scalar()
+        if isinstance(plan, (str, bytes)):
+            plan = orjson.loads(plan)       # pylint: disable=no-member
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
         db_obj = self.model(**obj_in.dict())       # type: ignore
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
         return db_obj
 
+    async def create_many(self, db: AsyncSession, *, objs_in: Sequence[CreateSchemaType]) -> List[UUID]:
+        # ID генерируются заранее, поэтому RETURNING не нужен, а порядок ID совпадает с порядком входа
+        rows = [{**obj_in.dict(), 'id': uuid.uuid4()} for obj_in in objs_in]
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            await db.execute(insert(self.model.__table__).values(rows[start:start + INSERT_CHUNK_SIZE]))
+        await db.commit()
+        return [row['id'] for row in rows]
+
     async def update(
-        self, db: Session, *, db_obj: ModelType, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+        self, db: AsyncSession, *, db_obj: ModelType, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj)
         if isinstance(obj_in, dict):
             update_data = obj_in
         else:
             update_data = obj_in.dict(exclude_unset=True)
 
-        for field in obj_data:
+        # Значения присваиваются как есть, без сериализации: колонки берутся из маппера
+        for field in inspect(db_obj).mapper.column_attrs.keys():
             if field in update_data:
                 setattr(db_obj, field, update_data.get(field))
 
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    def _update_statement(self, *, item_id: UUID, obj_in: Union[UpdateSchemaType, Dict[str, Any]]):
+        table = self.model.__table__
+        values = obj_in if isinstance(obj_in, dict) else obj_in.dict(exclude_unset=True)
+        query = update(table).where(table.c.id == item_id)
+        if issubclass(self.model, Versioned):
+            # Старая версия строки пишется в историю тем же запросом через CTE
+            query = with_history(query, self.model, table.c.id == item_id, columns=values)
+            values = {**values, 'version': table.c.version + 1}
+        return query.values(values).returning(*table.c)
+
+    async def _update_returning(
+        self, db: AsyncSession, *, item_id: UUID, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> Optional[ModelType]:
+        result = await db.execute(
+            select(self.model).from_statement(self._update_statement(item_id=item_id, obj_in=obj_in))
+            .execution_options(populate_existing=True)
+        )
+        return result.scalars().first()
+
+    async def update_by_id(
+        self, db: AsyncSession, *, item_id: UUID, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> Optional[ModelType]:
+        # UPDATE ... RETURNING одним запросом вместо чтения объекта, setattr и refresh
+        db_obj = await self._update_returning(db, item_id=item_id, obj_in=obj_in)
+        await db.commit()
+        return db_obj
+
+    async def remove_by_id(self, db: AsyncSession, *, item_id: UUID) -> Optional[ModelType]:
+        table = self.model.__table__
+        query = delete(table).where(table.c.id == item_id).returning(*table.c)
+        if issubclass(self.model, Versioned):
+            query = with_history(query, self.model, table.c.id == item_id)
+
+        result = await db.execute(select(self.model).from_statement(query))
+        db_obj = result.scalars().first()
+        await db.commit()
         return db_obj
 
-    async def remove(self, db: Session, *, item_id: UUID) -> ModelType:
-        remove_db_obj = db.query(self.model).get(item_id)
-        db.delete(remove_db_obj)
-        db.commit()
+    async def remove(self, db: AsyncSession, *, item_id: UUID) -> ModelType:
+        remove_db_obj = await db.get(self.model, item_id)
+        await db.delete(remove_db_obj)
+        await db.commit()
         return remove_db_obj
@@ -1,17 +1,23 @@
-from src.models.history_meta import versioned_session
 from uuid import UUID
 from functools import lru_cache
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import (
     Optional,
     List,
+    Sequence,
+    Tuple,
     Union,
     Dict,
     Any,
 )
 
+from src.core.filters import DeliveryFilter
+from src.core.modules import Cursor
 from src.schemas import delivery as delivery_schema
 from src.models import delivery as delivery_model
+from src.models import order as order_model
+from src.models import zone as zone_model
 from src.services.crud.base import CRUDBase
 
 
@@ -19,11 +25,11 @@ class DeliveryService(
     CRUDBase[delivery_model.Delivery, delivery_schema.DeliveryCreate, delivery_schema.DeliveryUpdate]
 ):
 
-    async def get(self, db: Session, item_id: UUID) -> Optional[delivery_model.Delivery]:
+    async def get(self, db: AsyncSession, item_id: UUID) -> Optional[delivery_model.Delivery]:
         """ Get Delivery by ID
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             item_id (UUID): Delivery ID
 
         Returns:
@@ -32,34 +38,131 @@ class DeliveryService(
 
         return await super().get(db, item_id)
 
-    async def list(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[delivery_model.Delivery]:
+    def where(self, filters: Optional[DeliveryFilter]) -> List[Any]:
+        """ SQL conditions of the delivery list filters
+
+        Args:
+            filters (Optional[DeliveryFilter]): list filters
+
+        Returns:
+            List[Any]: conditions joined with AND
+        """
+        if filters is None:
+            return []
+
+        conditions = []
+        if filters.order_id is not None:
+            conditions.append(self.model.order_id == filters.order_id)
+        if filters.zone_id is not None:
+            conditions.append(self.model.zone_id == filters.zone_id)
+        return conditions
+
+    async def list(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, filters: Optional[DeliveryFilter] = None
+    ) -> List[delivery_model.Delivery]:
         """ List of Deliverys
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             skip (int): page number
             limit (int): page limit
+            filters (Optional[DeliveryFilter]): list filters
 
         Returns:
             List[delivery_model.Delivery]: List of Deliverys
         """        """  """
-        return await super().list(db, skip=skip, limit=limit)
+        return await super().list(db, skip=skip, limit=limit, where=self.where(filters))
+
+    async def list_after(
+        self, db: AsyncSession, *, after: Optional[Cursor] = None, limit: int = 100,
+        filters: Optional[DeliveryFilter] = None,
+    ) -> Tuple[List[delivery_model.Delivery], Optional[Cursor]]:
+        """ Page of Deliverys after the cursor
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            after (Optional[Cursor]): (created_at, id) of the last delivery of the previous page
+            limit (int): page limit
+            filters (Optional[DeliveryFilter]): list filters
+
+        Returns:
+            Tuple[List[delivery_model.Delivery], Optional[Cursor]]: Deliverys and the cursor of the next page
+        """
+        return await super().list_after(db, after=after, limit=limit, where=self.where(filters))
+
+    async def count(self, db: AsyncSession, *, filters: Optional[DeliveryFilter] = None) -> Tuple[int, bool]:
+        """ Number of Deliverys matching the filters
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            filters (Optional[DeliveryFilter]): list filters
 
-    async def create(self, db: Session, *, obj_in: delivery_schema.DeliveryCreate) -> delivery_model.Delivery:
+        Returns:
+            Tuple[int, bool]: total and whether it is a planner estimate
+        """
+        return await super().count(db, where=self.where(filters))
+
+    async def create(self, db: AsyncSession, *, obj_in: delivery_schema.DeliveryCreate) -> delivery_model.Delivery:
         """Create a Delivery
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             obj_in (delivery_schema.DeliveryCreate): request parameters
 
         Returns:
             delivery_model.Delivery: Delivery full data
         """     
-        versioned_session(db)
         return await super().create(db, obj_in=obj_in)
 
+    async def create_many(
+        self, db: AsyncSession, *, objs_in: Sequence[delivery_schema.DeliveryCreate]
+    ) -> List[UUID]:
+        """Create Deliverys with multi-row INSERT in one transaction
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            objs_in (Sequence[delivery_schema.DeliveryCreate]): validated request items
+
+        Returns:
+            List[UUID]: Delivery IDs in the order of the items
+        """
+        return await super().create_many(db, objs_in=objs_in)
+
+    async def missing_references(
+        self, db: AsyncSession, *, objs_in: Sequence[delivery_schema.DeliveryCreate]
+    ) -> List[List[str]]:
+        """Check that orders and zones of the items exist
+
+        Each referenced table is queried once for the whole batch.
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            objs_in (Sequence[delivery_schema.DeliveryCreate]): validated request items
+
+        Returns:
+            List[List[str]]: names of the missing reference fields per item
+        """
+        order_ids = {obj_in.order_id for obj_in in objs_in}
+        zone_ids = {obj_in.zone_id for obj_in in objs_in}
+        found_orders = set((await db.execute(
+            select(order_model.Order.id).where(order_model.Order.id.in_(order_ids))
+        )).scalars().all()) if order_ids else set()
+        found_zones = set((await db.execute(
+            select(zone_model.Zone.id).where(zone_model.Zone.id.in_(zone_ids))
+        )).scalars().all()) if zone_ids else set()
+
+        missing = []
+        for obj_in in objs_in:
+            fields = []
+            if obj_in.order_id not in found_orders:
+                fields.append('order_id')
+            if obj_in.zone_id not in found_zones:
+                fields.append('zone_id')
+            missing.append(fields)
+        return missing
+
     async def update(
-        self, db: Session,
+        self, db: AsyncSession,
         *,
         db_obj: delivery_model.Delivery,
         obj_in: Union[delivery_schema.DeliveryUpdate, Dict[str, Any]]
@@ -67,27 +170,44 @@ class DeliveryService(
         """ Update Delivery
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             db_obj (delivery_model.Delivery): Database model of Delivery
             obj_in (Union[delivery_schema.DeliveryUpdate, Dict[str, Any]]): request parameters
 
         Returns:
             delivery_model.Delivery: Delivery full data
         """
-        versioned_session(db)
-        return await super().update(db, db_obj=db_obj, obj_in=obj_in)
+        return await self.update_by_id(db, item_id=db_obj.id, obj_in=obj_in)
 
-    async def remove(self, db: Session, *, item_id: UUID) -> delivery_model.Delivery:
-        """Delete Delivery
+    async def update_by_id(
+        self, db: AsyncSession,
+        *,
+        item_id: UUID,
+        obj_in: Union[delivery_schema.DeliveryUpdate, Dict[str, Any]]
+    ) -> Optional[delivery_model.Delivery]:
+        """ Update Delivery with a single UPDATE ... RETURNING, the old version goes to history
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             item_id (UUID): Delivery ID
+            obj_in (Union[delivery_schema.DeliveryUpdate, Dict[str, Any]]): request parameters
 
         Returns:
-            delivery_model.Delivery: Delivery full data
-        """        
-        return await super().remove(db, item_id=item_id)
+            Optional[delivery_model.Delivery]: Delivery full data or None if the delivery does not exist
+        """
+        return await super().update_by_id(db, item_id=item_id, obj_in=obj_in)
+
+    async def remove(self, db: AsyncSession, *, item_id: UUID) -> Optional[delivery_model.Delivery]:
+        """Delete Delivery with a single DELETE ... RETURNING, the last version goes to history
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            item_id (UUID): Delivery ID
+
+        Returns:
+            Optional[delivery_model.Delivery]: Delivery full data or None if the delivery does not exist
+        """
+        return await super().remove_by_id(db, item_id=item_id)
 
 
 @lru_cache
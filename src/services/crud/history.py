@@ -0,0 +1,234 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from uuid import UUID
+from sqlalchemy import DateTime, String, bindparam, column, func, literal_column, null, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+)
+
+from src.core.config.app_settings import AppSettings
+from src.models import delivery as delivery_model
+from src.models import order as order_model
+from src.models.history_archive import HistoryArchive
+from src.models.history_meta import HISTORY_OUTBOX
+from src.schemas.history import FieldChange, VersionDiff
+
+app_config = AppSettings()
+
+
+# Колонки служебные для сравнения версий
+DIFF_IGNORED = ('version', 'valid_to')
+
+# created_at пишется по часам приложения, changed - по часам БД: запас на расхождение часов.
+# Секции месячные, поэтому запас в сутки не добавляет лишних секций к чтению
+CLOCK_SKEW = timedelta(days=1)
+
+# Версии из записей history_outbox, ещё не развёрнутых воркером: строка собирается как в history_worker -
+# текущая строка, поверх неё старые значения из записей этой версии и более новых, ближайшая запись важнее
+PENDING_VERSIONS_SQL = """
+SELECT {columns}, pending.changed AS valid_to
+FROM history_outbox AS pending
+CROSS JOIN LATERAL jsonb_populate_record(
+    NULL::{history},
+    COALESCE((SELECT to_jsonb(live) FROM {table} AS live WHERE live.id = :item_id), '{{}}'::jsonb)
+    || COALESCE((
+        SELECT jsonb_object_agg(older.key, older.value) FROM (
+            SELECT DISTINCT ON (entry.key) entry.key, entry.value
+            FROM history_outbox AS record CROSS JOIN LATERAL jsonb_each(record.data) AS entry
+            WHERE record.table_name = :history_name AND record.row_id = :item_id
+                AND record.version >= pending.version
+            ORDER BY entry.key, record.version
+        ) AS older
+    ), '{{}}'::jsonb)
+    || jsonb_build_object('version', pending.version, 'changed', pending.changed)
+) AS version_row
+WHERE pending.table_name = :history_name AND pending.row_id = :item_id
+"""
+
+
+class HistoryService:
+    """ Чтение версий объекта: прошлые версии из таблицы истории и текущая из основной таблицы.
+        Каждый метод выполняет один запрос UNION ALL по индексу (id, changed)
+        или первичному ключу истории (id, version, changed).
+        Чтения ограничены снизу по changed, чтобы PostgreSQL отсекал секции истории, в которых версий объекта нет.
+        В режиме истории outbox в тот же запрос входят версии из ещё не развёрнутых записей history_outbox.
+        Версии, перенесённые в архив, дочитываются из него, только если в БД их может не быть.
+    """
+
+    def __init__(self, model, archive: Optional[HistoryArchive] = None):
+        self.model = model
+        self.archive = archive
+        self.table = model.__table__
+        self.history = model.__history_mapper__.local_table
+        self.columns = [column.key for column in self.table.c]
+
+    def _history(self, item_id: UUID, *where: Any):
+        return select(
+            *[self.history.c[key] for key in self.columns], self.history.c.changed.label('valid_to')
+        ).where(self.history.c.id == item_id, *where)
+
+    def _changed_bound(self, item_id: UUID):
+        # Версии объекта не старше его создания. Значение подзапроса известно при старте выполнения,
+        # и секции раньше него отсекаются. Для удалённого объекта строки нет - читаются все секции
+        created_at = select(self.table.c.created_at).where(self.table.c.id == item_id).scalar_subquery()
+        return self.history.c.changed >= func.coalesce(
+            created_at - CLOCK_SKEW, literal_column("'-infinity'::timestamp", DateTime)
+        )
+
+    def _current(self, item_id: UUID, *where: Any):
+        return select(
+            *[self.table.c[key] for key in self.columns], null().cast(DateTime).label('valid_to')
+        ).where(self.table.c.id == item_id, *where)
+
+    def _pending(self, item_id: UUID):
+        # Вне режима outbox записей нет, запрос к history_outbox не нужен
+        if not HISTORY_OUTBOX:
+            return None
+        return text(PENDING_VERSIONS_SQL.format(
+            columns=', '.join(f'version_row.{key}' for key in self.columns),
+            history=self.history.name,
+            table=self.table.name,
+        )).bindparams(
+            bindparam('item_id', item_id, type_=self.table.c.id.type),
+            bindparam('history_name', self.history.name, type_=String),
+        ).columns(
+            *[column(key, self.history.c[key].type) for key in self.columns], column('valid_to', DateTime)
+        ).subquery('outbox_versions')
+
+    async def _archived(self, item_id: UUID, changed_after: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        if self.archive is None:
+            return []
+        # Чтение и распаковка файлов архива блокируют, поэтому выполняются в пуле потоков
+        rows = await run_in_threadpool(self.archive.versions, self.history, item_id, changed_after)
+        return [{**{key: row[key] for key in self.columns}, 'valid_to': row['changed']} for row in rows]
+
+    async def as_of(self, db: AsyncSession, *, item_id: UUID, at: datetime) -> Optional[Dict[str, Any]]:
+        """ Version of the object that was current at the moment
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            item_id (UUID): object ID
+            at (datetime): moment in UTC
+
+        Returns:
+            Optional[Dict[str, Any]]: version or None if the object did not exist at the moment
+        """
+        if at.tzinfo is not None:
+            # В таблицах время хранится в UTC без часового пояса
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        # Действовавшая версия - первая, заменённая позже момента, иначе текущая строка
+        replaced = [self._history(item_id, self.history.c.changed > at).order_by(self.history.c.changed).limit(1)]
+        pending = self._pending(item_id)
+        if pending is not None:
+            replaced.append(select(pending).where(pending.c.valid_to > at).order_by(pending.c.valid_to).limit(1))
+        versions = union_all(*replaced, self._current(item_id)).subquery()
+        row = (await db.execute(
+            select(versions).order_by(versions.c.valid_to.asc().nulls_last()).limit(1)
+        )).mappings().first()
+        row = dict(row) if row is not None else None
+        if row is None or row['version'] > 1:
+            # В архиве версии старше оставшихся в БД: заменённая после момента версия может быть там
+            archived = [item for item in await self._archived(item_id, changed_after=at) if item['valid_to'] > at]
+            if archived:
+                row = archived[0]
+        if row is None or row['created_at'] > at:
+            return None
+        return row
+
+    async def versions(
+        self, db: AsyncSession, *, item_id: UUID, from_version: int = 1, to_version: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """ Versions of the object in the range, the current one included
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            item_id (UUID): object ID
+            from_version (int): first version
+            to_version (Optional[int]): last version, None - up to the current one
+
+        Returns:
+            List[Dict[str, Any]]: versions ordered by number
+        """
+        rows = [dict(row) for row in await self._select_versions(db, item_id, from_version, to_version)]
+        if not rows or rows[0]['version'] > from_version:
+            first = rows[0]['version'] if rows else None
+            archived = [
+                item for item in await self._archived(item_id)
+                if item['version'] >= from_version
+                and (to_version is None or item['version'] <= to_version)
+                and (first is None or item['version'] < first)
+            ]
+            rows = archived + rows
+        return rows
+
+    async def diff(
+        self, db: AsyncSession, *, item_id: UUID, from_version: int, to_version: int
+    ) -> Optional[VersionDiff]:
+        """ Fields that differ between two versions of the object
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            item_id (UUID): object ID
+            from_version (int): old version
+            to_version (int): new version
+
+        Returns:
+            Optional[VersionDiff]: changed fields or None if a version does not exist
+        """
+        found = {
+            row['version']: row
+            for row in await self._select_versions(db, item_id, versions=(from_version, to_version))
+        }
+        if from_version not in found or to_version not in found:
+            for item in await self._archived(item_id):
+                found.setdefault(item['version'], item)
+        if from_version not in found or to_version not in found:
+            return None
+
+        old, new = found[from_version], found[to_version]
+        changes = {
+            key: FieldChange(old=old[key], new=new[key])
+            for key in self.columns
+            if key not in DIFF_IGNORED and old[key] != new[key]
+        }
+        return VersionDiff(id=item_id, from_version=from_version, to_version=to_version, changes=changes)
+
+    async def _select_versions(
+        self, db: AsyncSession, item_id: UUID, from_version: int = 1, to_version: Optional[int] = None,
+        versions: Optional[Sequence[int]] = None,
+    ):
+        def where(version):
+            if versions is not None:
+                return [version.in_(versions)]
+            if to_version is not None:
+                return [version >= from_version, version <= to_version]
+            return [version >= from_version]
+
+        selects = [self._history(item_id, self._changed_bound(item_id), *where(self.history.c.version))]
+        pending = self._pending(item_id)
+        if pending is not None:
+            selects.append(select(pending).where(*where(pending.c.version)))
+        selects.append(self._current(item_id, *where(self.table.c.version)))
+        selected = union_all(*selects).subquery()
+        return (await db.execute(select(selected).order_by(selected.c.version))).mappings().all()
+
+
+@lru_cache
+def get_history_archive() -> HistoryArchive:
+    return HistoryArchive(app_config.db.history_archive_dir)
+
+
+@lru_cache
+def get_order_history_service() -> HistoryService:
+    return HistoryService(order_model.Order, get_history_archive())
+
+
+@lru_cache
+def get_delivery_history_service() -> HistoryService:
+    return HistoryService(delivery_model.Delivery, get_history_archive())
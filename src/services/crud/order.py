@@ -1,11 +1,18 @@
-from src.models.history_meta import versioned_session
+from src.models.history_meta import with_history
+import orjson
+
 from uuid import UUID
 from functools import lru_cache
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload
 from typing import (
+    AsyncIterator,
     Optional,
     List,
+    Sequence,
+    Set,
+    Tuple,
     Union,
     Dict,
     Any,
@@ -13,85 +20,318 @@ from typing import (
 
 from src.schemas import order as order_schema
 from src.models import order as order_model
+from src.models import courier as courier_model
+from src.models import delivery as delivery_model
+from src.core.filters import OrderFilter
+from src.core.modules import Cursor
 from src.services.crud.base import CRUDBase
+from src.services.geo.couriers import get_courier_positions
+
+
+# Связи, которые сериализует OrderFull: доставка и зона одной строкой через LEFT JOIN
+FULL_OPTIONS = (
+    joinedload(order_model.Order.delivery),
+    joinedload(order_model.Order.zone),
+)
+
+# Строк в одной выборке серверного курсора при выгрузке
+EXPORT_CHUNK_SIZE = 1000
 
 
 class orderService(CRUDBase[order_model.Order, order_schema.OrderCreate, order_schema.OrderUpdate]):
 
-    async def get(self, db: Session, item_id: UUID) -> Optional[order_model.Order]:
+    async def get(self, db: AsyncSession, item_id: UUID) -> Optional[order_model.Order]:
         """ Get order by ID
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             item_id (UUID): order ID
 
         Returns:
             Optional[order_model.Order]: order full data
         """
+        # Связи загружаются сразу: ленивая загрузка в AsyncSession недоступна
+        result = await db.execute(
+            select(self.model)
+            .options(*FULL_OPTIONS)
+            .where(self.model.id == item_id)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalars().first()
+
+    def where(self, filters: Optional[OrderFilter]) -> List[Any]:
+        """ SQL conditions of the order list filters
+
+        Args:
+            filters (Optional[OrderFilter]): list filters
+
+        Returns:
+            List[Any]: conditions joined with AND
+        """
+        if filters is None:
+            return []
 
-        return await super().get(db, item_id)
+        order = self.model
+        conditions = []
+        if filters.customer_id is not None:
+            conditions.append(order.customer_id == filters.customer_id)
+        if filters.courier_id is not None:
+            conditions.append(order.courier_id == filters.courier_id)
+        if filters.status:
+            conditions.append(order.status.in_(filters.status))
+        if filters.active is not None:
+            # Условие совпадает с условием частичных индексов ix_orders_active_*
+            delivered = order.status == order_model.OrderStatus.DELIVERED
+            conditions.append(~delivered if filters.active else delivered)
+        if filters.date_from is not None:
+            conditions.append(order.delivery_date >= filters.date_from)
+        if filters.date_to is not None:
+            conditions.append(order.delivery_date < filters.date_to)
+        if filters.zone_id is not None:
+            # Подзапрос вместо JOIN, чтобы не дублировать заказы и не мешать joinedload
+            delivery = delivery_model.Delivery
+            conditions.append(order.id.in_(select(delivery.order_id).where(delivery.zone_id == filters.zone_id)))
+        return conditions
 
-    async def list(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[order_model.Order]:
+    async def list(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, full: bool = False,
+        filters: Optional[OrderFilter] = None,
+    ) -> List[order_model.Order]:
         """ List of orders
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             skip (int): page number
             limit (int): page limit
+            full (bool): load delivery and zone in the same query
+            filters (Optional[OrderFilter]): list filters
 
         Returns:
             List[order_model.Order]: List of orders
         """        """  """
-        return await super().list(db, skip=skip, limit=limit)
+        return await super().list(
+            db, skip=skip, limit=limit, options=FULL_OPTIONS if full else (), where=self.where(filters)
+        )
+
+    async def list_after(
+        self, db: AsyncSession, *, after: Optional[Cursor] = None, limit: int = 100, full: bool = False,
+        filters: Optional[OrderFilter] = None,
+    ) -> Tuple[List[order_model.Order], Optional[Cursor]]:
+        """ Page of orders after the cursor
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            after (Optional[Cursor]): (created_at, id) of the last order of the previous page
+            limit (int): page limit
+            full (bool): load delivery and zone in the same query
+            filters (Optional[OrderFilter]): list filters
+
+        Returns:
+            Tuple[List[order_model.Order], Optional[Cursor]]: orders and the cursor of the next page
+        """
+        return await super().list_after(
+            db, after=after, limit=limit, options=FULL_OPTIONS if full else (), where=self.where(filters)
+        )
+
+    async def count(self, db: AsyncSession, *, filters: Optional[OrderFilter] = None) -> Tuple[int, bool]:
+        """ Number of orders matching the filters
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            filters (Optional[OrderFilter]): list filters
+
+        Returns:
+            Tuple[int, bool]: total and whether it is a planner estimate
+        """
+        return await super().count(db, where=self.where(filters))
+
+    async def export(self, db: AsyncSession, *, filters: Optional[OrderFilter] = None) -> AsyncIterator[bytes]:
+        """ Stream orders as NDJSON from a server-side cursor
+
+        Rows are read in chunks of EXPORT_CHUNK_SIZE as plain tuples, without
+        ORM objects, so memory does not grow with the number of orders.
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            filters (Optional[OrderFilter]): list filters
+
+        Returns:
+            AsyncIterator[bytes]: chunks of NDJSON lines, one order per line with its zone_id
+        """
+        order, delivery = self.model, delivery_model.Delivery
+        query = select(
+            *order.__table__.c, delivery.zone_id
+        ).outerjoin(delivery, delivery.order_id == order.id).where(
+            *self.where(filters)
+        ).order_by(order.delivery_date, order.id)
 
-    async def create(self, db: Session, *, obj_in: order_schema.OrderCreate) -> order_model.Order:
+        result = await db.stream(query)
+        async for rows in result.mappings().partitions(EXPORT_CHUNK_SIZE):
+            yield b''.join(
+                orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE)      # pylint: disable=no-member
+                for row in rows
+            )
+
+    async def create(self, db: AsyncSession, *, obj_in: order_schema.OrderCreate) -> order_model.Order:
         """Create a order
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             obj_in (order_schema.orderCreate): request parameters
 
         Returns:
             order_model.order: order full data
         """     
-        versioned_session(db)
-        data_in_obj = jsonable_encoder(obj_in)
-        db_obj = order_model.Order(**data_in_obj)
-        db_obj.status = obj_in.status
+        # dict() сохраняет datetime/UUID: asyncpg не приводит строки к timestamp и uuid
+        db_obj = order_model.Order(**obj_in.dict())
 
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        await db.commit()
+
+        return await self.get(db, db_obj.id)
+
+    async def create_many(self, db: AsyncSession, *, objs_in: Sequence[order_schema.OrderCreate]) -> List[UUID]:
+        """Create orders with multi-row INSERT in one transaction
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            objs_in (Sequence[order_schema.OrderCreate]): validated request items
+
+        Returns:
+            List[UUID]: order IDs in the order of the items
+        """
+        return await super().create_many(db, objs_in=objs_in)
+
+    async def update_status_many(
+        self, db: AsyncSession, *, statuses: Dict[UUID, order_model.OrderStatus], updated_by: str
+    ) -> Set[UUID]:
+        """Set statuses of many orders in one transaction
+
+        Orders are grouped by the new status; each group is written with one
+        UPDATE that copies the old rows into the history table through a CTE.
+        Orders already in the requested status are left untouched.
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            statuses (Dict[UUID, order_model.OrderStatus]): new status by order ID
+            updated_by (str): author of the change
+
+        Returns:
+            Set[UUID]: IDs of the existing orders
+        """
+        table = self.model.__table__
+        found = set((await db.execute(
+            select(table.c.id).where(table.c.id.in_(list(statuses)))
+        )).scalars().all()) if statuses else set()
 
-        return db_obj
+        groups: Dict[order_model.OrderStatus, List[UUID]] = {}
+        for order_id, status in statuses.items():
+            if order_id in found:
+                groups.setdefault(status, []).append(order_id)
+
+        released = []
+        for status, order_ids in groups.items():
+            changed = and_(table.c.id.in_(order_ids), table.c.status != status)
+            # Старые версии строк пишутся в историю тем же запросом: CTE блокирует их до UPDATE
+            query = with_history(update(table).where(changed), self.model, changed, columns=('status', 'updated_by'))
+            result = await db.execute(
+                query.values(
+                    status=status, updated_by=updated_by, version=table.c.version + 1,
+                ).returning(table.c.id, table.c.courier_id)
+            )
+            if status == order_model.OrderStatus.DELIVERED:
+                released.extend(row for row in result.all() if row.courier_id is not None)
+        if released:
+            reservation = courier_model.CourierReservation.__table__
+            await db.execute(delete(reservation).where(reservation.c.order_id.in_([row.id for row in released])))
+        await db.commit()
+
+        # Доставленные заказы освобождают зарезервированных под них курьеров
+        positions = get_courier_positions()
+        for order_id, courier_id in released:
+            positions.release(courier_id, order_id)
+        return found
 
     async def update(
-        self, db: Session, *, db_obj: order_model.Order, obj_in: Union[order_schema.OrderUpdate, Dict[str, Any]]
+        self, db: AsyncSession, *, db_obj: order_model.Order, obj_in: Union[order_schema.OrderUpdate, Dict[str, Any]]
     ) -> order_model.Order:
         """ Update order
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             db_obj (order_model.Order): Database model of order
             obj_in (Union[order_schema.OrderUpdate, Dict[str, Any]]): request parameters
 
         Returns:
             order_model.Order: order full data
         """
-        versioned_session(db)
-        return await super().update(db, db_obj=db_obj, obj_in=obj_in)
+        return await self.update_by_id(db, item_id=db_obj.id, obj_in=obj_in)
 
-    async def remove(self, db: Session, *, item_id: UUID) -> order_model.Order:
-        """Delete order
+    async def update_by_id(
+        self, db: AsyncSession, *, item_id: UUID, obj_in: Union[order_schema.OrderUpdate, Dict[str, Any]]
+    ) -> Optional[order_model.Order]:
+        """ Update order with a single UPDATE ... RETURNING, the old version goes to history
+
+        Delivery and zone are joined to the updated row in the same statement.
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             item_id (UUID): order ID
+            obj_in (Union[order_schema.OrderUpdate, Dict[str, Any]]): request parameters
 
         Returns:
-            order_model.Order: order full data
-        """        
-        return await super().remove(db, item_id=item_id)
+            Optional[order_model.Order]: order full data or None if the order does not exist
+        """
+        # Строка из RETURNING соединяется с доставкой и зоной тем же запросом, повторное чтение заказа не нужно
+        updated = aliased(self.model, self._update_statement(item_id=item_id, obj_in=obj_in).cte('updated'))
+        result = await db.execute(
+            select(updated)
+            .options(joinedload(updated.delivery), joinedload(updated.zone))
+            .execution_options(populate_existing=True)
+        )
+        order = result.scalars().first()
+        # Доставленный заказ освобождает зарезервированного под него курьера
+        released = (
+            order is not None and order.courier_id is not None and order.status == order_model.OrderStatus.DELIVERED
+        )
+        if released:
+            reservation = courier_model.CourierReservation.__table__
+            await db.execute(delete(reservation).where(reservation.c.order_id == order.id))
+        await db.commit()
+        if order is None:
+            return None
+
+        if released:
+            get_courier_positions().release(order.courier_id, order.id)
+        return order
+
+    async def remove(self, db: AsyncSession, *, item_id: UUID) -> Optional[order_model.Order]:
+        """Delete order with its delivery, last versions of both go to history
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            item_id (UUID): order ID
+
+        Returns:
+            Optional[order_model.Order]: order full data or None if the order does not exist
+        """
+        # Ответ содержит доставку и зону, поэтому заказ читается до удаления
+        order = await self.get(db, item_id)
+        if order is None:
+            return None
+
+        delivery = delivery_model.Delivery.__table__
+        await db.execute(with_history(
+            delete(delivery).where(delivery.c.order_id == item_id),
+            delivery_model.Delivery, delivery.c.order_id == item_id,
+        ))
+        table = self.model.__table__
+        await db.execute(with_history(delete(table).where(table.c.id == item_id), self.model, table.c.id == item_id))
+        await db.commit()
+        # Резервирование курьера удалено каскадом вместе с заказом
+        if order.courier_id is not None:
+            get_courier_positions().release(order.courier_id, order.id)
+        return order
 
 
 @lru_cache
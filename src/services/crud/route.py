@@ -0,0 +1,105 @@
+from datetime import date, datetime, time, timedelta
+from uuid import UUID
+from functools import lru_cache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+
+import numpy as np
+
+from src.core.config.app_settings import AppSettings
+from src.models import order as order_model
+from src.models import delivery as delivery_model
+from src.schemas import courier as courier_schema
+from src.services.geo.couriers import CourierPositions, get_courier_positions
+from src.services.geo.route import sequence_route
+
+
+app_config = AppSettings()
+
+
+class RouteService:
+    """ Порядок объезда доставок курьера за день.
+        Маршрут строится жадно от текущей позиции курьера и улучшается 2-opt
+        в пределах бюджета времени.
+    """
+
+    def __init__(self, positions: CourierPositions, time_budget: float):
+        self.positions = positions
+        self.time_budget = time_budget
+
+    async def sequence(
+        self, db: AsyncSession, *, courier_id: UUID, delivery_date: date,
+        latitude: Optional[float] = None, longitude: Optional[float] = None,
+    ) -> courier_schema.CourierRoute:
+        """ Order courier deliveries of the day into a short route
+
+        Delivered orders are skipped. The route starts at the given point, at
+        the last known courier position otherwise, or at the first delivery.
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            courier_id (UUID): Courier ID
+            delivery_date (date): day of the deliveries
+            latitude (Optional[float]): start point latitude
+            longitude (Optional[float]): start point longitude
+
+        Returns:
+            courier_schema.CourierRoute: deliveries in visiting order
+        """
+        day = datetime.combine(delivery_date, time.min)
+        delivery = delivery_model.Delivery
+        order = order_model.Order
+        stops = (await db.execute(
+            select(delivery.order_id, delivery.id, delivery.latitude, delivery.longitude).join(
+                order, order.id == delivery.order_id
+            ).where(
+                order.courier_id == courier_id,
+                order.delivery_date >= day,
+                order.delivery_date < day + timedelta(days=1),
+                order.status != order_model.OrderStatus.DELIVERED,
+            ).order_by(order.delivery_date, delivery.created_at)
+        )).all()
+
+        route = courier_schema.CourierRoute(courier_id=courier_id, delivery_date=delivery_date, distance=0, stops=[])
+        if not stops:
+            return route
+
+        if latitude is None or longitude is None:
+            state = self.positions.get(courier_id)
+            if state is not None:
+                latitude, longitude = state.latitude, state.longitude
+
+        points = np.array([(stop.latitude, stop.longitude) for stop in stops], dtype=np.float64)
+        has_start = latitude is not None and longitude is not None
+        if has_start:
+            # Позиция курьера - фиксированная первая точка маршрута
+            points = np.vstack([[latitude, longitude], points])
+
+        path, legs = await run_in_threadpool(
+            sequence_route, points[:, 0], points[:, 1], start=0, time_budget=self.time_budget
+        )
+        if has_start:
+            path, legs = [index - 1 for index in path[1:]], legs[1:]
+
+        route.stops = [
+            courier_schema.RouteStop(
+                order_id=stops[index].order_id,
+                delivery_id=stops[index].id,
+                latitude=stops[index].latitude,
+                longitude=stops[index].longitude,
+                distance=distance,
+            )
+            for index, distance in zip(path, legs)
+        ]
+        route.distance = sum(legs)
+        return route
+
+
+@lru_cache
+def get_route_service() -> RouteService:
+    return RouteService(
+        get_courier_positions(),
+        time_budget=app_config.geo.route_time_budget,
+    )
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from uuid import UUID
+from functools import lru_cache
+from typing import (
+    Optional,
+    List,
+    Dict,
+    Any,
+    Iterable,
+)
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config.app_settings import AppSettings
+from src.db import postgresql
+from src.models import courier as courier_model
+from src.schemas import courier as courier_schema
+from src.services.crud.assignment import AssignmentService, get_assignment_service
+from src.services.geo.tracks import TrackBuffer
+
+
+app_config = AppSettings()
+logger = logging.getLogger(__name__)
+
+# Ограничение числа параметров в одном INSERT (5 колонок на строку)
+INSERT_CHUNK_SIZE = 5_000
+# Сколько несохранённых позиций держать в памяти, пока БД недоступна
+MAX_PENDING_FLUSHES = 50
+# Сколько позиций других процессов читать за один запрос
+POSITION_SYNC_CHUNK = 10_000
+
+
+def to_timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class TrackingService:
+    """ Приём потока GPS-позиций курьеров.
+        Последние позиции хранятся в кольцевых буферах в памяти, в БД они
+        пишутся пачками по размеру или по таймеру фонового сборщика.
+        Позиции, принятые другими процессами API, подтягиваются из courier_positions в фоне.
+    """
+
+    def __init__(self, assignment: AssignmentService, tracks: TrackBuffer, flush_size: int, flush_interval: float):
+        self.assignment = assignment
+        self.tracks = tracks
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_needed: Optional[asyncio.Event] = None
+        # Последний прочитанный id courier_positions, None - чтение ещё не начато
+        self._last_position_id: Optional[int] = None
+
+    async def ingest(self, pings: Iterable[courier_schema.CourierPing]) -> int:
+        """ Accept courier positions
+
+        Args:
+            pings (Iterable[courier_schema.CourierPing]): courier positions
+
+        Returns:
+            int: number of accepted positions
+        """
+        accepted = 0
+        received_at = datetime.utcnow()
+        for ping in pings:
+            recorded_at = ping.recorded_at or received_at
+            if recorded_at.tzinfo is not None:
+                recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+            timestamp = to_timestamp(recorded_at)
+            latest = self.tracks.latest(ping.courier_id)
+            self.tracks.append(ping.courier_id, timestamp, ping.latitude, ping.longitude)
+            if latest is None or latest['recorded_at'] <= timestamp:
+                zone_id = (await self.assignment.update_position(
+                    ping.courier_id, latitude=ping.latitude, longitude=ping.longitude
+                )).zone_id
+            else:
+                # Опоздавшая позиция попадает в трек и в БД, но не сдвигает курьера назад
+                zone_id = await self.assignment.zones.locate(latitude=ping.latitude, longitude=ping.longitude)
+            self._pending.append({
+                'courier_id': ping.courier_id,
+                'zone_id': zone_id,
+                'recorded_at': recorded_at,
+                'latitude': ping.latitude,
+                'longitude': ping.longitude,
+            })
+            accepted += 1
+
+        if len(self._pending) >= self.flush_size and self._flush_needed is not None:
+            self._flush_needed.set()
+        return accepted
+
+    async def latest(self, courier_id: UUID) -> Optional[courier_schema.CourierTrackPoint]:
+        """ Latest known courier position
+
+        Args:
+            courier_id (UUID): Courier ID
+
+        Returns:
+            Optional[courier_schema.CourierTrackPoint]: courier position
+        """
+        point = self.tracks.latest(courier_id)
+        if point is None:
+            return None
+
+        recorded_at, latitude, longitude = point.tolist()
+        return courier_schema.CourierTrackPoint(
+            recorded_at=datetime.utcfromtimestamp(recorded_at), latitude=latitude, longitude=longitude
+        )
+
+    async def track(self, courier_id: UUID) -> List[courier_schema.CourierTrackPoint]:
+        """ Recent courier positions from the oldest to the newest
+
+        Args:
+            courier_id (UUID): Courier ID
+
+        Returns:
+            List[courier_schema.CourierTrackPoint]: courier positions
+        """
+        return [
+            courier_schema.CourierTrackPoint(
+                recorded_at=datetime.utcfromtimestamp(recorded_at), latitude=latitude, longitude=longitude
+            )
+            for recorded_at, latitude, longitude in self.tracks.recent(courier_id).tolist()
+        ]
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        async with postgresql.SessionLocal() as db:
+            table = courier_model.CourierPosition.__table__
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                await db.execute(insert(table).values(rows[start:start + INSERT_CHUNK_SIZE]))
+            await db.commit()
+
+    async def flush(self) -> int:
+        """ Write pending positions with multi-row INSERTs in one transaction
+
+        Returns:
+            int: number of written positions
+        """
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        try:
+            await self._write(rows)
+        except Exception:       # pylint: disable=broad-except
+            logger.exception('Failed to flush %s courier positions', len(rows))
+            # Возвращаем позиции в очередь, отбрасывая самые старые, если БД недоступна долго
+            self._pending = (rows + self._pending)[-MAX_PENDING_FLUSHES * self.flush_size:]
+            return 0
+
+        return len(rows)
+
+    async def load_positions(self, db: AsyncSession) -> int:
+        """ Apply positions written by other API processes since the previous call
+
+        The first call only remembers where the table ends. Positions older
+        than the latest known one of the courier, including the ones this
+        process wrote itself, are skipped.
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+
+        Returns:
+            int: number of applied positions
+        """
+        table = courier_model.CourierPosition.__table__
+        if self._last_position_id is None:
+            self._last_position_id = (await db.execute(select(func.coalesce(func.max(table.c.id), 0)))).scalar()
+            await db.commit()
+            return 0
+
+        # Строки, закоммиченные позже строк с большим id, пропускаются: их перекроет следующая позиция курьера
+        applied = 0
+        while True:
+            rows = (await db.execute(
+                select(table).where(table.c.id > self._last_position_id).order_by(table.c.id).limit(POSITION_SYNC_CHUNK)
+            )).all()
+            await db.commit()
+            for row in rows:
+                recorded_at = to_timestamp(row.recorded_at)
+                latest = self.tracks.latest(row.courier_id)
+                if latest is not None and latest['recorded_at'] >= recorded_at:
+                    continue
+                self.tracks.append(row.courier_id, recorded_at, row.latitude, row.longitude)
+                self.assignment.positions.update(
+                    row.courier_id, zone_id=row.zone_id, latitude=row.latitude, longitude=row.longitude
+                )
+                applied += 1
+
+            if rows:
+                self._last_position_id = rows[-1].id
+            if len(rows) < POSITION_SYNC_CHUNK:
+                return applied
+
+    async def run_refresher(self, interval: float) -> None:
+        """ Load positions of other processes every `interval` seconds until cancelled """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with postgresql.SessionLocal() as db:
+                    await self.load_positions(db)
+            except Exception:       # pylint: disable=broad-except
+                # Позиции дочитываются со старого места при следующей успешной попытке
+                logger.exception('Failed to load courier positions')
+
+    async def run_flusher(self) -> None:
+        """ Background task flushing positions by size or by timer """
+        self._flush_needed = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            await self.flush()
+
+
+@lru_cache
+def get_tracking_service() -> TrackingService:
+    return TrackingService(
+        get_assignment_service(),
+        TrackBuffer(app_config.geo.courier_track_size),
+        flush_size=app_config.geo.position_flush_size,
+        flush_interval=app_config.geo.position_flush_interval,
+    )
@@ -1,7 +1,11 @@
-from src.models.history_meta import versioned_session
+import asyncio
+import logging
 from uuid import UUID
+from math import cos, radians
+import numpy as np
 from functools import lru_cache
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import (
     Optional,
     List,
@@ -10,18 +14,85 @@ from typing import (
     Any,
 )
 
+from src.core.config.app_settings import AppSettings
+from src.core.exceptions import ZoneOverlapError
+from src.db import postgresql
 from src.schemas import zone as zone_schema
 from src.models import zone as zone_model
 from src.services.crud.base import CRUDBase
+from src.services.geo.polygon import BBox, OVERLAP, Polygon, relate, zone_geometry
+from src.services.geo.topology import get_zone_topology
+from src.services.geo.zone_index import ZoneIndex, get_zone_index
+
+
+app_config = AppSettings()
+logger = logging.getLogger(__name__)
+METERS_PER_DEGREE = 111_320
+
+HAS_GEOMETRY_SQL = text(
+    "SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'zones' AND column_name = 'geom')"
+)
+CONTAINING_ZONE_SQL = text(
+    "SELECT id FROM zones "
+    "WHERE ST_Contains(geom, ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)) "
+    "ORDER BY created_at LIMIT 1"
+)
+NEAREST_ZONES_SQL = text(
+    "SELECT zones.id AS zone_id, ST_Distance(zones.geom::geography, point.geog) AS distance "
+    "FROM zones, (SELECT ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography AS geog) AS point "
+    "WHERE ST_DWithin(zones.geom::geography, point.geog, :radius) "
+    "ORDER BY zones.geom::geography <-> point.geog LIMIT :limit"
+)
+
+
+ZONE_GENERATION = select(zone_model.ZoneState.generation).where(zone_model.ZoneState.id == 1)
+ZONE_STATE = select(zone_model.ZoneState.generation, zone_model.ZoneState.topology_built).where(
+    zone_model.ZoneState.id == 1
+)
+# Записи зон выполняются по одной: проверка пересечений и запись не разделяются чужой записью
+ZONE_LOCK_KEY = 'zones'
+ZONE_WRITE_LOCK = select(func.pg_advisory_xact_lock(func.hashtext(ZONE_LOCK_KEY)))
+BUMP_ZONE_GENERATION = (
+    update(zone_model.ZoneState)
+    .where(zone_model.ZoneState.id == 1)
+    .values(generation=zone_model.ZoneState.generation + 1)
+    .returning(zone_model.ZoneState.generation)
+)
+
+
+def derived_fields(coordinates: List[float]) -> Dict[str, Any]:
+    """ Bounding box, centroid and simplified polygon persisted along with coordinates """
+    geometry = zone_geometry(coordinates, app_config.geo.zone_simplify_tolerance)
+    min_longitude, min_latitude, max_longitude, max_latitude = geometry.bbox
+    return {
+        'min_longitude': min_longitude,
+        'min_latitude': min_latitude,
+        'max_longitude': max_longitude,
+        'max_latitude': max_latitude,
+        'centroid_longitude': geometry.centroid[0],
+        'centroid_latitude': geometry.centroid[1],
+        'simplified_coordinates': geometry.simplified,
+    }
+
+
+def expand_bbox(bbox: BBox, distance: float) -> BBox:
+    """ Bounding box widened by the distance in meters """
+    min_longitude, min_latitude, max_longitude, max_latitude = bbox
+    delta_lat = distance / METERS_PER_DEGREE
+    delta_lon = distance / (METERS_PER_DEGREE * max(cos(radians(max(abs(min_latitude), abs(max_latitude)))), 0.01))
+    return min_longitude - delta_lon, min_latitude - delta_lat, max_longitude + delta_lon, max_latitude + delta_lat
 
 
 class ZoneService(CRUDBase[zone_model.Zone, zone_schema.ZoneCreate, zone_schema.ZoneUpdate]):
+    # Наличие колонки zones.geom (PostGIS) проверяется один раз на процесс
+    _has_geometry: Optional[bool] = None
 
-    async def get(self, db: Session, item_id: UUID) -> Optional[zone_model.Zone]:
+    async def get(self, db: AsyncSession, item_id: UUID) -> Optional[zone_model.Zone]:
         """ Get Zone by ID
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             item_id (UUID): Zone ID
 
         Returns:
@@ -30,11 +101,11 @@ class ZoneService(CRUDBase[zone_model.Zone, zone_schema.ZoneCreate, zone_schema.
 
         return await super().get(db, item_id)
 
-    async def list(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[zone_model.Zone]:
+    async def list(self, db: AsyncSession, *, skip: int = 0, limit: int = 100) -> List[zone_model.Zone]:
         """ List of Zones
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             skip (int): page number
             limit (int): page limit
 
@@ -43,46 +114,402 @@ class ZoneService(CRUDBase[zone_model.Zone, zone_schema.ZoneCreate, zone_schema.
         """        """  """
         return await super().list(db, skip=skip, limit=limit)
 
-    async def create(self, db: Session, *, obj_in: zone_schema.ZoneCreate) -> zone_model.Zone:
+    async def create(self, db: AsyncSession, *, obj_in: zone_schema.ZoneCreate) -> zone_model.Zone:
         """Create a Zone
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             obj_in (zone_schema.ZoneCreate): request parameters
 
+        Raises:
+            ZoneOverlapError: the zone overlaps other zones and the policy is `reject`
+
         Returns:
             zone_model.Zone: Zone full data
         """     
-        versioned_session(db)
-        return await super().create(db, obj_in=obj_in)
+        await db.execute(ZONE_WRITE_LOCK)
+        links = await self.check_topology(db, coordinates=obj_in.coordinates)
+
+        zone = zone_model.Zone(**obj_in.dict(), **derived_fields(obj_in.coordinates))
+
+        db.add(zone)
+        await db.flush()
+        await self._store_links(db, zone.id, links)
+        generation = await self._bump_generation(db)
+        await db.commit()
+        await db.refresh(zone)
+
+        get_zone_index().upsert(zone.id, zone.coordinates)
+        get_zone_topology().set(zone.id, links)
+        get_zone_index().advance(generation)
+        return zone
 
     async def update(
-        self, db: Session, *, db_obj: zone_model.Zone, obj_in: Union[zone_schema.ZoneUpdate, Dict[str, Any]]
+        self, db: AsyncSession, *, db_obj: zone_model.Zone, obj_in: Union[zone_schema.ZoneUpdate, Dict[str, Any]]
     ) -> zone_model.Zone:
         """ Update Zone
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             db_obj (zone_model.Zone): Database model of Zone
             obj_in (Union[zone_schema.ZoneUpdate, Dict[str, Any]]): request parameters
 
+        Raises:
+            ZoneOverlapError: new coordinates overlap other zones and the policy is `reject`
+
         Returns:
             zone_model.Zone: Zone full data
         """
-        versioned_session(db)
-        return await super().update(db, db_obj=db_obj, obj_in=obj_in)
+        return await self.update_by_id(db, item_id=db_obj.id, obj_in=obj_in)
 
-    async def remove(self, db: Session, *, item_id: UUID) -> zone_model.Zone:
-        """Delete Zone
+    async def update_by_id(
+        self, db: AsyncSession, *, item_id: UUID, obj_in: Union[zone_schema.ZoneUpdate, Dict[str, Any]]
+    ) -> Optional[zone_model.Zone]:
+        """ Update Zone with a single UPDATE ... RETURNING
 
         Args:
-            db (Session): SQLAlchemy Session
+            db (AsyncSession): SQLAlchemy AsyncSession
             item_id (UUID): Zone ID
+            obj_in (Union[zone_schema.ZoneUpdate, Dict[str, Any]]): request parameters
+
+        Raises:
+            ZoneOverlapError: new coordinates overlap other zones and the policy is `reject`
 
         Returns:
-            zone_model.Zone: Zone full data
-        """        
-        return await super().remove(db, item_id=item_id)
+            Optional[zone_model.Zone]: Zone full data or None if the zone does not exist
+        """
+        update_data = obj_in if isinstance(obj_in, dict) else obj_in.dict(exclude_unset=True)
+        links = None
+        if update_data.get('coordinates') is not None:
+            await db.execute(ZONE_WRITE_LOCK)
+            links = await self.check_topology(db, coordinates=update_data['coordinates'], zone_id=item_id)
+            update_data = {**update_data, **derived_fields(update_data['coordinates'])}
+
+        zone = await self._update_returning(db, item_id=item_id, obj_in=update_data)
+        if zone is None:
+            return None
+
+        generation = None
+        if links is not None:
+            # Индекс и граф зависят только от координат: переименование не меняет поколение
+            await self._store_links(db, zone.id, links)
+            generation = await self._bump_generation(db)
+        await db.commit()
+
+        get_zone_index().upsert(zone.id, zone.coordinates)
+        if links is not None:
+            get_zone_topology().set(zone.id, links)
+            get_zone_index().advance(generation)
+        return zone
+
+    async def remove(self, db: AsyncSession, *, item_id: UUID) -> Optional[zone_model.Zone]:
+        """Delete Zone with a single DELETE ... RETURNING
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            item_id (UUID): Zone ID
+
+        Returns:
+            Optional[zone_model.Zone]: Zone full data or None if the zone does not exist
+        """
+        table = self.model.__table__
+        zone = (await db.execute(
+            select(self.model).from_statement(delete(table).where(table.c.id == item_id).returning(*table.c))
+        )).scalars().first()
+        if zone is None:
+            return None
+        generation = await self._bump_generation(db)
+        await db.commit()
+
+        get_zone_index().remove(item_id)
+        get_zone_topology().remove(item_id)
+        get_zone_index().advance(generation)
+        return zone
+
+    async def _bump_generation(self, db: AsyncSession) -> int:
+        # Поколение растёт в транзакции записи: другие процессы увидят его вместе с изменением зоны
+        return (await db.execute(BUMP_ZONE_GENERATION)).scalar()
+
+    async def rebuild_index(self, db: AsyncSession) -> None:
+        """ Load all zones into the in-memory spatial index and the zone links graph
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+        """
+        # Поколение читается до зон: изменение между запросами вызовет ещё одну перестройку, но не потеряется
+        state = (await db.execute(ZONE_STATE)).first()
+        generation, topology_built = state if state is not None else (0, True)
+        zones = await db.execute(select(self.model.id, self.model.coordinates))
+        get_zone_index().build(zones.all(), generation)
+
+        if not topology_built:
+            # Связи зон, созданных до их появления, вычисляются один раз для всех процессов
+            await self.rebuild_topology(db, force=False)
+        else:
+            get_zone_topology().build(await self._load_links(db))
+
+    async def _load_links(self, db: AsyncSession):
+        link = zone_model.ZoneLink
+        return (await db.execute(select(link.zone_id, link.other_zone_id, link.relation))).all()
+
+    async def refresh_index(self, db: AsyncSession) -> bool:
+        """ Rebuild the index and the links graph if zones were changed by another process
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+
+        Returns:
+            bool: True if the index was rebuilt
+        """
+        generation = (await db.execute(ZONE_GENERATION)).scalar() or 0
+        if generation == get_zone_index().generation:
+            return False
+
+        await self.rebuild_index(db)
+        return True
+
+    async def run_refresher(self, interval: float) -> None:
+        """ Check the zone generation every `interval` seconds until cancelled """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with postgresql.SessionLocal() as db:
+                    if await self.refresh_index(db):
+                        logger.info('Zone index rebuilt at generation %s', get_zone_index().generation)
+            except Exception:       # pylint: disable=broad-except
+                # Индекс остаётся прежним до следующей успешной проверки
+                logger.exception('Failed to refresh the zone index')
+
+    async def rebuild_topology(self, db: AsyncSession, *, force: bool = True) -> None:
+        """ Recompute links between all zones and replace the stored graph
+
+        Overlaps are recorded regardless of the overlap policy. Other processes
+        reload the graph on the next refresh.
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            force (bool): recompute even if the graph was already built once
+        """
+        # Под блокировкой записи зон набор зон не меняется, пока считается граф
+        await db.execute(ZONE_WRITE_LOCK)
+        if not force and (await db.execute(ZONE_STATE)).first().topology_built:
+            # Граф уже построил другой процесс, пока мы ждали блокировку
+            links = await self._load_links(db)
+            await db.commit()
+            get_zone_topology().build(links)
+            return
+
+        index = ZoneIndex(app_config.geo.zone_index_cell_size, classify=False)
+        index.build((await db.execute(select(self.model.id, self.model.coordinates))).all())
+        tolerance = app_config.geo.zone_adjacency_tolerance
+        links = []
+        for zone_id, polygon in ((zone_id, index.polygon(zone_id)) for zone_id in index.zone_ids()):
+            for other_zone_id in index.near(expand_bbox(polygon.bbox, tolerance)):
+                if str(other_zone_id) <= str(zone_id):
+                    continue
+                relation = relate(polygon, index.polygon(other_zone_id), tolerance)
+                if relation is not None:
+                    links.append((zone_id, other_zone_id, relation))
+
+        await db.execute(delete(zone_model.ZoneLink))
+        db.add_all([
+            zone_model.ZoneLink(zone_id=first, other_zone_id=second, relation=relation)
+            for zone_id, other_zone_id, relation in links
+            for first, second in ((zone_id, other_zone_id), (other_zone_id, zone_id))
+        ])
+        await db.execute(
+            update(zone_model.ZoneState).where(zone_model.ZoneState.id == 1).values(
+                topology_built=True, generation=zone_model.ZoneState.generation + 1
+            )
+        )
+        await db.commit()
+        get_zone_topology().build(links)
+
+    async def relations(
+        self, db: AsyncSession, *, coordinates: List[float], zone_id: Optional[UUID] = None
+    ) -> Dict[UUID, str]:
+        """ Overlaps and adjacency of the polygon with the stored zones
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            coordinates (List[float]): flat zone coordinates
+            zone_id (Optional[UUID]): ID of the zone being updated, excluded from the check
+
+        Returns:
+            Dict[UUID, str]: related zone IDs with `overlap` or `adjacent` relation
+        """
+        polygon = Polygon(coordinates)
+        tolerance = app_config.geo.zone_adjacency_tolerance
+        min_longitude, min_latitude, max_longitude, max_latitude = expand_bbox(polygon.bbox, tolerance)
+        query = select(self.model.id, self.model.coordinates).where(
+            self.model.min_longitude <= max_longitude,
+            self.model.max_longitude >= min_longitude,
+            self.model.min_latitude <= max_latitude,
+            self.model.max_latitude >= min_latitude,
+        )
+        if zone_id is not None:
+            query = query.where(self.model.id != zone_id)
+
+        links = {}
+        for other_zone_id, other_coordinates in await db.execute(query):
+            relation = relate(polygon, Polygon(other_coordinates), tolerance)
+            if relation is not None:
+                links[other_zone_id] = relation
+        return links
+
+    async def check_topology(
+        self, db: AsyncSession, *, coordinates: List[float], zone_id: Optional[UUID] = None
+    ) -> Dict[UUID, str]:
+        """ Validate the polygon against the stored zones according to the overlap policy
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            coordinates (List[float]): flat zone coordinates
+            zone_id (Optional[UUID]): ID of the zone being updated
+
+        Raises:
+            ZoneOverlapError: the zone overlaps other zones and the policy is `reject`
+
+        Returns:
+            Dict[UUID, str]: links to persist for the zone
+        """
+        links = await self.relations(db, coordinates=coordinates, zone_id=zone_id)
+        overlaps = [str(other_zone_id) for other_zone_id, relation in links.items() if relation == OVERLAP]
+        if overlaps and app_config.geo.zone_overlap_policy == 'reject':
+            raise ZoneOverlapError(zone_id, f'zone overlaps zones {", ".join(overlaps)}')
+        return links
+
+    async def _store_links(self, db: AsyncSession, zone_id: UUID, links: Dict[UUID, str]) -> None:
+        # Связи хранятся в обе стороны, старые связи зоны заменяются целиком
+        link = zone_model.ZoneLink
+        await db.execute(delete(link).where(or_(link.zone_id == zone_id, link.other_zone_id == zone_id)))
+        db.add_all([
+            link(zone_id=first, other_zone_id=second, relation=relation)
+            for other_zone_id, relation in links.items()
+            for first, second in ((zone_id, other_zone_id), (other_zone_id, zone_id))
+        ])
+
+    async def neighbours(self, zone_id: UUID) -> List[zone_schema.ZoneNeighbour]:
+        """ Adjacent and overlapping zones from the in-memory graph
+
+        Args:
+            zone_id (UUID): Zone ID
+
+        Returns:
+            List[zone_schema.ZoneNeighbour]: related zones
+        """
+        return [
+            zone_schema.ZoneNeighbour(zone_id=other_zone_id, relation=relation)
+            for other_zone_id, relation in get_zone_topology().links(zone_id).items()
+        ]
+
+    async def locate(
+        self, *, latitude: float, longitude: float, db: Optional[AsyncSession] = None
+    ) -> Optional[UUID]:
+        """ Find the zone containing the delivery point
+
+        Args:
+            latitude (float): point latitude
+            longitude (float): point longitude
+            db (Optional[AsyncSession]): session for the database lookup while the index is not built
+
+        Returns:
+            Optional[UUID]: Zone ID
+        """
+        if not get_zone_index().ready and db is not None:
+            # Индекс ещё не загружен (например, БД была недоступна при старте) - ищем по GiST-индексу geom
+            return await self.find_containing(db, latitude=latitude, longitude=longitude)
+
+        return get_zone_index().locate(latitude=latitude, longitude=longitude)
+
+    def locate_many(self, points: np.ndarray) -> List[Optional[UUID]]:
+        """ Find zones for a batch of delivery points
+
+        CPU-bound, so it is synchronous and meant to be run off the event loop.
+
+        Args:
+            points (np.ndarray): array of shape (n, 2) with (lat, lon) pairs
+
+        Returns:
+            List[Optional[UUID]]: Zone IDs in the order of the input points
+        """
+        return get_zone_index().locate_many(latitudes=points[:, 0], longitudes=points[:, 1])
+
+    async def has_geometry(self, db: AsyncSession) -> bool:
+        """ Check whether zones have the PostGIS geometry column
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+
+        Returns:
+            bool: True if GiST-indexed geometry queries are available
+        """
+        if self._has_geometry is None:
+            self._has_geometry = bool((await db.execute(HAS_GEOMETRY_SQL)).scalar())
+        return self._has_geometry
+
+    async def find_containing(self, db: AsyncSession, *, latitude: float, longitude: float) -> Optional[UUID]:
+        """ Find the zone containing the point in the database
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            latitude (float): point latitude
+            longitude (float): point longitude
+
+        Returns:
+            Optional[UUID]: Zone ID
+        """
+        if await self.has_geometry(db):
+            return (await db.execute(CONTAINING_ZONE_SQL, {'lat': latitude, 'lon': longitude})).scalar()
+
+        zones = await db.execute(select(self.model.id, self.model.coordinates).where(
+            self.model.min_longitude <= longitude,
+            self.model.max_longitude >= longitude,
+            self.model.min_latitude <= latitude,
+            self.model.max_latitude >= latitude,
+        ).order_by(self.model.created_at))
+        for zone_id, coordinates in zones:
+            if Polygon(coordinates).contains(longitude, latitude):
+                return zone_id
+        return None
+
+    async def find_nearest(
+        self, db: AsyncSession, *, latitude: float, longitude: float, radius: float, limit: int = 5
+    ) -> List[zone_schema.ZoneDistance]:
+        """ Find zones within the radius ordered by distance
+
+        Args:
+            db (AsyncSession): SQLAlchemy AsyncSession
+            latitude (float): point latitude
+            longitude (float): point longitude
+            radius (float): search radius in meters
+            limit (int): maximum number of zones
+
+        Returns:
+            List[zone_schema.ZoneDistance]: nearest zones, 0 distance for zones containing the point
+        """
+        if await self.has_geometry(db):
+            rows = await db.execute(
+                NEAREST_ZONES_SQL, {'lat': latitude, 'lon': longitude, 'radius': radius, 'limit': limit}
+            )
+            return [zone_schema.ZoneDistance(zone_id=row.zone_id, distance=row.distance) for row in rows]
+
+        # Расширяем точку до прямоугольника радиуса и отбираем зоны по пересечению bbox
+        delta_lat = radius / METERS_PER_DEGREE
+        delta_lon = radius / (METERS_PER_DEGREE * max(cos(radians(latitude)), 0.01))
+        zones = await db.execute(select(self.model.id, self.model.coordinates).where(
+            self.model.min_longitude <= longitude + delta_lon,
+            self.model.max_longitude >= longitude - delta_lon,
+            self.model.min_latitude <= latitude + delta_lat,
+            self.model.max_latitude >= latitude - delta_lat,
+        ))
+
+        distances = []
+        for zone_id, coordinates in zones:
+            distance = Polygon(coordinates).distance_m(longitude, latitude)
+            if distance <= radius:
+                distances.append(zone_schema.ZoneDistance(zone_id=zone_id, distance=distance))
+        return sorted(distances, key=lambda zone: zone.distance)[:limit]
 
 
 @lru_cache
@@ -0,0 +1,235 @@
+import threading
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from src.services.geo.polygon import EARTH_RADIUS_M
+
+
+METERS_PER_DEGREE = np.radians(1.0) * EARTH_RADIUS_M
+
+
+class CourierState(NamedTuple):
+    courier_id: UUID
+    zone_id: Optional[UUID]
+    latitude: float
+    longitude: float
+    available: bool
+
+
+class _ZoneCouriers:
+    """ Плотно упакованные массивы позиций курьеров одной зоны """
+
+    __slots__ = ('ids', 'lats', 'lons', 'available', 'size')
+
+    def __init__(self, capacity: int = 64):
+        self.ids: List[Optional[UUID]] = [None] * capacity
+        self.lats = np.zeros(capacity, dtype=np.float64)
+        self.lons = np.zeros(capacity, dtype=np.float64)
+        self.available = np.zeros(capacity, dtype=bool)
+        self.size = 0
+
+    def append(self, courier_id: UUID, latitude: float, longitude: float, available: bool) -> int:
+        if self.size == len(self.ids):
+            capacity = 2 * len(self.ids)
+            self.ids.extend([None] * (capacity - len(self.ids)))
+            self.lats = np.resize(self.lats, capacity)
+            self.lons = np.resize(self.lons, capacity)
+            self.available = np.resize(self.available, capacity)
+
+        slot = self.size
+        self.ids[slot] = courier_id
+        self.lats[slot], self.lons[slot], self.available[slot] = latitude, longitude, available
+        self.size += 1
+        return slot
+
+    def pop(self, slot: int) -> Optional[UUID]:
+        """ Remove the slot by moving the last courier into it, returns the moved courier """
+        last = self.size - 1
+        moved = None
+        if slot != last:
+            moved = self.ids[last]
+            self.ids[slot] = moved
+            self.lats[slot], self.lons[slot] = self.lats[last], self.lons[last]
+            self.available[slot] = self.available[last]
+        self.ids[last] = None
+        self.size = last
+        return moved
+
+    def nearest(self, latitude: float, longitude: float, k: int) -> List[Tuple[int, float]]:
+        size = self.size
+        candidates = np.flatnonzero(self.available[:size])
+        if not len(candidates):
+            return []
+
+        # Равнопромежуточная проекция вокруг точки доставки - достаточно точно в пределах города
+        dx = (self.lons[candidates] - longitude) * np.cos(np.radians(latitude))
+        dy = self.lats[candidates] - latitude
+        distances = dx * dx + dy * dy
+        if len(candidates) > k:
+            nearest = np.argpartition(distances, k)[:k]
+        else:
+            nearest = np.arange(len(candidates))
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [
+            (int(candidates[n]), float(np.sqrt(distances[n]) * METERS_PER_DEGREE))
+            for n in nearest
+        ]
+
+
+class CourierPositions:
+    """ Последние известные позиции курьеров в памяти процесса, сгруппированные по зонам.
+        Поиск ближайших свободных курьеров не обращается к PostgreSQL. Резервирования -
+        копия таблицы courier_reservations: курьер резервируется записью в неё
+        (AssignmentService), а копия сверяется с таблицей при старте и в фоне.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._zones: Dict[Optional[UUID], _ZoneCouriers] = {}
+        self._slots: Dict[UUID, Tuple[Optional[UUID], int]] = {}
+        self._reservations: Dict[UUID, UUID] = {}
+
+    def _state(self, courier_id: UUID) -> CourierState:
+        zone_id, slot = self._slots[courier_id]
+        couriers = self._zones[zone_id]
+        return CourierState(
+            courier_id=courier_id,
+            zone_id=zone_id,
+            latitude=float(couriers.lats[slot]),
+            longitude=float(couriers.lons[slot]),
+            available=bool(couriers.available[slot]),
+        )
+
+    def _remove(self, courier_id: UUID) -> None:
+        zone_id, slot = self._slots.pop(courier_id)
+        moved = self._zones[zone_id].pop(slot)
+        if moved is not None:
+            self._slots[moved] = (zone_id, slot)
+
+    def get(self, courier_id: UUID) -> Optional[CourierState]:
+        with self._lock:
+            if courier_id not in self._slots:
+                return None
+            return self._state(courier_id)
+
+    def update(
+        self, courier_id: UUID, *, zone_id: Optional[UUID], latitude: float, longitude: float,
+        available: Optional[bool] = None,
+    ) -> CourierState:
+        """Store the latest courier position
+
+        Args:
+            courier_id (UUID): Courier ID
+            zone_id (Optional[UUID]): zone containing the position
+            latitude (float): courier latitude
+            longitude (float): courier longitude
+            available (Optional[bool]): new availability, None keeps the current one
+
+        Returns:
+            CourierState: courier state after the update
+        """
+        with self._lock:
+            if courier_id in self._reservations:
+                # Зарезервированный курьер остаётся занятым до освобождения
+                available = False
+            elif available is None:
+                available = self._state(courier_id).available if courier_id in self._slots else True
+
+            current = self._slots.get(courier_id)
+            if current is not None and current[0] == zone_id:
+                couriers = self._zones[zone_id]
+                slot = current[1]
+                couriers.lats[slot], couriers.lons[slot], couriers.available[slot] = latitude, longitude, available
+            else:
+                if current is not None:
+                    self._remove(courier_id)
+                couriers = self._zones.setdefault(zone_id, _ZoneCouriers())
+                self._slots[courier_id] = (zone_id, couriers.append(courier_id, latitude, longitude, available))
+
+            return self._state(courier_id)
+
+    def forget(self, courier_id: UUID) -> None:
+        with self._lock:
+            if courier_id in self._slots:
+                self._remove(courier_id)
+            self._reservations.pop(courier_id, None)
+
+    def nearest(self, zone_id: UUID, *, latitude: float, longitude: float, k: int) -> List[Tuple[UUID, float]]:
+        """Find k nearest available couriers in the zone
+
+        Args:
+            zone_id (UUID): Zone ID
+            latitude (float): delivery latitude
+            longitude (float): delivery longitude
+            k (int): number of couriers
+
+        Returns:
+            List[Tuple[UUID, float]]: courier IDs with distances in meters, nearest first
+        """
+        with self._lock:
+            couriers = self._zones.get(zone_id)
+            if couriers is None:
+                return []
+            return [(couriers.ids[slot], distance) for slot, distance in couriers.nearest(latitude, longitude, k)]
+
+    def _set_available(self, courier_id: UUID, available: bool) -> None:
+        if courier_id in self._slots:
+            zone_id, slot = self._slots[courier_id]
+            self._zones[zone_id].available[slot] = available
+
+    def reserve(self, courier_id: UUID, order_id: UUID) -> None:
+        """Mark the courier as reserved for the order after the reservation is written
+
+        Args:
+            courier_id (UUID): Courier ID
+            order_id (UUID): Order ID
+        """
+        with self._lock:
+            self._reservations[courier_id] = order_id
+            self._set_available(courier_id, False)
+
+    def load_reservations(self, reservations: Dict[UUID, UUID]) -> None:
+        """Replace the reservations with the ones read from the database
+
+        Availability changes only for couriers whose reservation appeared or
+        disappeared, so couriers that reported themselves unavailable stay so.
+
+        Args:
+            reservations (Dict[UUID, UUID]): order IDs by courier ID
+        """
+        with self._lock:
+            for courier_id in self._reservations.keys() - reservations.keys():
+                self._set_available(courier_id, True)
+            for courier_id in reservations.keys() - self._reservations.keys():
+                self._set_available(courier_id, False)
+            self._reservations = dict(reservations)
+
+    def release(self, courier_id: UUID, order_id: Optional[UUID] = None) -> bool:
+        """Release the courier reservation and make the courier available again
+
+        Args:
+            courier_id (UUID): Courier ID
+            order_id (Optional[UUID]): release only if reserved for this order
+
+        Returns:
+            bool: True if a reservation was released
+        """
+        with self._lock:
+            reserved_for = self._reservations.get(courier_id)
+            if reserved_for is None or (order_id is not None and reserved_for != order_id):
+                return False
+
+            del self._reservations[courier_id]
+            self._set_available(courier_id, True)
+            return True
+
+    def reservation(self, courier_id: UUID) -> Optional[UUID]:
+        return self._reservations.get(courier_id)
+
+
+@lru_cache
+def get_courier_positions() -> CourierPositions:
+    return CourierPositions()
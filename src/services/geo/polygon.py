@@ -0,0 +1,336 @@
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Ограничение на размер матрицы "точки x рёбра" при векторизованной проверке
+MAX_MATRIX_SIZE = 1_000_000
+EARTH_RADIUS_M = 6_371_008.8
+
+# Взаимное расположение прямоугольника и полигона
+INSIDE = 'inside'
+OUTSIDE = 'outside'
+CROSSING = 'crossing'
+# Взаимное расположение двух зон
+OVERLAP = 'overlap'
+ADJACENT = 'adjacent'
+
+BBox = Tuple[float, float, float, float]
+
+
+def coordinates_to_ring(coordinates: Sequence[float]) -> np.ndarray:
+    """Convert flat zone coordinates to a ring of (longitude, latitude) points
+
+    Args:
+        coordinates (Sequence[float]): flat list `[lon0, lat0, lon1, lat1, ...]`
+
+    Returns:
+        np.ndarray: array of shape (n, 2) without the closing point
+    """
+    ring = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    return ring
+
+
+class ZoneGeometry(NamedTuple):
+    bbox: BBox
+    centroid: Tuple[float, float]
+    simplified: List[float]
+
+
+def polygon_centroid(ring: np.ndarray) -> Tuple[float, float]:
+    """Area-weighted centroid of a ring, vertex mean for degenerate rings"""
+    xs, ys = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(xs, -1), np.roll(ys, -1)
+    cross = xs * y2 - x2 * ys
+    area = cross.sum() / 2
+    if area == 0:
+        return float(xs.mean()), float(ys.mean())
+    return float(((xs + x2) * cross).sum() / (6 * area)), float(((ys + y2) * cross).sum() / (6 * area))
+
+
+def _simplify_path(path: np.ndarray, tolerance: float) -> np.ndarray:
+    # Douglas-Peucker без рекурсии: стек отрезков, для каждого ищем самую дальнюю точку
+    keep = np.zeros(len(path), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(path) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start, end = path[first], path[last]
+        inner = path[first + 1:last]
+        dx, dy = end - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(*(inner - start).T)
+        else:
+            distances = np.abs(dx * (inner[:, 1] - start[1]) - dy * (inner[:, 0] - start[0])) / length
+
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            keep[first + 1 + farthest] = True
+            stack.append((first, first + 1 + farthest))
+            stack.append((first + 1 + farthest, last))
+
+    return path[keep]
+
+
+def simplify_ring(ring: np.ndarray, tolerance: float) -> np.ndarray:
+    """Simplify a closed ring with Douglas-Peucker
+
+    Args:
+        ring (np.ndarray): ring of shape (n, 2) without the closing point
+        tolerance (float): maximum deviation, in degrees
+
+    Returns:
+        np.ndarray: simplified ring, the original one if it would degenerate
+    """
+    if len(ring) <= 3 or tolerance <= 0:
+        return ring
+
+    # Делим кольцо на две ломаные по самой удалённой от первой вершины точке
+    split = int(np.hypot(*(ring - ring[0]).T).argmax())
+    head = _simplify_path(ring[:split + 1], tolerance)
+    tail = _simplify_path(np.vstack([ring[split:], ring[:1]]), tolerance)
+    simplified = np.vstack([head, tail[1:-1]])
+    return simplified if len(simplified) >= 3 else ring
+
+
+def zone_geometry(coordinates: Sequence[float], tolerance: float) -> ZoneGeometry:
+    """Derived geometry persisted along with zone coordinates
+
+    Args:
+        coordinates (Sequence[float]): flat list `[lon0, lat0, lon1, lat1, ...]`
+        tolerance (float): simplification tolerance, in degrees
+
+    Returns:
+        ZoneGeometry: bounding box, centroid and simplified flat coordinates
+    """
+    ring = coordinates_to_ring(coordinates)
+    min_x, min_y = ring.min(axis=0)
+    max_x, max_y = ring.max(axis=0)
+    return ZoneGeometry(
+        bbox=(float(min_x), float(min_y), float(max_x), float(max_y)),
+        centroid=polygon_centroid(ring),
+        simplified=simplify_ring(ring, tolerance).ravel().tolist(),
+    )
+
+
+class Polygon:
+    """ Кольцо зоны доставки, подготовленное для векторизованной проверки point-in-polygon """
+
+    __slots__ = ('xs', 'ys', '_x2', '_y2', '_slope', 'bbox')
+
+    def __init__(self, coordinates: Sequence[float]):
+        ring = coordinates_to_ring(coordinates)
+        self.xs = ring[:, 0]
+        self.ys = ring[:, 1]
+        self._x2 = np.roll(self.xs, -1)
+        self._y2 = np.roll(self.ys, -1)
+
+        dy = self._y2 - self.ys
+        self._slope = (self._x2 - self.xs) / np.where(dy == 0, 1.0, dy)
+        self.bbox: BBox = (
+            float(self.xs.min()), float(self.ys.min()),
+            float(self.xs.max()), float(self.ys.max()),
+        )
+
+    def in_bbox(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        min_x, min_y, max_x, max_y = self.bbox
+        return (lons >= min_x) & (lons <= max_x) & (lats >= min_y) & (lats <= max_y)
+
+    def contains(self, lon: float, lat: float) -> bool:
+        """Check that a point lies inside the polygon (ray casting)
+
+        Args:
+            lon (float): point longitude
+            lat (float): point latitude
+
+        Returns:
+            bool: True if the point is inside
+        """
+        crosses = (self.ys > lat) != (self._y2 > lat)
+        x_cross = self.xs + (lat - self.ys) * self._slope
+        return bool(np.count_nonzero(crosses & (lon < x_cross)) & 1)
+
+    def contains_many(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """Vectorized ray casting for a batch of points
+
+        Args:
+            lons (np.ndarray): points longitudes
+            lats (np.ndarray): points latitudes
+
+        Returns:
+            np.ndarray: boolean mask of points inside the polygon
+        """
+        result = np.zeros(len(lons), dtype=bool)
+        step = max(1, MAX_MATRIX_SIZE // len(self.xs))
+        for start in range(0, len(lons), step):
+            x = lons[start:start + step, None]
+            y = lats[start:start + step, None]
+            crosses = (self.ys > y) != (self._y2 > y)
+            x_cross = self.xs + (y - self.ys) * self._slope
+            result[start:start + step] = np.count_nonzero(crosses & (x < x_cross), axis=1) & 1
+        return result
+
+    def distance_m(self, lon: float, lat: float) -> float:
+        """Approximate distance from a point to the polygon in meters
+
+        Uses an equirectangular projection around the point, which is accurate
+        enough at city scale.
+
+        Args:
+            lon (float): point longitude
+            lat (float): point latitude
+
+        Returns:
+            float: 0 for points inside the polygon, otherwise distance to the nearest edge
+        """
+        if self.contains(lon, lat):
+            return 0.0
+
+        scale_x = np.radians(1.0) * EARTH_RADIUS_M * np.cos(np.radians(lat))
+        scale_y = np.radians(1.0) * EARTH_RADIUS_M
+        x1, y1 = (self.xs - lon) * scale_x, (self.ys - lat) * scale_y
+        x2, y2 = (self._x2 - lon) * scale_x, (self._y2 - lat) * scale_y
+
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = np.clip(-(x1 * dx + y1 * dy) / np.where(length == 0, 1.0, length), 0.0, 1.0)
+        return float(np.hypot(x1 + t * dx, y1 + t * dy).min())
+
+    def rect_relation(self, rect: BBox) -> str:
+        """Relation of an axis-aligned rectangle to the polygon
+
+        Args:
+            rect (BBox): (min_lon, min_lat, max_lon, max_lat)
+
+        Returns:
+            str: INSIDE, OUTSIDE or CROSSING when the boundary touches the rectangle
+        """
+        min_x, min_y, max_x, max_y = rect
+        if max_x < self.bbox[0] or min_x > self.bbox[2] or max_y < self.bbox[1] or min_y > self.bbox[3]:
+            return OUTSIDE
+
+        # Теорема о разделяющей оси: сначала оси прямоугольника, затем нормаль ребра
+        x1, y1, x2, y2 = self.xs, self.ys, self._x2, self._y2
+        overlaps = (
+            (np.maximum(x1, x2) >= min_x) & (np.minimum(x1, x2) <= max_x)
+            & (np.maximum(y1, y2) >= min_y) & (np.minimum(y1, y2) <= max_y)
+        )
+        if overlaps.any():
+            dx, dy = (x2 - x1)[overlaps, None], (y2 - y1)[overlaps, None]
+            corners_x = np.array([min_x, max_x, max_x, min_x])
+            corners_y = np.array([min_y, min_y, max_y, max_y])
+            sides = dx * (corners_y - y1[overlaps, None]) - dy * (corners_x - x1[overlaps, None])
+            separated = (sides > 0).all(axis=1) | (sides < 0).all(axis=1)
+            if not separated.all():
+                return CROSSING
+
+        return INSIDE if self.contains(min_x, min_y) else OUTSIDE
+
+
+def _project(xs: np.ndarray, ys: np.ndarray, lat: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Равнопромежуточная проекция в метры вокруг широты lat
+    scale_y = np.radians(1.0) * EARTH_RADIUS_M
+    return xs * scale_y * np.cos(np.radians(lat)), ys * scale_y
+
+
+def _min_segment_distances(
+    px: np.ndarray, py: np.ndarray, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray
+) -> np.ndarray:
+    # Расстояние от каждой точки до ближайшего из отрезков, матрица считается кусками
+    result = np.empty(len(px))
+    dx, dy = x2 - x1, y2 - y1
+    length = np.where(dx * dx + dy * dy == 0, 1.0, dx * dx + dy * dy)
+    step = max(1, MAX_MATRIX_SIZE // len(x1))
+    for start in range(0, len(px), step):
+        ox = px[start:start + step, None] - x1
+        oy = py[start:start + step, None] - y1
+        t = np.clip((ox * dx + oy * dy) / length, 0.0, 1.0)
+        result[start:start + step] = np.hypot(ox - t * dx, oy - t * dy).min(axis=1)
+    return result
+
+
+def _edges_cross(first: Tuple[np.ndarray, ...], second: Tuple[np.ndarray, ...], tolerance: float) -> bool:
+    # Рёбра пересекаются "по-настоящему": концы каждого ребра лежат по разные стороны
+    # от прямой другого дальше допуска, общие и почти общие границы не считаются
+    ax1, ay1, ax2, ay2 = first
+    bx1, by1, bx2, by2 = second
+    a_dx, a_dy = ax2 - ax1, ay2 - ay1
+    a_len = np.hypot(a_dx, a_dy)
+    b_dx, b_dy = bx2 - bx1, by2 - by1
+    b_len = np.where(np.hypot(b_dx, b_dy) == 0, 1.0, np.hypot(b_dx, b_dy))
+    step = max(1, MAX_MATRIX_SIZE // len(bx1))
+    for start in range(0, len(ax1), step):
+        rows = slice(start, start + step)
+        x1, y1, dx, dy = ax1[rows, None], ay1[rows, None], a_dx[rows, None], a_dy[rows, None]
+        length = np.where(a_len[rows, None] == 0, 1.0, a_len[rows, None])
+        d1 = (dx * (by1 - y1) - dy * (bx1 - x1)) / length
+        d2 = (dx * (by2 - y1) - dy * (bx2 - x1)) / length
+        d3 = (b_dx * (y1 - by1) - b_dy * (x1 - bx1)) / b_len
+        d4 = (b_dx * (y1 + dy - by1) - b_dy * (x1 + dx - bx1)) / b_len
+        crossing = (d1 * d2 < 0) & (d3 * d4 < 0) & (
+            np.minimum(np.minimum(np.abs(d1), np.abs(d2)), np.minimum(np.abs(d3), np.abs(d4))) > tolerance
+        )
+        if crossing.any():
+            return True
+    return False
+
+
+def relate(first: Polygon, second: Polygon, tolerance: float) -> Optional[str]:
+    """Topological relation of two zone polygons
+
+    Borders closer than the tolerance are treated as shared, so zones drawn
+    edge to edge with small digitizing errors are adjacent, not overlapping.
+
+    Args:
+        first (Polygon): first zone
+        second (Polygon): second zone
+        tolerance (float): border tolerance in meters
+
+    Returns:
+        Optional[str]: OVERLAP, ADJACENT or None for unrelated zones
+    """
+    lat = (first.bbox[1] + first.bbox[3] + second.bbox[1] + second.bbox[3]) / 4
+    a_xs, a_ys = _project(first.xs, first.ys, lat)
+    a_x2, a_y2 = _project(first._x2, first._y2, lat)
+    b_xs, b_ys = _project(second.xs, second.ys, lat)
+    b_x2, b_y2 = _project(second._x2, second._y2, lat)
+
+    if (
+        a_xs.min() - tolerance > b_xs.max() or b_xs.min() - tolerance > a_xs.max()
+        or a_ys.min() - tolerance > b_ys.max() or b_ys.min() - tolerance > a_ys.max()
+    ):
+        return None
+
+    # Расстояния от вершин каждой зоны до границы другой
+    a_to_b = _min_segment_distances(a_xs, a_ys, b_xs, b_ys, b_x2, b_y2)
+    b_to_a = _min_segment_distances(b_xs, b_ys, a_xs, a_ys, a_x2, a_y2)
+
+    # Вершина глубже допуска внутри другой зоны
+    a_inside = second.contains_many(first.xs, first.ys) & (a_to_b > tolerance)
+    b_inside = first.contains_many(second.xs, second.ys) & (b_to_a > tolerance)
+    if a_inside.any() or b_inside.any():
+        return OVERLAP
+
+    if _edges_cross((a_xs, a_ys, a_x2, a_y2), (b_xs, b_ys, b_x2, b_y2), tolerance):
+        return OVERLAP
+
+    # Совпадающие полигоны: все вершины на границе, рёбра не пересекаются
+    for inner, outer, (x1, y1, x2, y2) in (
+        (first, second, (b_xs, b_ys, b_x2, b_y2)),
+        (second, first, (a_xs, a_ys, a_x2, a_y2)),
+    ):
+        lon, lat_c = polygon_centroid(np.stack([inner.xs, inner.ys], axis=1))
+        if inner.contains(lon, lat_c) and outer.contains(lon, lat_c):
+            px, py = _project(np.array([lon]), np.array([lat_c]), lat)
+            if _min_segment_distances(px, py, x1, y1, x2, y2)[0] > tolerance:
+                return OVERLAP
+
+    if min(a_to_b.min(), b_to_a.min()) <= tolerance:
+        return ADJACENT
+    return None
@@ -0,0 +1,106 @@
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from src.services.geo.polygon import EARTH_RADIUS_M
+
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances between all pairs of points
+
+    Args:
+        lats (np.ndarray): points latitudes
+        lons (np.ndarray): points longitudes
+
+    Returns:
+        np.ndarray: symmetric (n, n) matrix of distances in meters
+    """
+    lat, lon = np.radians(lats), np.radians(lons)
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour_path(distances: np.ndarray, start: int = 0) -> np.ndarray:
+    """Greedy path from the start point, always moving to the nearest unvisited point
+
+    Args:
+        distances (np.ndarray): (n, n) distance matrix
+        start (int): index of the first point
+
+    Returns:
+        np.ndarray: visiting order of all points
+    """
+    size = len(distances)
+    visited = np.zeros(size, dtype=bool)
+    path = np.empty(size, dtype=np.int64)
+    current = start
+    for step in range(size):
+        path[step] = current
+        visited[current] = True
+        if step == size - 1:
+            break
+        current = int(np.argmin(np.where(visited, np.inf, distances[current])))
+    return path
+
+
+def two_opt(distances: np.ndarray, path: np.ndarray, deadline: float) -> np.ndarray:
+    """Improve an open path with a fixed first point by 2-opt segment reversals
+
+    All candidate reversals are evaluated at once as a matrix, the best one is
+    applied until no reversal shortens the path or the deadline passes.
+
+    Args:
+        distances (np.ndarray): (n, n) distance matrix
+        path (np.ndarray): initial visiting order, path[0] stays first
+        deadline (float): `time.monotonic()` value to stop at
+
+    Returns:
+        np.ndarray: improved visiting order
+    """
+    size = len(path)
+    if size < 4:
+        return path
+
+    # Фиктивная точка в конце с нулевыми расстояниями делает конец пути свободным
+    padded = np.zeros((size + 1, size + 1))
+    padded[:size, :size] = distances
+    tour = np.append(path, size)
+
+    # Разворот отрезка tour[i..j] для 1 <= i < j <= size - 1
+    i, j = np.triu_indices(size, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+    while time.monotonic() < deadline:
+        a, b, c, d = tour[i - 1], tour[i], tour[j], tour[j + 1]
+        delta = padded[a, c] + padded[b, d] - padded[a, b] - padded[c, d]
+        best = int(np.argmin(delta))
+        if delta[best] >= -1e-9:
+            break
+        first, last = i[best], j[best]
+        tour[first:last + 1] = tour[first:last + 1][::-1]
+
+    return tour[:-1]
+
+
+def sequence_route(
+    lats: np.ndarray, lons: np.ndarray, *, start: int, time_budget: float
+) -> Tuple[List[int], List[float]]:
+    """Visiting order of points: nearest neighbour construction improved by 2-opt
+
+    Args:
+        lats (np.ndarray): points latitudes
+        lons (np.ndarray): points longitudes
+        start (int): index of the first point
+        time_budget (float): seconds allowed for 2-opt improvement
+
+    Returns:
+        Tuple[List[int], List[float]]: visiting order and distance in meters from the previous point
+    """
+    deadline = time.monotonic() + time_budget
+    distances = haversine_matrix(lats, lons)
+    path = two_opt(distances, nearest_neighbour_path(distances, start), deadline)
+    legs = np.concatenate([[0.0], distances[path[:-1], path[1:]]])
+    return path.tolist(), legs.tolist()
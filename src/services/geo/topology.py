@@ -0,0 +1,61 @@
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+from uuid import UUID
+
+from src.services.geo.polygon import OVERLAP
+
+
+class ZoneTopology:
+    """ Граф связей зон в памяти процесса: соседство и пересечения.
+        Связи хранятся в обе стороны; как и в индексе зон, словари связей
+        не изменяются на месте, а подменяются целиком.
+    """
+
+    def __init__(self):
+        self._links: Dict[UUID, Dict[UUID, str]] = {}
+
+    def build(self, links: Iterable[Tuple[UUID, UUID, str]]) -> None:
+        """Rebuild the graph from stored links
+
+        Args:
+            links (Iterable[Tuple[UUID, UUID, str]]): zone ID, other zone ID and relation
+        """
+        graph: Dict[UUID, Dict[UUID, str]] = {}
+        for zone_id, other_zone_id, relation in links:
+            graph.setdefault(zone_id, {})[other_zone_id] = relation
+            graph.setdefault(other_zone_id, {})[zone_id] = relation
+        self._links = graph
+
+    def set(self, zone_id: UUID, links: Dict[UUID, str]) -> None:
+        """Replace all links of the zone
+
+        Args:
+            zone_id (UUID): Zone ID
+            links (Dict[UUID, str]): related zone IDs with relations
+        """
+        self.remove(zone_id)
+        self._links[zone_id] = dict(links)
+        for other_zone_id, relation in links.items():
+            self._links[other_zone_id] = {**self._links.get(other_zone_id, {}), zone_id: relation}
+
+    def remove(self, zone_id: UUID) -> None:
+        for other_zone_id in self._links.pop(zone_id, {}):
+            others = {
+                linked: relation for linked, relation in self._links.get(other_zone_id, {}).items()
+                if linked != zone_id
+            }
+            self._links[other_zone_id] = others
+
+    def links(self, zone_id: UUID) -> Dict[UUID, str]:
+        return self._links.get(zone_id, {})
+
+    def neighbours(self, zone_id: UUID) -> List[UUID]:
+        return list(self.links(zone_id))
+
+    def overlaps(self, zone_id: UUID) -> List[UUID]:
+        return [other_zone_id for other_zone_id, relation in self.links(zone_id).items() if relation == OVERLAP]
+
+
+@lru_cache
+def get_zone_topology() -> ZoneTopology:
+    return ZoneTopology()
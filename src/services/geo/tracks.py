@@ -0,0 +1,100 @@
+from typing import Dict, Optional
+from uuid import UUID
+
+import numpy as np
+
+
+TRACK_DTYPE = np.dtype([('recorded_at', 'f8'), ('latitude', 'f8'), ('longitude', 'f8')])
+
+
+class TrackBuffer:
+    """ Кольцевые буферы последних позиций курьеров.
+        Все буферы лежат в одном массиве (курьеры x размер буфера), курьеру
+        выделяется строка при первой позиции. Позиции в буфере упорядочены
+        по recorded_at, даже если приходят не по порядку.
+    """
+
+    def __init__(self, size: int, capacity: int = 1024):
+        self.size = size
+        self._rows: Dict[UUID, int] = {}
+        self._data = np.zeros((capacity, size), dtype=TRACK_DTYPE)
+        self._head = np.zeros(capacity, dtype=np.int64)
+        self._count = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _row(self, courier_id: UUID) -> int:
+        row = self._rows.get(courier_id)
+        if row is not None:
+            return row
+
+        row = len(self._rows)
+        if row == len(self._data):
+            capacity = 2 * len(self._data)
+            data = np.zeros((capacity, self.size), dtype=TRACK_DTYPE)
+            data[:row] = self._data
+            self._data = data
+            self._head = np.resize(self._head, capacity)
+            self._count = np.resize(self._count, capacity)
+        self._head[row] = self._count[row] = 0
+        self._rows[courier_id] = row
+        return row
+
+    def append(self, courier_id: UUID, recorded_at: float, latitude: float, longitude: float) -> bool:
+        """Store the position, overwriting the oldest one when the buffer is full
+
+        A late position is inserted in the order of recorded_at; a position
+        older than all of a full buffer is dropped.
+
+        Args:
+            courier_id (UUID): Courier ID
+            recorded_at (float): position timestamp, seconds since epoch
+            latitude (float): courier latitude
+            longitude (float): courier longitude
+
+        Returns:
+            bool: True if the position was stored
+        """
+        row = self._row(courier_id)
+        head, count = self._head[row], self._count[row]
+        if count and recorded_at < self._data[row, (head - 1) % self.size]['recorded_at']:
+            # Опоздавшая позиция: буфер переписывается по порядку, начиная с нулевой ячейки
+            points = self.recent(courier_id)
+            if count == self.size and recorded_at < points['recorded_at'][0]:
+                return False
+            at = int(np.searchsorted(points['recorded_at'], recorded_at, side='right'))
+            point = np.array([(recorded_at, latitude, longitude)], dtype=TRACK_DTYPE)
+            points = np.concatenate([points[:at], point, points[at:]])[-self.size:]
+            self._data[row, :len(points)] = points
+            self._head[row] = len(points) % self.size
+            self._count[row] = len(points)
+            return True
+
+        self._data[row, head] = (recorded_at, latitude, longitude)
+        self._head[row] = (head + 1) % self.size
+        self._count[row] = min(count + 1, self.size)
+        return True
+
+    def latest(self, courier_id: UUID) -> Optional[np.void]:
+        row = self._rows.get(courier_id)
+        if row is None:
+            return None
+        return self._data[row, (self._head[row] - 1) % self.size]
+
+    def recent(self, courier_id: UUID) -> np.ndarray:
+        """Positions of the courier from the oldest to the newest
+
+        Args:
+            courier_id (UUID): Courier ID
+
+        Returns:
+            np.ndarray: structured array with `recorded_at`, `latitude`, `longitude`
+        """
+        row = self._rows.get(courier_id)
+        if row is None:
+            return np.zeros(0, dtype=TRACK_DTYPE)
+
+        count, head = self._count[row], self._head[row]
+        order = (np.arange(head - count, head)) % self.size
+        return self._data[row, order]
@@ -0,0 +1,278 @@
+from functools import lru_cache
+from math import floor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from src.core.config.app_settings import AppSettings
+from src.services.geo.polygon import BBox, CROSSING, INSIDE, Polygon
+
+
+app_config = AppSettings()
+Cell = Tuple[int, int]
+# Ячейка не классифицирована: точки проверяются по полигонам кандидатов
+UNSETTLED = object()
+# Зона с bounding box больше стольких ячеек не раскладывается по сетке, а проверяется при каждом поиске
+MAX_ZONE_CELLS = 4096
+
+
+class ZoneIndex:
+    """ Пространственный индекс зон: равномерная сетка по bounding box зон
+        и точная проверка point-in-polygon только для кандидатов из ячейки.
+        Списки кандидатов не изменяются на месте, поэтому индекс можно читать
+        из потока пула, пока обработчики в event loop обновляют зоны.
+        generation - значение zone_state.generation, по которому построен индекс,
+        None - индекс ещё не построен.
+        Ячейки, целиком лежащие внутри одной зоны или вне всех кандидатов,
+        классифицируются заранее: точки в них разрешаются без point-in-polygon.
+        Зоны крупнее MAX_ZONE_CELLS ячеек хранятся отдельным списком и являются
+        кандидатами в любой ячейке, чтобы одна огромная зона не раздувала сетку.
+    """
+
+    def __init__(self, cell_size: float, classify: bool = True):
+        self.cell_size = cell_size
+        self.classify = classify
+        self.generation: Optional[int] = None
+        self._zones: Dict[UUID, Polygon] = {}
+        self._grid: Dict[Cell, List[UUID]] = {}
+        self._large: List[UUID] = []
+        # Ячейка -> зона, в которой лежат все её точки (None - ни в одной); границы зон ячейку не пересекают
+        self._settled: Dict[Cell, Optional[UUID]] = {}
+
+    def __len__(self) -> int:
+        return len(self._zones)
+
+    @property
+    def ready(self) -> bool:
+        return self.generation is not None
+
+    def _cell(self, lon: float, lat: float) -> Cell:
+        return floor(lon / self.cell_size), floor(lat / self.cell_size)
+
+    def cells(self, bbox: BBox) -> Iterator[Cell]:
+        min_ix, min_iy = self._cell(bbox[0], bbox[1])
+        max_ix, max_iy = self._cell(bbox[2], bbox[3])
+        for ix in range(min_ix, max_ix + 1):
+            for iy in range(min_iy, max_iy + 1):
+                yield ix, iy
+
+    def cell_count(self, bbox: BBox) -> int:
+        min_ix, min_iy = self._cell(bbox[0], bbox[1])
+        max_ix, max_iy = self._cell(bbox[2], bbox[3])
+        return (max_ix - min_ix + 1) * (max_iy - min_iy + 1)
+
+    def _grid_cells(self, bbox: BBox) -> List[Cell]:
+        # Занятые ячейки в bounding box: перебираем диапазон или саму сетку, смотря что меньше
+        if self.cell_count(bbox) <= len(self._grid):
+            return [cell for cell in self.cells(bbox) if cell in self._grid]
+
+        min_ix, min_iy = self._cell(bbox[0], bbox[1])
+        max_ix, max_iy = self._cell(bbox[2], bbox[3])
+        return [(ix, iy) for ix, iy in list(self._grid) if min_ix <= ix <= max_ix and min_iy <= iy <= max_iy]
+
+    def _settle(self, cell: Cell) -> None:
+        if not self.classify:
+            return
+
+        ix, iy = cell
+        rect = (ix * self.cell_size, iy * self.cell_size, (ix + 1) * self.cell_size, (iy + 1) * self.cell_size)
+        found = None
+        for zone_id in self._grid.get(cell, []) + self._large:
+            relation = self._zones[zone_id].rect_relation(rect)
+            # Граница зоны внутри ячейки или две зоны над ней: нужна проверка точек
+            if relation == CROSSING or (relation == INSIDE and found is not None):
+                return
+            if relation == INSIDE:
+                found = zone_id
+
+        self._settled[cell] = found
+
+    def _add(self, zone_id: UUID, polygon: Polygon) -> None:
+        self._zones[zone_id] = polygon
+        large = self.cell_count(polygon.bbox) > MAX_ZONE_CELLS
+        cells = self._grid_cells(polygon.bbox) if large else list(self.cells(polygon.bbox))
+        # Классификация снимается до изменения кандидатов: читатель увидит либо старую, либо никакую
+        for cell in cells:
+            self._settled.pop(cell, None)
+        if large:
+            self._large = self._large + [zone_id]
+        for cell in cells:
+            if not large:
+                self._grid[cell] = self._grid.get(cell, []) + [zone_id]
+            self._settle(cell)
+
+    def build(self, zones: Iterable[Tuple[UUID, Sequence[float]]], generation: int = 0) -> None:
+        """Rebuild the index from scratch
+
+        Args:
+            zones (Iterable[Tuple[UUID, Sequence[float]]]): pairs of zone ID and flat coordinates
+            generation (int): zone generation the zones were read at
+        """
+        index = ZoneIndex(self.cell_size, self.classify)
+        for zone_id, coordinates in zones:
+            index._add(zone_id, Polygon(coordinates))
+
+        # Подменяем структуры целиком, чтобы читатели не увидели индекс в промежуточном состоянии;
+        # классификация ячеек сбрасывается первой и ставится последней
+        self._settled = {}
+        self._zones, self._grid, self._large = index._zones, index._grid, index._large
+        self._settled = index._settled
+        self.generation = generation
+
+    def advance(self, generation: int) -> None:
+        """Mark a local change written at the generation as applied
+
+        The index keeps its generation if changes of other processes came in
+        between, so the next refresh rebuilds it.
+
+        Args:
+            generation (int): zone generation after the write
+        """
+        if self.generation is not None and generation == self.generation + 1:
+            self.generation = generation
+
+    def upsert(self, zone_id: UUID, coordinates: Sequence[float]) -> None:
+        """Add a new zone or replace the polygon of an existing one
+
+        Args:
+            zone_id (UUID): Zone ID
+            coordinates (Sequence[float]): flat zone coordinates
+        """
+        self.remove(zone_id)
+        self._add(zone_id, Polygon(coordinates))
+
+    def remove(self, zone_id: UUID) -> None:
+        """Drop a zone from the index
+
+        Args:
+            zone_id (UUID): Zone ID
+        """
+        polygon = self._zones.pop(zone_id, None)
+        if polygon is None:
+            return
+
+        large = zone_id in self._large
+        cells = self._grid_cells(polygon.bbox) if large else list(self.cells(polygon.bbox))
+        for cell in cells:
+            self._settled.pop(cell, None)
+        if large:
+            self._large = [candidate for candidate in self._large if candidate != zone_id]
+        for cell in cells:
+            candidates = [candidate for candidate in self._grid.get(cell, []) if candidate != zone_id]
+            if candidates:
+                self._grid[cell] = candidates
+                self._settle(cell)
+            else:
+                self._grid.pop(cell, None)
+
+    def candidates(self, lon: float, lat: float) -> List[UUID]:
+        return self._grid.get(self._cell(lon, lat), []) + self._large
+
+    def zone_ids(self) -> List[UUID]:
+        return list(self._zones)
+
+    def polygon(self, zone_id: UUID) -> Optional[Polygon]:
+        return self._zones.get(zone_id)
+
+    def near(self, bbox: BBox) -> List[UUID]:
+        """Zones whose grid cells intersect the bounding box
+
+        Args:
+            bbox (BBox): (min_lon, min_lat, max_lon, max_lat)
+
+        Returns:
+            List[UUID]: candidate Zone IDs
+        """
+        found = {zone_id for cell in self._grid_cells(bbox) for zone_id in self._grid[cell]}
+        for zone_id in self._large:
+            min_x, min_y, max_x, max_y = self._zones[zone_id].bbox
+            if min_x <= bbox[2] and max_x >= bbox[0] and min_y <= bbox[3] and max_y >= bbox[1]:
+                found.add(zone_id)
+        return list(found)
+
+    def locate(self, *, latitude: float, longitude: float) -> Optional[UUID]:
+        """Find the zone containing a point
+
+        Args:
+            latitude (float): point latitude
+            longitude (float): point longitude
+
+        Returns:
+            Optional[UUID]: Zone ID or None if the point is outside all zones
+        """
+        cell = self._cell(longitude, latitude)
+        settled = self._settled.get(cell, UNSETTLED)
+        if settled is not UNSETTLED and (settled is None or settled in self._zones):
+            return settled
+
+        for zone_id in self._grid.get(cell, []) + self._large:
+            polygon = self._zones.get(zone_id)
+            if polygon is None:
+                continue
+            min_x, min_y, max_x, max_y = polygon.bbox
+            if min_x <= longitude <= max_x and min_y <= latitude <= max_y and polygon.contains(longitude, latitude):
+                return zone_id
+
+        return None
+
+    def locate_many(self, *, latitudes: np.ndarray, longitudes: np.ndarray) -> List[Optional[UUID]]:
+        """Find zones for a batch of points
+
+        Points are grouped by grid cell, so each candidate polygon is tested
+        once per cell against all of the cell's points. Points of classified
+        cells are resolved without a polygon test.
+
+        Args:
+            latitudes (np.ndarray): points latitudes
+            longitudes (np.ndarray): points longitudes
+
+        Returns:
+            List[Optional[UUID]]: Zone IDs in the order of the input points
+        """
+        result: List[Optional[UUID]] = [None] * len(latitudes)
+        if not result:
+            return result
+
+        cells = np.stack([
+            np.floor(longitudes / self.cell_size).astype(np.int64),
+            np.floor(latitudes / self.cell_size).astype(np.int64),
+        ], axis=1)
+        unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_cells) + 1))
+
+        for n, (ix, iy) in enumerate(unique_cells.tolist()):
+            candidates = self._grid.get((ix, iy), []) + self._large
+            if not candidates:
+                continue
+
+            points = order[bounds[n]:bounds[n + 1]]
+            settled = self._settled.get((ix, iy), UNSETTLED)
+            if settled is not UNSETTLED and (settled is None or settled in self._zones):
+                for point in points.tolist():
+                    result[point] = settled
+                continue
+
+            for zone_id in candidates:
+                polygon = self._zones.get(zone_id)
+                if polygon is None:
+                    continue
+
+                lons, lats = longitudes[points], latitudes[points]
+                inside = polygon.in_bbox(lons, lats)
+                inside[inside] = polygon.contains_many(lons[inside], lats[inside])
+                for point in points[inside].tolist():
+                    result[point] = zone_id
+
+                points = points[~inside]
+                if not len(points):
+                    break
+
+        return result
+
+
+@lru_cache
+def get_zone_index() -> ZoneIndex:
+    return ZoneIndex(app_config.geo.zone_index_cell_size)
@@ -0,0 +1,111 @@
+"""Courier reservations: shared through courier_reservations between API processes."""
+
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert, text
+
+from src.core.exceptions import CourierNotAvailable
+from src.models.delivery import Delivery
+from src.models.order import Order, OrderStatus
+from src.services.crud.assignment import AssignmentService
+from src.services.crud.order import get_order_service
+from src.services.geo.couriers import CourierPositions
+from src.services.geo.topology import ZoneTopology
+
+ZONE_ID = uuid.uuid4()
+
+
+class OneZone:
+    """ Every point lies in ZONE_ID """
+
+    async def locate(self, *, latitude, longitude, db=None):
+        return ZONE_ID
+
+
+def make_process(*couriers):
+    """ Assignment service with its own in-memory positions, as in a separate API process """
+    positions = CourierPositions()
+    for courier_id, latitude, longitude in couriers:
+        positions.update(courier_id, zone_id=ZONE_ID, latitude=latitude, longitude=longitude)
+    return AssignmentService(get_order_service(), OneZone(), positions, ZoneTopology())
+
+
+def insert_order(engine):
+    order_id = uuid.uuid4()
+    with engine.begin() as connection:
+        connection.execute(insert(Order.__table__).values(
+            id=order_id, customer_id=uuid.uuid4(), delivery_date=datetime(2021, 12, 1),
+            status=OrderStatus.ACCEPT, created_by='test', updated_by='test',
+        ))
+        connection.execute(insert(Delivery.__table__).values(
+            id=uuid.uuid4(), order_id=order_id, longitude=37.6, latitude=55.7, created_by='test', updated_by='test',
+        ))
+    return order_id
+
+
+def reservations(engine):
+    with engine.begin() as connection:
+        return dict(connection.execute(text('SELECT courier_id, order_id FROM courier_reservations')).all())
+
+
+def assign(service, order_id):
+    async def run(db):
+        order = await get_order_service().get(db, order_id)
+        return await service.assign(db, order=order, updated_by='test')
+    return run
+
+
+def test_positions_load_reservations():
+    reserved, free = uuid.uuid4(), uuid.uuid4()
+    order_id = uuid.uuid4()
+    positions = CourierPositions()
+    for courier_id in (reserved, free):
+        positions.update(courier_id, zone_id=ZONE_ID, latitude=55.7, longitude=37.6)
+
+    positions.load_reservations({reserved: order_id})
+    assert positions.reservation(reserved) == order_id
+    assert not positions.get(reserved).available
+    assert positions.get(free).available
+
+    positions.load_reservations({})
+    assert positions.reservation(reserved) is None
+    assert positions.get(reserved).available
+
+
+def test_two_processes_do_not_reserve_one_courier(db_engine, run_db):
+    near, far = uuid.uuid4(), uuid.uuid4()
+    first = make_process((near, 55.7, 37.6), (far, 55.8, 37.7))
+    second = make_process((near, 55.7, 37.6))
+    first_order, second_order = insert_order(db_engine), insert_order(db_engine)
+
+    assignment = run_db(assign(first, first_order))
+    assert assignment.courier_id == near
+
+    # Второй процесс ещё считает курьера свободным, но запись в БД не проходит
+    with pytest.raises(CourierNotAvailable):
+        run_db(assign(second, second_order))
+    assert second.positions.reservation(near) == first_order
+    assert reservations(db_engine) == {near: first_order}
+
+    # Первый процесс назначает второй заказ следующему курьеру
+    assert run_db(assign(first, second_order)).courier_id == far
+
+
+def test_reservations_survive_restart_and_delivery(db_engine, run_db):
+    courier_id = uuid.uuid4()
+    order_id = insert_order(db_engine)
+    run_db(assign(make_process((courier_id, 55.7, 37.6)), order_id))
+
+    restarted = make_process((courier_id, 55.7, 37.6))
+    run_db(restarted.load_reservations)
+    assert restarted.positions.reservation(courier_id) == order_id
+    assert not restarted.positions.get(courier_id).available
+
+    run_db(lambda db: get_order_service().update_status_many(
+        db, statuses={order_id: OrderStatus.DELIVERED}, updated_by='test'
+    ))
+    assert reservations(db_engine) == {}
+    run_db(restarted.load_reservations)
+    assert restarted.positions.get(courier_id).available
@@ -0,0 +1,60 @@
+"""Archive batches written and read back without a database."""
+
+import base64
+import uuid
+from datetime import datetime, timedelta
+
+from src.models.history_archive import HistoryArchive, bloom_contains, bloom_filter, write_batch
+from src.models.order import Order, OrderStatus
+
+HISTORY = Order.__history_mapper__.local_table
+START = datetime(2021, 1, 1)
+
+
+def history_row(item_id, version, desctiption='text'):
+    return {
+        'id': item_id, 'customer_id': uuid.uuid4(), 'courier_id': None, 'delivery_date': datetime(2021, 12, 1),
+        'desctiption': desctiption, 'status': OrderStatus.ACCEPT, 'created_at': START, 'updated_at': START,
+        'created_by': 'test', 'updated_by': 'test', 'version': version, 'changed': START + timedelta(days=version),
+    }
+
+
+def test_bloom_filter_contains_added_keys():
+    keys = [str(uuid.uuid4()) for _ in range(500)]
+    bloom = bloom_filter(keys, len(keys))
+    bloom['data'] = base64.b64decode(bloom['data'])
+
+    assert all(bloom_contains(bloom, key) for key in keys)
+    # Ложные срабатывания редки: при 1% на 500 чужих ключей их заведомо меньше 50
+    assert sum(bloom_contains(bloom, str(uuid.uuid4())) for _ in range(500)) < 50
+
+
+def test_round_trip(tmp_path):
+    item_ids = [uuid.uuid4() for _ in range(20)]
+    rows = [history_row(item_id, version) for item_id in item_ids for version in (1, 2, 3)]
+    write_batch(str(tmp_path / HISTORY.name), rows, block_rows=4)
+
+    archive = HistoryArchive(str(tmp_path))
+    for item_id in item_ids:
+        versions = archive.versions(HISTORY, item_id)
+        assert [row['version'] for row in versions] == [1, 2, 3]
+        assert versions[0]['id'] == item_id
+        assert versions[0]['status'] is OrderStatus.ACCEPT
+        assert versions[0]['changed'] == START + timedelta(days=1)
+        assert versions[0]['courier_id'] is None
+    assert archive.versions(HISTORY, uuid.uuid4()) == []
+
+
+def test_batches_rewritten_after_interrupted_run(tmp_path):
+    item_id = uuid.uuid4()
+    directory = str(tmp_path / HISTORY.name)
+    first = write_batch(directory, [history_row(item_id, 1), history_row(item_id, 2)], block_rows=1)
+    # Пакет, записанный повторно после прерванного удаления строк, дублирует версии
+    second = write_batch(directory, [history_row(item_id, 2), history_row(item_id, 3)], block_rows=1)
+    assert first != second
+
+    archive = HistoryArchive(str(tmp_path))
+    assert [row['version'] for row in archive.versions(HISTORY, item_id)] == [1, 2, 3]
+    # Пакеты, все версии которых заменены до момента, не читаются
+    assert [row['version'] for row in archive.versions(HISTORY, item_id, changed_after=START + timedelta(days=2))] \
+        == [2, 3]
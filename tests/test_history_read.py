@@ -0,0 +1,68 @@
+"""Versions read back through HistoryService, in both history modes."""
+
+from datetime import datetime
+
+from src.services.crud.history import get_order_history_service
+from src.services.crud.order import get_order_service
+from tests.test_history_write import expand, insert_order
+
+
+def update(run_db, order_id, desctiption):
+    run_db(lambda db: get_order_service().update_by_id(
+        db, item_id=order_id, obj_in={'desctiption': desctiption, 'updated_by': 'test'}
+    ))
+
+
+def read_versions(run_db, order_id, **kwargs):
+    rows = run_db(lambda db: get_order_history_service().versions(db, item_id=order_id, **kwargs))
+    return [(row['version'], row['desctiption']) for row in rows]
+
+
+def test_versions_and_diff(db_engine, run_db, history_mode):
+    order_id, _ = insert_order(db_engine)
+    update(run_db, order_id, 'second')
+    update(run_db, order_id, 'third')
+    expected = [(1, 'first'), (2, 'second'), (3, 'third')]
+
+    # В режиме outbox версии читаются и до развёртывания записей воркером
+    assert read_versions(run_db, order_id) == expected
+    expand(db_engine, history_mode, order_id)
+    assert read_versions(run_db, order_id) == expected
+    assert read_versions(run_db, order_id, from_version=2, to_version=2) == [(2, 'second')]
+
+    diff = run_db(lambda db: get_order_history_service().diff(db, item_id=order_id, from_version=1, to_version=3))
+    assert diff.changes['desctiption'].old == 'first'
+    assert diff.changes['desctiption'].new == 'third'
+    assert 'version' not in diff.changes
+    assert run_db(lambda db: get_order_history_service().diff(
+        db, item_id=order_id, from_version=1, to_version=4
+    )) is None
+
+
+def test_as_of(db_engine, run_db, history_mode):
+    before = datetime.utcnow()
+    order_id, _ = insert_order(db_engine)
+    created = datetime.utcnow()
+    update(run_db, order_id, 'second')
+    updated = datetime.utcnow()
+    update(run_db, order_id, 'third')
+    expand(db_engine, history_mode, order_id)
+
+    def as_of(at):
+        row = run_db(lambda db: get_order_history_service().as_of(db, item_id=order_id, at=at))
+        return row and row['version']
+
+    assert as_of(before) is None
+    assert as_of(created) == 1
+    assert as_of(updated) == 2
+    assert as_of(datetime.utcnow()) == 3
+
+
+def test_versions_of_removed_object(db_engine, run_db, history_mode):
+    order_id, _ = insert_order(db_engine)
+    update(run_db, order_id, 'second')
+    run_db(lambda db: get_order_service().remove(db, item_id=order_id))
+    expand(db_engine, history_mode, order_id)
+
+    # Строки в основной таблице нет: история читается без нижней границы changed
+    assert read_versions(run_db, order_id) == [(1, 'first'), (2, 'second')]
@@ -0,0 +1,82 @@
+"""History rows of single-statement updates and deletes, in both history modes."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert, text
+
+from src.models.delivery import Delivery
+from src.models.history_worker import expand_batch
+from src.models.order import Order, OrderStatus
+from src.services.crud.order import get_order_service
+
+
+def insert_order(engine):
+    order_id, delivery_id = uuid.uuid4(), uuid.uuid4()
+    with engine.begin() as connection:
+        connection.execute(insert(Order.__table__).values(
+            id=order_id, customer_id=uuid.uuid4(), delivery_date=datetime(2021, 12, 1),
+            desctiption='first', status=OrderStatus.ACCEPT, created_by='test', updated_by='test',
+        ))
+        connection.execute(insert(Delivery.__table__).values(
+            id=delivery_id, order_id=order_id, longitude=37.6, latitude=55.7, created_by='test', updated_by='test',
+        ))
+    return order_id, delivery_id
+
+
+def expand(engine, history_mode, *item_ids):
+    """ In the outbox mode check that the change left outbox records and expand them """
+    if history_mode != 'outbox':
+        return
+    with engine.begin() as connection:
+        for item_id in item_ids:
+            pending = connection.execute(
+                text('SELECT count(*) FROM history_outbox WHERE row_id = CAST(:id AS uuid)'), {'id': str(item_id)}
+            ).scalar()
+            assert pending > 0
+        expand_batch(connection, 1000)
+
+
+def history_rows(engine, table, item_id):
+    with engine.begin() as connection:
+        return connection.execute(
+            text(f'SELECT * FROM {table} WHERE id = CAST(:id AS uuid) ORDER BY version'), {'id': str(item_id)}
+        ).mappings().all()
+
+
+def test_update_by_id_writes_history(db_engine, run_db, history_mode):
+    order_id, _ = insert_order(db_engine)
+
+    order = run_db(lambda db: get_order_service().update_by_id(
+        db, item_id=order_id, obj_in={'desctiption': 'second', 'updated_by': 'test'}
+    ))
+
+    assert order.version == 2
+    assert order.desctiption == 'second'
+    assert order.delivery is not None
+    expand(db_engine, history_mode, order_id)
+    rows = history_rows(db_engine, 'orders_history', order_id)
+    assert [(row['version'], row['desctiption']) for row in rows] == [(1, 'first')]
+
+
+def test_update_status_many_writes_history(db_engine, run_db, history_mode):
+    order_id, _ = insert_order(db_engine)
+
+    run_db(lambda db: get_order_service().update_status_many(
+        db, statuses={order_id: OrderStatus.DELIVERING}, updated_by='bulk'
+    ))
+
+    expand(db_engine, history_mode, order_id)
+    rows = history_rows(db_engine, 'orders_history', order_id)
+    assert [(row['version'], row['status'], row['updated_by']) for row in rows] == [(1, 'ACCEPT', 'test')]
+
+
+def test_remove_writes_history(db_engine, run_db, history_mode):
+    order_id, delivery_id = insert_order(db_engine)
+
+    order = run_db(lambda db: get_order_service().remove(db, item_id=order_id))
+
+    assert order.id == order_id
+    expand(db_engine, history_mode, order_id, delivery_id)
+    assert [row['version'] for row in history_rows(db_engine, 'orders_history', order_id)] == [1]
+    assert [row['version'] for row in history_rows(db_engine, 'deliverys_history', delivery_id)] == [1]
@@ -0,0 +1,115 @@
+"""Bulk importer: malformed records, rejects and resume after a failed chunk."""
+
+import io
+import uuid
+
+import orjson
+import psycopg2
+import pytest
+from sqlalchemy import text
+
+from src.models.importer import Importer, MalformedRecord, read_records
+
+from tests.conftest import TEST_DSN
+
+
+def order_line(n):
+    return orjson.dumps({
+        'customer_id': str(uuid.UUID(int=n + 1)), 'delivery_date': '2021-12-01T10:00:00', 'created_by': 'test',
+    })
+
+
+def read_rejects(path):
+    with open(f'{path}.rejects.ndjson', 'rb') as rejects:
+        return [orjson.loads(line) for line in rejects]
+
+
+def test_read_records_keeps_malformed_ndjson_lines():
+    raw = io.BytesIO(b'{"a": 1}\n\n{"a": \n{"a": 3}\n')
+
+    records = list(read_records('orders.ndjson', raw))
+
+    assert records[0] == {'a': 1}
+    assert isinstance(records[1], MalformedRecord)
+    assert (records[1].line, records[1].raw) == (3, '{"a": ')
+    assert records[2] == {'a': 3}
+
+
+def test_read_records_keeps_malformed_csv_cells():
+    raw = io.BytesIO(b'name,coordinates\nfirst,"[1, 2]"\nsecond,"[1, "\nthird,\n')
+
+    records = list(read_records('zones.csv', raw))
+
+    assert records[0] == {'name': 'first', 'coordinates': [1, 2]}
+    assert isinstance(records[1], MalformedRecord)
+    assert (records[1].line, records[1].raw) == (3, 'second,"[1, "')
+    assert records[2] == {'name': 'third'}
+
+
+def test_validate_rejects_malformed_records():
+    importer = Importer(None, 'orders', 'orders.ndjson', chunk_size=10)
+    malformed = MalformedRecord(4, '{"a": ', 'unexpected end of data')
+
+    rows, rejects = importer.validate([(0, orjson.loads(order_line(0))), (1, malformed)])
+
+    assert [position for position, _ in rows] == [0]
+    assert rejects[0]['position'] == 1
+    assert (rejects[0]['line'], rejects[0]['raw']) == (4, '{"a": ')
+
+
+def test_trim_rejects_drops_records_after_checkpoint(tmp_path):
+    path = str(tmp_path / 'orders.ndjson')
+    with open(f'{path}.rejects.ndjson', 'wb') as rejects:
+        rejects.write(b'{"position": 1}\n{"position": 5}\n{"posit')
+    importer = Importer(None, 'orders', path, chunk_size=10)
+    importer.position = 4
+
+    importer.trim_rejects()
+
+    assert read_rejects(path) == [{'position': 1}]
+
+
+class Crash(Exception):
+    pass
+
+
+def test_resume_after_failed_chunk_lists_rejects_once(db_engine, tmp_path, monkeypatch):
+    path = str(tmp_path / 'orders.ndjson')
+    lines = [order_line(0), order_line(1), b'{"customer_id": ', order_line(3), order_line(4)]
+    with open(path, 'wb') as source:
+        source.write(b'\n'.join(lines) + b'\n')
+
+    # Первый запуск падает после записи отказов второй пачки, до её COMMIT
+    write_rejects = Importer.write_rejects
+
+    def crash(self, rejects):
+        write_rejects(self, rejects)
+        if rejects:
+            raise Crash()
+
+    monkeypatch.setattr(Importer, 'write_rejects', crash)
+    connection = psycopg2.connect(TEST_DSN)
+    try:
+        importer = Importer(connection, 'orders', path, chunk_size=2)
+        importer.load_checkpoint()
+        with pytest.raises(Crash):
+            importer.run()
+    finally:
+        connection.close()
+    assert len(read_rejects(path)) == 1
+
+    monkeypatch.setattr(Importer, 'write_rejects', write_rejects)
+    connection = psycopg2.connect(TEST_DSN)
+    try:
+        importer = Importer(connection, 'orders', path, chunk_size=2)
+        importer.load_checkpoint()
+        assert importer.position == 2
+        importer.run()
+    finally:
+        connection.close()
+
+    rejects = read_rejects(path)
+    assert [(reject['position'], reject['line']) for reject in rejects] == [(2, 3)]
+    assert (importer.imported, importer.rejected) == (4, 1)
+    with db_engine.begin() as connection:
+        assert connection.execute(text('SELECT count(*) FROM orders')).scalar() == 4
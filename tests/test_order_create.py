@@ -0,0 +1,39 @@
+"""Order create and update bind native datetime/UUID values."""
+
+import uuid
+from datetime import datetime
+
+from src.models.order import OrderStatus
+from src.schemas.order import OrderCreate
+from src.services.crud.order import get_order_service
+
+
+def test_create_keeps_native_values(run_db):
+    customer_id = uuid.uuid4()
+    obj_in = OrderCreate(
+        customer_id=customer_id, delivery_date=datetime(2021, 12, 1, 10, 30), desctiption='first',
+        status=OrderStatus.ACCEPT, created_by='test',
+    )
+
+    order = run_db(lambda db: get_order_service().create(db, obj_in=obj_in))
+
+    assert order.customer_id == customer_id
+    assert order.delivery_date == datetime(2021, 12, 1, 10, 30)
+    assert order.status == OrderStatus.ACCEPT
+    assert order.updated_by == 'test'
+
+
+def test_update_keeps_native_values(run_db):
+    obj_in = OrderCreate(customer_id=uuid.uuid4(), delivery_date=datetime(2021, 12, 1), created_by='test')
+    service = get_order_service()
+
+    async def create_and_update(db):
+        order = await service.create(db, obj_in=obj_in)
+        return await service.update(
+            db, db_obj=order, obj_in={'delivery_date': datetime(2021, 12, 2), 'updated_by': 'other'}
+        )
+
+    order = run_db(create_and_update)
+
+    assert order.delivery_date == datetime(2021, 12, 2)
+    assert order.updated_by == 'other'
@@ -0,0 +1,29 @@
+"""Versions of one object stored in several partitions of the history table."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from src.models.order import Order, OrderStatus
+from src.models.partitions import find_duplicate_versions
+
+
+def insert_history(connection, order_id, version, changed):
+    connection.execute(insert(Order.__history_mapper__.local_table).values(
+        id=order_id, customer_id=uuid.uuid4(), delivery_date=datetime(2021, 12, 1), desctiption='first',
+        status=OrderStatus.ACCEPT, created_at=datetime(2021, 1, 1), updated_at=datetime(2021, 1, 1),
+        created_by='test', updated_by='test', version=version, changed=changed,
+    ))
+
+
+def test_check_reports_duplicate_versions(db_engine):
+    order_id = uuid.uuid4()
+    with db_engine.begin() as connection:
+        insert_history(connection, order_id, 1, datetime(2021, 1, 10))
+        insert_history(connection, order_id, 2, datetime(2021, 2, 10))
+        assert find_duplicate_versions(connection) == []
+
+        # Тот же ключ (id, version) в другой секции первичный ключ не запрещает
+        insert_history(connection, order_id, 1, datetime(2021, 3, 10))
+        assert find_duplicate_versions(connection) == [f'orders_history {order_id} v1 x2']
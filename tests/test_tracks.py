@@ -0,0 +1,42 @@
+"""Courier track ring buffer keeps positions ordered by recorded_at."""
+
+import uuid
+
+from src.services.geo.tracks import TrackBuffer
+
+
+def times(tracks, courier_id):
+    return tracks.recent(courier_id)['recorded_at'].tolist()
+
+
+def test_late_position_is_inserted_in_order():
+    courier_id = uuid.uuid4()
+    tracks = TrackBuffer(4)
+    for recorded_at in (10.0, 30.0, 20.0):
+        assert tracks.append(courier_id, recorded_at, 55.7, 37.6)
+
+    assert times(tracks, courier_id) == [10.0, 20.0, 30.0]
+    assert tracks.latest(courier_id)['recorded_at'] == 30.0
+
+    # После вставки буфер продолжает заполняться как кольцо
+    for recorded_at in (40.0, 50.0):
+        tracks.append(courier_id, recorded_at, 55.7, 37.6)
+    assert times(tracks, courier_id) == [20.0, 30.0, 40.0, 50.0]
+
+
+def test_full_buffer_drops_the_oldest_or_the_late_position():
+    courier_id = uuid.uuid4()
+    tracks = TrackBuffer(3)
+    for recorded_at in (10.0, 20.0, 30.0, 40.0):
+        tracks.append(courier_id, recorded_at, 55.7, 37.6)
+
+    # Позиция старше всего буфера не сохраняется
+    assert not tracks.append(courier_id, 5.0, 55.7, 37.6)
+    assert times(tracks, courier_id) == [20.0, 30.0, 40.0]
+
+    # Опоздавшая позиция внутри буфера вытесняет самую старую
+    assert tracks.append(courier_id, 25.0, 55.8, 37.7)
+    assert times(tracks, courier_id) == [25.0, 30.0, 40.0]
+    assert tracks.append(courier_id, 50.0, 55.7, 37.6)
+    assert times(tracks, courier_id) == [30.0, 40.0, 50.0]
+    assert tracks.latest(courier_id)['recorded_at'] == 50.0
@@ -0,0 +1,160 @@
+"""Zone grid index: point lookup, interior/boundary cell classification, large zones."""
+
+import uuid
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from src.schemas.zone import ZoneCreate, ZoneUpdate
+from src.services.geo import zone_index
+from src.services.geo.polygon import Polygon
+from src.services.geo.zone_index import ZoneIndex
+
+# Квадрат 0..1 x 0..1 и треугольник справа от него, сетка с шагом 0.25
+SQUARE = [0.0, 0.0, 1.0, 0.0, 1.0, 1.0, 0.0, 1.0]
+TRIANGLE = [1.0, 0.0, 2.0, 0.0, 1.0, 1.0]
+
+
+@pytest.fixture
+def zones():
+    return uuid.uuid4(), uuid.uuid4()
+
+
+@pytest.fixture
+def index(zones):
+    square_id, triangle_id = zones
+    index = ZoneIndex(0.25)
+    index.build([(square_id, SQUARE), (triangle_id, TRIANGLE)], generation=1)
+    return index
+
+
+def brute_force(polygons, lon, lat):
+    for zone_id, polygon in polygons:
+        if polygon.contains(lon, lat):
+            return zone_id
+    return None
+
+
+def test_interior_cells_resolve_without_polygon_test(index, zones, monkeypatch):
+    square_id, _ = zones
+
+    def fail(*args):
+        raise AssertionError('polygon test in an interior cell')
+
+    monkeypatch.setattr(Polygon, 'contains', fail)
+    monkeypatch.setattr(Polygon, 'contains_many', fail)
+
+    assert index.locate(latitude=0.4, longitude=0.4) == square_id
+    assert index.locate_many(latitudes=np.array([0.3, 0.6]), longitudes=np.array([0.6, 0.3])) == [square_id] * 2
+
+
+def test_boundary_cells_are_not_settled(index, zones):
+    square_id, triangle_id = zones
+
+    # Ячейка (1, 1) целиком внутри квадрата, (3, 3) касается его угла, (5, 1) режет гипотенуза треугольника
+    assert index._settled[(1, 1)] == square_id
+    assert (3, 3) not in index._settled
+    assert (5, 1) not in index._settled
+    assert index.locate(latitude=0.1, longitude=1.1) == triangle_id
+    assert index.locate(latitude=0.9, longitude=1.8) is None
+
+
+def test_locate_matches_brute_force(index, zones):
+    square_id, triangle_id = zones
+    polygons = [(square_id, Polygon(SQUARE)), (triangle_id, Polygon(TRIANGLE))]
+    rng = np.random.default_rng(7)
+    lons, lats = rng.uniform(-0.5, 2.5, 2000), rng.uniform(-0.5, 1.5, 2000)
+
+    expected = [brute_force(polygons, lon, lat) for lon, lat in zip(lons.tolist(), lats.tolist())]
+
+    assert index.locate_many(latitudes=lats, longitudes=lons) == expected
+    assert [index.locate(latitude=lat, longitude=lon) for lon, lat in zip(lons.tolist(), lats.tolist())] == expected
+
+
+def test_upsert_and_remove_reclassify_cells(index, zones):
+    square_id, triangle_id = zones
+
+    # Квадрат сжимается до 0..0.6: ячейка (1, 1) остаётся внутренней, (2, 2) становится граничной,
+    # (3, 3) выпадает из сетки
+    index.upsert(square_id, [0.0, 0.0, 0.6, 0.0, 0.6, 0.6, 0.0, 0.6])
+    assert index._settled[(1, 1)] == square_id
+    assert (2, 2) not in index._settled
+    assert (3, 3) not in index._grid
+    assert index.locate(latitude=0.7, longitude=0.7) is None
+    assert index.locate(latitude=0.55, longitude=0.55) == square_id
+
+    index.remove(square_id)
+    assert (1, 1) not in index._settled
+    assert index.locate(latitude=0.3, longitude=0.3) is None
+    assert index.locate(latitude=0.1, longitude=1.1) == triangle_id
+
+
+def test_overlapping_zones_fall_back_to_polygon_test(index, zones):
+    square_id, _ = zones
+    inner_id = uuid.uuid4()
+
+    index.upsert(inner_id, [0.0, 0.0, 0.5, 0.0, 0.5, 0.5, 0.0, 0.5])
+
+    assert (1, 1) not in index._settled
+    assert index.locate(latitude=0.3, longitude=0.3) in (square_id, inner_id)
+    assert index.locate(latitude=0.8, longitude=0.8) == square_id
+
+
+def test_unclassified_index_keeps_only_the_grid(zones):
+    square_id, _ = zones
+    index = ZoneIndex(0.25, classify=False)
+
+    index.build([(square_id, SQUARE)])
+
+    assert index._settled == {}
+    assert index.locate(latitude=0.4, longitude=0.4) == square_id
+
+
+def test_large_zones_stay_out_of_the_grid(zones, monkeypatch):
+    square_id, triangle_id = zones
+    large_id = uuid.uuid4()
+    monkeypatch.setattr(zone_index, 'MAX_ZONE_CELLS', 8)
+    index = ZoneIndex(0.25)
+    index.build([(square_id, SQUARE), (triangle_id, TRIANGLE)])
+
+    # Квадрат и треугольник занимают по 5 x 5 ячеек и уходят в отдельный список
+    assert len(index._large) == 2
+    assert index._grid == {}
+    assert index.locate(latitude=0.5, longitude=0.5) == square_id
+
+    index.upsert(large_id, [-50.0, -50.0, 50.0, -50.0, 50.0, 50.0, -50.0, 50.0])
+    assert index.locate(latitude=20.0, longitude=20.0) == large_id
+    assert set(index.near((0.1, 0.1, 0.2, 0.2))) == {square_id, large_id}
+
+    index.remove(large_id)
+    assert index.locate(latitude=20.0, longitude=20.0) is None
+
+
+def test_large_zone_unsettles_covered_cells(zones, monkeypatch):
+    square_id, _ = zones
+    large_id = uuid.uuid4()
+    monkeypatch.setattr(zone_index, 'MAX_ZONE_CELLS', 25)
+    index = ZoneIndex(0.25)
+    index.build([(square_id, SQUARE)])
+    assert index._settled[(1, 1)] == square_id
+
+    # Большая зона накрывает квадрат: ячейка больше не принадлежит одной зоне
+    index.upsert(large_id, [-10.0, -10.0, 10.0, -10.0, 10.0, 10.0, -10.0, 10.0])
+    assert (1, 1) not in index._settled
+
+    index.remove(large_id)
+    assert index._settled[(1, 1)] == square_id
+
+
+def test_zone_coordinates_are_range_checked():
+    with pytest.raises(ValidationError):
+        ZoneCreate(name='zone', coordinates=[0.0, 0.0, 181.0, 0.0, 1.0, 1.0], created_by='test')
+    with pytest.raises(ValidationError):
+        ZoneCreate(name='zone', coordinates=[0.0, 0.0, 1.0, 91.0, 1.0, 1.0], created_by='test')
+    with pytest.raises(ValidationError):
+        ZoneUpdate(coordinates=[0.0, 0.0, float('nan'), 0.0, 1.0, 1.0], updated_by='test')
+    with pytest.raises(ValidationError):
+        ZoneUpdate(coordinates=[0.0, 0.0, float('inf'), 0.0, 1.0, 1.0], updated_by='test')
+
+    assert ZoneCreate(name='zone', coordinates=SQUARE, created_by='test').coordinates == SQUARE